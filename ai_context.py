@@ -0,0 +1,239 @@
+"""
+Classification context sent to the AI with every receipt analysis.
+
+The receipt prompt lists the object types and the categories already in use, so
+the AI reuses existing categories rather than inventing near-duplicates. The
+snapshot is built in-process from the categories table and the category fields of
+object metadata, and cached per process under a version number: the
+ai_context_version_seq sequence, bumped after any commit that changes a category
+or an object's categories. Checking the version costs one trivial query, so the
+snapshot is only rebuilt after a change.
+
+Each snapshot has a context_id derived from its content. The MCP client registers
+a snapshot with the MCP server once and then sends only its context_id.
+"""
+import json
+import hashlib
+import logging
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app import db
+from models import AI_CONTEXT_VERSION_SEQUENCE, Category, Object
+
+logger = logging.getLogger(__name__)
+
+# Object types the AI classifies line items into
+OBJECT_TYPES = {
+    'asset': {
+        'name': 'asset',
+        'description': 'Durable goods that retain value over time (computers, furniture, equipment)',
+        'examples': ['laptop', 'desk', 'printer', 'car', 'machinery']
+    },
+    'consumable': {
+        'name': 'consumable',
+        'description': 'Items that are used up or consumed (food, supplies, tickets)',
+        'examples': ['office supplies', 'food', 'event tickets', 'fuel', 'medication']
+    },
+    'component': {
+        'name': 'component',
+        'description': 'Parts that belong to a larger asset (RAM, tires, replacement parts)',
+        'examples': ['computer RAM', 'car tires', 'printer cartridge', 'phone battery']
+    },
+    'service': {
+        'name': 'service',
+        'description': 'Intangible services or subscriptions (software licenses, maintenance)',
+        'examples': ['software subscription', 'maintenance contract', 'consulting', 'utilities']
+    },
+    'software': {
+        'name': 'software',
+        'description': 'Software applications and digital products',
+        'examples': ['Microsoft Office', 'Adobe Creative Suite', 'operating system', 'mobile app']
+    },
+    'person': {
+        'name': 'person',
+        'description': 'People identified in receipts or transactions (customers, staff, contacts)',
+        'examples': ['customer', 'staff member', 'vendor contact', 'service technician']
+    },
+    'pet': {
+        'name': 'pet',
+        'description': 'Pet animals and their information',
+        'examples': ['dog', 'cat', 'bird', 'fish']
+    }
+}
+
+# New categories the AI may consider when none of the existing ones fit
+COMMON_NEW_SUGGESTIONS = [
+    'Entertainment', 'Travel', 'Health', 'Education', 'Sports', 'Hobby',
+    'Automotive', 'Home Improvement', 'Security', 'Communication'
+]
+
+# Distinct (object type, category) pairs found in object metadata, from both the
+# single 'category' field and the 'categories' field (a list or a single string)
+METADATA_CATEGORIES_SQL = db.text("""
+    SELECT DISTINCT o.object_type, c.name
+    FROM objects o
+    CROSS JOIN LATERAL (
+        SELECT o.data->>'category' AS name
+        WHERE jsonb_typeof(o.data->'category') = 'string'
+        UNION ALL
+        SELECT jsonb_array_elements_text(o.data->'categories')
+        WHERE jsonb_typeof(o.data->'categories') = 'array'
+        UNION ALL
+        SELECT o.data->>'categories'
+        WHERE jsonb_typeof(o.data->'categories') = 'string'
+    ) c
+    WHERE c.name <> ''
+""")
+
+_cache_lock = threading.Lock()
+_cached_snapshot = None
+
+
+def metadata_categories():
+    """
+    Categories used in object metadata, aggregated in the database.
+
+    Returns:
+        set: (category name, object type) pairs
+    """
+    return {(name, object_type) for object_type, name in db.session.execute(METADATA_CATEGORIES_SQL)}
+
+
+def current_version():
+    """
+    Current context version, or None when the version sequence does not exist yet.
+    Must be called inside an application context.
+    """
+    exists, last_value = db.session.execute(
+        db.text("SELECT to_regclass(:name) IS NOT NULL, pg_sequence_last_value(to_regclass(:name))"),
+        {'name': AI_CONTEXT_VERSION_SEQUENCE.name}
+    ).one()
+    if not exists:
+        return None
+    return last_value or 0
+
+
+def build_context():
+    """
+    Build the classification context from the database.
+
+    Returns:
+        dict: {'existing_object_types': {...}, 'existing_categories': {object type: [names]}}
+    """
+    categories_by_type = {}
+    known = set()
+    for category in Category.query.order_by(Category.object_type, Category.name):
+        categories_by_type.setdefault(category.object_type, []).append(category.name)
+        known.add((category.name, category.object_type))
+
+    # Categories only ever recorded on objects (for backward compatibility)
+    for name, object_type in sorted(metadata_categories() - known):
+        categories_by_type.setdefault(object_type, []).append(name)
+
+    categories_by_type['common_new_suggestions'] = list(COMMON_NEW_SUGGESTIONS)
+    return {
+        'existing_object_types': OBJECT_TYPES,
+        'existing_categories': categories_by_type
+    }
+
+
+def get_ai_context():
+    """
+    Current classification context, rebuilt only when its version has changed.
+    Must be called inside an application context.
+
+    Returns:
+        dict: {'version': int or None, 'context_id': str, 'context': dict}
+    """
+    global _cached_snapshot
+
+    version = current_version()
+    snapshot = _cached_snapshot
+    if snapshot is not None and version is not None and snapshot['version'] == version:
+        return snapshot
+
+    context = build_context()
+    digest = hashlib.sha256(json.dumps(context, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    snapshot = {
+        'version': version,
+        'context_id': f"homebase-{digest}",
+        'context': context
+    }
+    if version is None:
+        logger.warning("AI context version sequence is missing; run update_db_ai_context.py")
+    else:
+        with _cache_lock:
+            _cached_snapshot = snapshot
+        logger.debug(f"Rebuilt AI context version {version} ({snapshot['context_id']})")
+    return snapshot
+
+
+def _object_categories(data):
+    """Category names recorded in an object's metadata"""
+    if not isinstance(data, dict):
+        return set()
+    names = set()
+    if isinstance(data.get('category'), str):
+        names.add(data['category'])
+    categories = data.get('categories')
+    if isinstance(categories, list):
+        names.update(str(name) for name in categories if name)
+    elif isinstance(categories, str):
+        names.add(categories)
+    names.discard('')
+    return names
+
+
+def _changes_context(session):
+    """True when the flush about to be committed changes a category or an object's categories"""
+    for instance in session.new:
+        if isinstance(instance, Category):
+            return True
+        if isinstance(instance, Object) and _object_categories(instance.data):
+            return True
+    for instance in session.deleted:
+        if isinstance(instance, Category):
+            return True
+        if isinstance(instance, Object) and _object_categories(instance.data):
+            return True
+    for instance in session.dirty:
+        if isinstance(instance, Category):
+            if session.is_modified(instance):
+                return True
+        elif isinstance(instance, Object):
+            if get_history(instance, 'object_type').has_changes():
+                return True
+            history = get_history(instance, 'data')
+            if history.has_changes():
+                before = set().union(*(_object_categories(data) for data in history.deleted or [None]))
+                after = set().union(*(_object_categories(data) for data in history.added or [None]))
+                if before != after:
+                    return True
+    return False
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_context_changes(session, flush_context, instances):
+    if not session.info.get('ai_context_changed') and _changes_context(session):
+        session.info['ai_context_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_context_version(session):
+    if not session.info.pop('ai_context_changed', False):
+        return
+    # After the commit, so a reader that sees the new version also sees the change
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(db.text("SELECT nextval(:name)"), {'name': AI_CONTEXT_VERSION_SEQUENCE.name})
+    except Exception as e:
+        logger.warning(f"Could not bump AI context version: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_context_changes(session):
+    session.info.pop('ai_context_changed', None)
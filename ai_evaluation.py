@@ -0,0 +1,314 @@
+"""
+Executor for the AI re-evaluation queue.
+
+AIEvaluationQueue.schedule_evaluations() spreads objects due for re-evaluation over
+the coming days. This module drains the entries that are due: it sends each object
+to the MCP server's categorize_object with bounded concurrency, stops once the daily
+request or token budget is spent, and applies the results through
+Object.record_evaluation. It runs from the 'ai_evaluation' task queue handler, so the
+queue's retry policy and task results cover it like any other task.
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app import db
+from models import Object, AIEvaluationQueue
+from retry_policy import RetryPolicy
+
+logger = logging.getLogger('queue_processor')
+
+# Requests in flight against the MCP server at once
+DEFAULT_CONCURRENCY = int(os.environ.get('AI_EVALUATION_CONCURRENCY', 3))
+
+# Daily budget shared by every run of the executor
+DAILY_REQUEST_BUDGET = int(os.environ.get('AI_EVALUATION_DAILY_REQUESTS', AIEvaluationQueue.DAILY_LIMIT))
+DAILY_TOKEN_BUDGET = int(os.environ.get('AI_EVALUATION_DAILY_TOKENS', 100000))
+
+DEFAULT_PROVIDER = os.environ.get('AI_EVALUATION_PROVIDER', 'claude')
+
+# Re-evaluations are bulk work: interactive requests go first at the MCP server's rate limiter
+REQUEST_PRIORITY = 8
+
+# Tokens reserved for a request until the provider reports what it used
+ESTIMATED_TOKENS_PER_REQUEST = 1500
+
+# Days until an object is re-evaluated after a successful evaluation, and after
+# its entry failed every attempt
+REEVALUATION_DAYS = 90
+FAILED_REEVALUATION_DAYS = 7
+
+# Seconds after which an entry still marked processing is taken to be abandoned by
+# an earlier run; matches the 'ai_evaluation' task handler's timeout
+STALE_PROCESSING_SECONDS = 1800
+
+# Retries of a failed entry are rescheduled on the queue itself
+ENTRY_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=3600, backoff_factor=4.0, max_delay=86400)
+
+
+class DailyBudget:
+    """Requests and tokens left for today; requests reserve tokens until they finish."""
+
+    def __init__(self, max_requests, max_tokens, requests_used=0, tokens_used=0):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.requests_used = requests_used
+        self.tokens_used = tokens_used
+        self.tokens_reserved = 0
+
+    def reserve(self, tokens=ESTIMATED_TOKENS_PER_REQUEST):
+        """Reserve one request; False when today's budget cannot cover it"""
+        if self.requests_used >= self.max_requests:
+            return False
+        if self.tokens_used + self.tokens_reserved + tokens > self.max_tokens:
+            return False
+        self.requests_used += 1
+        self.tokens_reserved += tokens
+        return True
+
+    def settle(self, tokens_used, reserved=ESTIMATED_TOKENS_PER_REQUEST):
+        """Replace a request's reservation with the tokens it actually used"""
+        self.tokens_reserved -= reserved
+        self.tokens_used += tokens_used
+
+    @property
+    def exhausted(self):
+        """True when not even one more request fits in today's budget"""
+        return not (self.requests_used < self.max_requests and
+                    self.tokens_used + self.tokens_reserved + ESTIMATED_TOKENS_PER_REQUEST <= self.max_tokens)
+
+
+def usage_today(now=None):
+    """
+    Requests and tokens spent on AI evaluations today.
+
+    Each entry is counted for its most recent attempt, so an entry retried on the
+    same day is counted once.
+
+    Returns:
+        tuple: (requests, tokens)
+    """
+    day_start = datetime.combine((now or datetime.utcnow()).date(), datetime.min.time())
+    requests, tokens = db.session.query(
+        db.func.count(AIEvaluationQueue.id),
+        db.func.coalesce(db.func.sum(AIEvaluationQueue.tokens_used), 0)
+    ).filter(AIEvaluationQueue.last_attempt >= day_start).one()
+    return requests, int(tokens)
+
+
+def _object_payload(obj):
+    """What the categorization prompt gets to see of an object"""
+    payload = dict(obj.data or {})
+    payload.update({
+        'id': obj.id,
+        'object_type': obj.object_type,
+        'last_evaluated_at': obj.last_evaluated_at.isoformat() if obj.last_evaluated_at else None
+    })
+    return payload
+
+
+def _evaluation_result(response):
+    """
+    Extract the analysis and confidence from an MCP /ai/process response.
+
+    Returns:
+        tuple: (evaluation result dict, confidence or None)
+    """
+    content = response.get('content') or {}
+    if isinstance(content.get('response'), str):
+        try:
+            content = json.loads(content['response'])
+        except ValueError:
+            raise ValueError("Categorization response is not valid JSON")
+    if not isinstance(content, dict):
+        raise ValueError("Categorization response is not an object")
+
+    confidence = response.get('confidence')
+    if confidence is None:
+        confidence = content.get('confidence')
+    return content, float(confidence) if confidence is not None else None
+
+
+def _apply_success(entry, obj, response, tokens_used):
+    """Record a successful evaluation on the object and complete its entry"""
+    evaluation_result, confidence = _evaluation_result(response)
+
+    # Reschedule first: schedule_evaluation clears the manual review flag that
+    # record_evaluation may set for a low-confidence result
+    obj.schedule_evaluation(days_from_now=REEVALUATION_DAYS)
+    record = obj.record_evaluation(evaluation_result, confidence)
+
+    entry.status = 'completed'
+    entry.completed_at = datetime.utcnow()
+    entry.result = record
+    entry.tokens_used = tokens_used
+    entry.error_message = None
+
+
+def _apply_failure(entry, obj, error, tokens_used):
+    """
+    Reschedule a failed entry with backoff, or fail it once its attempts are used up.
+
+    Returns:
+        bool: True when the entry will be retried
+    """
+    entry.tokens_used = tokens_used
+    entry.error_message = f"Attempt {entry.attempts} failed: {error}"
+
+    if not ENTRY_RETRY_POLICY.exhausted(entry.attempts):
+        entry.status = 'pending'
+        entry.scheduled_date = ENTRY_RETRY_POLICY.next_execute_at(entry.attempts)
+        return True
+
+    entry.status = 'failed'
+    if obj is not None:
+        # Let the scheduler pick the object up again later instead of tomorrow
+        obj.ai_evaluation_pending = False
+        obj.next_evaluation_date = datetime.utcnow() + timedelta(days=FAILED_REEVALUATION_DAYS)
+    return False
+
+
+async def _drain(entries, budget, concurrency, provider, summary):
+    """Evaluate entries with at most concurrency requests in flight, within budget"""
+    from mcp_client import MCPClient
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with MCPClient() as client:
+        async def evaluate(entry, obj):
+            try:
+                response = await client.categorize_object(_object_payload(obj), provider=provider,
+                                                        priority=REQUEST_PRIORITY)
+                return entry, obj, response, None
+            except Exception as e:
+                return entry, obj, None, e
+            finally:
+                semaphore.release()
+
+        def apply(outcome):
+            entry, obj, response, error = outcome
+            tokens_used = ESTIMATED_TOKENS_PER_REQUEST
+            if response is not None and response.get('tokens_used') is not None:
+                tokens_used = int(response['tokens_used'])
+            budget.settle(tokens_used)
+
+            if error is None:
+                try:
+                    _apply_success(entry, obj, response, tokens_used)
+                    summary['succeeded'] += 1
+                except Exception as e:
+                    error = e
+            if error is not None:
+                db.session.rollback()
+                logger.warning(f"AI evaluation of object {entry.object_id} failed: {str(error)}")
+                if _apply_failure(entry, obj, str(error), tokens_used):
+                    summary['retried'] += 1
+                else:
+                    summary['failed'] += 1
+
+            summary['tokens_used'] += tokens_used
+            db.session.commit()
+
+        in_flight = set()
+        for entry in entries:
+            obj = db.session.get(Object, entry.object_id)
+            if obj is None:
+                entry.status = 'failed'
+                entry.error_message = f"Object with ID {entry.object_id} not found"
+                db.session.commit()
+                summary['failed'] += 1
+                continue
+
+            await semaphore.acquire()
+
+            # Apply whatever finished while we waited, so the budget check sees real usage
+            for finished in [task for task in in_flight if task.done()]:
+                in_flight.discard(finished)
+                apply(finished.result())
+
+            if not budget.reserve():
+                semaphore.release()
+                summary['budget_exhausted'] = True
+                break
+
+            entry.status = 'processing'
+            entry.attempts = (entry.attempts or 0) + 1
+            entry.last_attempt = datetime.utcnow()
+            db.session.commit()
+            summary['requests'] += 1
+
+            in_flight.add(asyncio.ensure_future(evaluate(entry, obj)))
+
+        for outcome in await asyncio.gather(*in_flight):
+            apply(outcome)
+
+
+def run_evaluations(limit=None, concurrency=DEFAULT_CONCURRENCY, provider=DEFAULT_PROVIDER,
+                    max_requests=DAILY_REQUEST_BUDGET, max_tokens=DAILY_TOKEN_BUDGET,
+                    stale_after=STALE_PROCESSING_SECONDS):
+    """
+    Evaluate the AI evaluation queue entries that are due, within today's budget.
+
+    Entries scheduled for today or earlier are taken oldest first. Each is sent to
+    the MCP server's categorize_object; a result is recorded on the object with
+    Object.record_evaluation and the object is rescheduled for re-evaluation. Failed
+    entries are retried with ENTRY_RETRY_POLICY. Must be called inside an
+    application context.
+
+    Args:
+        limit: Maximum entries to take, defaults to the daily request budget
+        concurrency: Requests in flight at once
+        provider: AI provider passed to the MCP server
+        max_requests: Requests allowed per day
+        max_tokens: Tokens allowed per day
+        stale_after: Seconds after which an entry left processing is evaluated again
+
+    Returns:
+        dict: Counts of requests, successes, retries and failures, tokens used and
+              whether the budget ran out
+    """
+    # Entries an earlier run marked processing longer ago than its timeout were
+    # abandoned with it; younger ones may still belong to a run that is finishing
+    AIEvaluationQueue.query.filter(
+        AIEvaluationQueue.status == 'processing',
+        db.or_(AIEvaluationQueue.last_attempt.is_(None),
+               AIEvaluationQueue.last_attempt < datetime.utcnow() - timedelta(seconds=stale_after))
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    requests_used, tokens_used = usage_today()
+    budget = DailyBudget(max_requests, max_tokens, requests_used, tokens_used)
+
+    summary = {
+        'requests': 0,
+        'succeeded': 0,
+        'retried': 0,
+        'failed': 0,
+        'tokens_used': 0,
+        'budget_exhausted': budget.exhausted,
+        'requests_used_today': requests_used,
+        'tokens_used_today': tokens_used
+    }
+    if budget.exhausted:
+        logger.info("AI evaluation budget for today is already spent")
+        return summary
+
+    entries = AIEvaluationQueue.get_daily_queue(
+        limit=limit or max(max_requests - requests_used, 0),
+        include_overdue=True
+    )
+    if entries:
+        logger.info(f"Evaluating up to {len(entries)} objects ({concurrency} at a time, "
+                    f"{max_requests - requests_used} requests and {max_tokens - tokens_used} tokens left today)")
+        asyncio.run(_drain(entries, budget, max(concurrency, 1), provider, summary))
+
+    summary['budget_exhausted'] = budget.exhausted
+    summary['requests_used_today'] = budget.requests_used
+    summary['tokens_used_today'] = budget.tokens_used
+    summary['remaining'] = AIEvaluationQueue.query.filter(
+        AIEvaluationQueue.status == 'pending',
+        AIEvaluationQueue.scheduled_date <= datetime.utcnow()
+    ).count()
+    return summary
@@ -0,0 +1,424 @@
+"""
+Streaming bulk export of objects, invoices and line items.
+
+Rows are read through server-side cursors (yield_per) and encoded incrementally as
+CSV, NDJSON or Parquet, so memory stays flat regardless of export size.
+Used by the /api/export endpoints and runnable as a CLI:
+
+    python bulk_export.py objects --format csv --output objects.csv --object-type asset
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import or_
+
+from app import app, db
+from models import Object, Invoice, InvoiceLineItem, Vendor
+
+# Optional dependency for columnar export
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rows fetched per server-side cursor round trip
+YIELD_PER = 1000
+
+# Rows buffered before a chunk is emitted (CSV/NDJSON) or a row group is written (Parquet)
+CHUNK_ROWS = 1000
+PARQUET_ROW_GROUP_ROWS = 10000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Column definitions: (name, kind). Kinds map to Parquet types; JSON columns are serialized as strings.
+DATASET_COLUMNS = {
+    'objects': [
+        ('id', 'int'), ('object_type', 'str'), ('name', 'str'), ('description', 'str'),
+        ('category', 'str'), ('quantity', 'float'), ('acquisition_date', 'str'),
+        ('acquisition_cost', 'float'), ('estimated_value', 'float'), ('manufacturer', 'str'),
+        ('model', 'str'), ('serial_number', 'str'), ('vendor', 'str'), ('invoice_id', 'int'),
+        ('parent_id', 'int'), ('created_at', 'datetime'), ('updated_at', 'datetime'), ('data', 'json'),
+    ],
+    'invoices': [
+        ('id', 'int'), ('invoice_number', 'str'), ('vendor_id', 'int'), ('vendor_name', 'str'),
+        ('date', 'str'), ('due_date', 'str'), ('total_amount', 'float'), ('subtotal', 'float'),
+        ('tax_amount', 'float'), ('is_paid', 'bool'), ('payment_method', 'str'),
+        ('created_at', 'datetime'), ('updated_at', 'datetime'),
+    ],
+    'line_items': [
+        ('id', 'int'), ('invoice_id', 'int'), ('invoice_number', 'str'), ('invoice_date', 'str'),
+        ('vendor_name', 'str'), ('description', 'str'), ('quantity', 'float'), ('unit_price', 'float'),
+        ('total_price', 'float'), ('category', 'str'), ('object_type', 'str'),
+        ('created_at', 'datetime'), ('data', 'json'),
+    ],
+}
+
+
+class ExportError(ValueError):
+    """Raised for invalid export requests (unknown dataset/format, missing dependency)."""
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _vendor_filter(column_name_expr, vendor_id_column, vendor):
+    """Match a vendor by numeric ID or by case-insensitive name fragment."""
+    if str(vendor).isdigit():
+        return vendor_id_column == int(vendor)
+    return column_name_expr.ilike(f'%{vendor}%')
+
+
+def _objects_query(filters):
+    query = db.session.query(
+        Object.id, Object.object_type, Object.invoice_id, Object.parent_id,
+        Object.created_at, Object.updated_at, Object.data
+    )
+
+    if filters.get('object_type'):
+        query = query.filter(Object.object_type == filters['object_type'])
+    if filters.get('start_date'):
+        query = query.filter(Object.data['acquisition_date'].astext >= filters['start_date'])
+    if filters.get('end_date'):
+        query = query.filter(Object.data['acquisition_date'].astext <= filters['end_date'])
+    if filters.get('vendor'):
+        query = query.outerjoin(Invoice, Invoice.id == Object.invoice_id).filter(
+            or_(
+                _vendor_filter(Object.data['vendor'].astext, Invoice.vendor_id, filters['vendor']),
+                _vendor_filter(Invoice.data['vendor_name'].astext, Invoice.vendor_id, filters['vendor'])
+            )
+        )
+
+    return query.order_by(Object.id)
+
+
+def _object_row(row):
+    data = row.data or {}
+    return {
+        'id': row.id,
+        'object_type': row.object_type,
+        'name': data.get('name'),
+        'description': data.get('description'),
+        'category': data.get('category'),
+        'quantity': _to_float(data.get('quantity')),
+        'acquisition_date': data.get('acquisition_date'),
+        'acquisition_cost': _to_float(data.get('acquisition_cost')),
+        'estimated_value': _to_float(data.get('estimated_value')),
+        'manufacturer': data.get('manufacturer'),
+        'model': data.get('model') or data.get('model_number'),
+        'serial_number': data.get('serial_number'),
+        'vendor': data.get('vendor'),
+        'invoice_id': row.invoice_id,
+        'parent_id': row.parent_id,
+        'created_at': row.created_at,
+        'updated_at': row.updated_at,
+        'data': data,
+    }
+
+
+def _invoices_query(filters):
+    query = db.session.query(
+        Invoice.id, Invoice.invoice_number, Invoice.vendor_id, Invoice.is_paid,
+        Invoice.created_at, Invoice.updated_at, Invoice.data, Vendor.name.label('vendor_record_name')
+    ).outerjoin(Vendor, Vendor.id == Invoice.vendor_id)
+
+    if filters.get('start_date'):
+        query = query.filter(Invoice.data['date'].astext >= filters['start_date'])
+    if filters.get('end_date'):
+        query = query.filter(Invoice.data['date'].astext <= filters['end_date'])
+    if filters.get('vendor'):
+        query = query.filter(
+            or_(
+                _vendor_filter(Vendor.name, Invoice.vendor_id, filters['vendor']),
+                _vendor_filter(Invoice.data['vendor_name'].astext, Invoice.vendor_id, filters['vendor'])
+            )
+        )
+
+    return query.order_by(Invoice.id)
+
+
+def _invoice_row(row):
+    data = row.data or {}
+    return {
+        'id': row.id,
+        'invoice_number': row.invoice_number,
+        'vendor_id': row.vendor_id,
+        'vendor_name': row.vendor_record_name or data.get('vendor_name') or data.get('vendor'),
+        'date': data.get('date'),
+        'due_date': data.get('due_date'),
+        'total_amount': _to_float(data.get('total_amount', data.get('total'))),
+        'subtotal': _to_float(data.get('subtotal')),
+        'tax_amount': _to_float(data.get('tax_amount')),
+        'is_paid': row.is_paid,
+        'payment_method': data.get('payment_method'),
+        'created_at': row.created_at,
+        'updated_at': row.updated_at,
+    }
+
+
+def _line_items_query(filters):
+    query = db.session.query(
+        InvoiceLineItem.id, InvoiceLineItem.invoice_id, InvoiceLineItem.created_at, InvoiceLineItem.data,
+        Invoice.invoice_number, Invoice.data['date'].astext.label('invoice_date'),
+        Vendor.name.label('vendor_record_name'), Invoice.data['vendor_name'].astext.label('invoice_vendor_name')
+    ).join(Invoice, Invoice.id == InvoiceLineItem.invoice_id).outerjoin(Vendor, Vendor.id == Invoice.vendor_id)
+
+    if filters.get('object_type'):
+        query = query.filter(InvoiceLineItem.data['object_type'].astext == filters['object_type'])
+    if filters.get('start_date'):
+        query = query.filter(Invoice.data['date'].astext >= filters['start_date'])
+    if filters.get('end_date'):
+        query = query.filter(Invoice.data['date'].astext <= filters['end_date'])
+    if filters.get('vendor'):
+        query = query.filter(
+            or_(
+                _vendor_filter(Vendor.name, Invoice.vendor_id, filters['vendor']),
+                _vendor_filter(Invoice.data['vendor_name'].astext, Invoice.vendor_id, filters['vendor'])
+            )
+        )
+
+    return query.order_by(InvoiceLineItem.id)
+
+
+def _line_item_row(row):
+    data = row.data or {}
+    return {
+        'id': row.id,
+        'invoice_id': row.invoice_id,
+        'invoice_number': row.invoice_number,
+        'invoice_date': row.invoice_date,
+        'vendor_name': row.vendor_record_name or row.invoice_vendor_name,
+        'description': data.get('description'),
+        'quantity': _to_float(data.get('quantity')),
+        'unit_price': _to_float(data.get('unit_price')),
+        'total_price': _to_float(data.get('total_price')),
+        'category': data.get('category'),
+        'object_type': data.get('object_type') or data.get('suggested_object_type'),
+        'created_at': row.created_at,
+        'data': data,
+    }
+
+
+DATASETS = {
+    'objects': (_objects_query, _object_row),
+    'invoices': (_invoices_query, _invoice_row),
+    'line_items': (_line_items_query, _line_item_row),
+}
+
+
+def iter_rows(dataset, filters=None):
+    """
+    Yield export rows as dicts, streaming from a server-side cursor.
+
+    Args:
+        dataset: 'objects', 'invoices' or 'line_items'
+        filters: Optional dict with object_type, start_date, end_date (YYYY-MM-DD) and vendor (ID or name)
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset '{dataset}'. Choose from: {', '.join(DATASETS)}")
+
+    build_query, to_row = DATASETS[dataset]
+    for row in build_query(filters or {}).yield_per(YIELD_PER):
+        yield to_row(row)
+
+
+def _cell(value, kind):
+    """Encode a value for CSV/NDJSON output."""
+    if value is None:
+        return None
+    if kind == 'datetime':
+        return value.isoformat()
+    return value
+
+
+def _stream_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow([
+            json.dumps(row[name], default=str) if kind == 'json' and row[name] is not None
+            else _cell(row[name], kind)
+            for name, kind in columns
+        ])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _stream_ndjson(rows, columns):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps({name: _cell(row[name], kind) for name, kind in columns}, default=str))
+        if len(chunk) >= CHUNK_ROWS:
+            yield ('\n'.join(chunk) + '\n').encode('utf-8')
+            chunk = []
+
+    if chunk:
+        yield ('\n'.join(chunk) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(columns):
+    types = {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'str': pa.string(),
+        'bool': pa.bool_(),
+        'datetime': pa.timestamp('us'),
+        'json': pa.string(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _stream_parquet(rows, columns):
+    schema = _parquet_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    batch = {name: [] for name, _ in columns}
+    batch_rows = 0
+
+    def flush():
+        writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+        for values in batch.values():
+            values.clear()
+
+    try:
+        for row in rows:
+            for name, kind in columns:
+                value = row[name]
+                if kind == 'json' and value is not None:
+                    value = json.dumps(value, default=str)
+                batch[name].append(value)
+            batch_rows += 1
+
+            if batch_rows >= PARQUET_ROW_GROUP_ROWS:
+                flush()
+                batch_rows = 0
+                data = sink.drain()
+                if data:
+                    yield data
+
+        if batch_rows:
+            flush()
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+def stream_export(dataset, export_format='csv', filters=None):
+    """
+    Stream an export as encoded byte chunks.
+
+    Args:
+        dataset: 'objects', 'invoices' or 'line_items'
+        export_format: 'csv', 'ndjson' or 'parquet'
+        filters: Optional filters, see iter_rows()
+
+    Returns:
+        generator: Byte chunks of the encoded export
+    """
+    if dataset not in DATASET_COLUMNS:
+        raise ExportError(f"Unknown dataset '{dataset}'. Choose from: {', '.join(DATASET_COLUMNS)}")
+    if export_format not in FORMATS:
+        raise ExportError(f"Unknown format '{export_format}'. Choose from: {', '.join(FORMATS)}")
+    if export_format == 'parquet' and pq is None:
+        raise ExportError("Parquet export requires the 'pyarrow' package (the 'parquet' extra)")
+
+    columns = DATASET_COLUMNS[dataset]
+    rows = iter_rows(dataset, filters)
+
+    if export_format == 'csv':
+        return _stream_csv(rows, columns)
+    if export_format == 'ndjson':
+        return _stream_ndjson(rows, columns)
+    return _stream_parquet(rows, columns)
+
+
+def export_filename(dataset, export_format):
+    """Default download filename for an export"""
+    extension = 'parquet' if export_format == 'parquet' else export_format
+    return f"homebase_{dataset}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export Homebase data as CSV, NDJSON or Parquet')
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--format', dest='export_format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', '-o', help='Output file (defaults to stdout)')
+    parser.add_argument('--object-type', help='Filter by object type (objects, line_items)')
+    parser.add_argument('--start-date', help='Earliest date, YYYY-MM-DD')
+    parser.add_argument('--end-date', help='Latest date, YYYY-MM-DD')
+    parser.add_argument('--vendor', help='Vendor ID or name fragment')
+    args = parser.parse_args()
+
+    filters = {
+        'object_type': args.object_type,
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+        'vendor': args.vendor,
+    }
+
+    with app.app_context():
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            total_bytes = 0
+            for chunk in stream_export(args.dataset, args.export_format, filters):
+                output.write(chunk)
+                total_bytes += len(chunk)
+        finally:
+            if args.output:
+                output.close()
+
+    if args.output:
+        print(f"Exported {args.dataset} to {args.output} ({total_bytes} bytes)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -187,7 +187,7 @@ def verify_database_setup():
                 'task_queue', 'reminders', 'organizations', 'organization_relationships',
                 'organization_contacts', 'users', 'user_person_mapping', 'user_aliases',
                 'notes', 'calendar_events', 'collection_objects', 'collections',
-                'receipt_creation_tracking'
+                'receipt_creation_tracking', 'asset_book_values'
             }
             
             missing_tables = expected_tables - existing_tables
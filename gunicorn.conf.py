@@ -0,0 +1,19 @@
+"""
+Gunicorn hooks for Homebase.
+
+Gunicorn loads this file from the working directory; bind address, workers and
+timeouts stay on the command line (see Dockerfile and docker-compose.yml). Each
+worker runs its own MCP client runtime (see mcp_client.MCPRuntime): it is started
+once the worker has loaded the app, so its loop thread is never created before a
+fork, and closed cleanly when the worker exits.
+"""
+
+
+def post_worker_init(worker):
+    from mcp_client import start_mcp_client
+    start_mcp_client()
+
+
+def worker_exit(server, worker):
+    from mcp_client import shutdown_mcp_client
+    shutdown_mcp_client()
@@ -0,0 +1,291 @@
+"""
+Periodic job scheduler.
+
+Recurring maintenance is declared in code with the @periodic_job decorator:
+
+    @periodic_job('refresh_statistics', every=timedelta(days=1), jitter=600)
+    def refresh_statistics():
+        ...
+        return {'tables': 12}
+
+Every queue processor runs a JobScheduler, but only the one holding the scheduler's
+Postgres advisory lock (the leader) runs jobs. If the leader dies its connection
+closes, the lock is released and another replica takes over on its next tick. The
+scheduled_jobs table records when each job runs next and how its last run went.
+Each run is also claimed by moving next_run_at with a conditional UPDATE, so a job
+runs once per slot even if two schedulers ever believe they lead.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import ScheduledJob
+
+logger = logging.getLogger('queue_processor')
+
+# What to do when a job missed one or more runs (e.g. every replica was down)
+CATCH_UP_ONCE = 'once'  # Run once now, then continue on the normal interval
+CATCH_UP_ALL = 'all'    # Run once for every missed interval, one run per tick
+CATCH_UP_SKIP = 'skip'  # Skip missed runs and wait for the next interval
+CATCH_UP_POLICIES = (CATCH_UP_ONCE, CATCH_UP_ALL, CATCH_UP_SKIP)
+
+# Seconds between scheduler checks
+TICK_SECONDS = 30
+
+# Advisory lock held by the leading scheduler for as long as it leads
+LEADER_LOCK_KEY = 'job_scheduler'
+
+# Declared jobs by name
+PERIODIC_JOBS = {}
+
+
+class PeriodicJob:
+    """A declared periodic job and its schedule."""
+
+    def __init__(self, name, func, every, jitter=0, catch_up=CATCH_UP_ONCE):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up must be one of {CATCH_UP_POLICIES}")
+        self.name = name
+        self.func = func
+        self.interval = every if isinstance(every, timedelta) else timedelta(seconds=every)
+        self.jitter = jitter          # Up to this many seconds added to each run time
+        self.catch_up = catch_up
+
+    def __repr__(self):
+        return f"<PeriodicJob {self.name} every {self.interval} ({self.catch_up})>"
+
+    def _jitter(self):
+        return timedelta(seconds=random.uniform(0, self.jitter)) if self.jitter else timedelta(0)
+
+    def first_run(self, now):
+        """Run time of a job the scheduler has not seen before"""
+        return now + self._jitter()
+
+    def plan(self, scheduled_at, now):
+        """
+        Decide what to do with a run that was due at scheduled_at.
+
+        Returns:
+            tuple: (run now?, next run time)
+        """
+        missed = scheduled_at + self.interval <= now
+
+        if self.catch_up == CATCH_UP_ALL and missed:
+            # Work through the backlog one interval at a time
+            return True, scheduled_at + self.interval
+        if self.catch_up == CATCH_UP_SKIP and missed:
+            return False, now + self.interval + self._jitter()
+        return True, now + self.interval + self._jitter()
+
+
+def periodic_job(name, every, jitter=0, catch_up=CATCH_UP_ONCE):
+    """
+    Decorator declaring a function as a periodic job.
+
+    Args:
+        name: Unique job name (the scheduled_jobs key)
+        every: Interval between runs, a timedelta or seconds
+        jitter: Random delay of up to this many seconds added to every run
+        catch_up: CATCH_UP_ONCE, CATCH_UP_ALL or CATCH_UP_SKIP for missed runs
+    """
+    def decorator(func):
+        if name in PERIODIC_JOBS:
+            logger.warning(f"Replacing periodic job '{name}'")
+        PERIODIC_JOBS[name] = PeriodicJob(name, func, every, jitter=jitter, catch_up=catch_up)
+        return func
+    return decorator
+
+
+def sync_jobs(now=None):
+    """
+    Create rows for newly declared jobs and update intervals of existing ones.
+    Must be called inside an application context.
+    """
+    now = now or datetime.utcnow()
+    rows = {job.name: job for job in ScheduledJob.query.filter(ScheduledJob.name.in_(list(PERIODIC_JOBS)))}
+    for name, job in PERIODIC_JOBS.items():
+        interval_seconds = int(job.interval.total_seconds())
+        row = rows.get(name)
+        if row is None:
+            db.session.add(ScheduledJob(name=name, interval_seconds=interval_seconds,
+                                        next_run_at=job.first_run(now)))
+            logger.info(f"Scheduled new periodic job '{name}' every {job.interval}")
+        elif row.interval_seconds != interval_seconds:
+            row.interval_seconds = interval_seconds
+            # A shorter interval takes effect now rather than after the old one
+            row.next_run_at = min(row.next_run_at, now + job.interval)
+    db.session.commit()
+
+
+def run_job(job, row, now=None):
+    """
+    Claim a due job row, run the job and record the outcome.
+
+    Returns:
+        str: 'success', 'failed' or 'skipped', or None when another scheduler claimed it
+    """
+    now = now or datetime.utcnow()
+    scheduled_at = row.next_run_at
+    run_now, next_run_at = job.plan(scheduled_at, now)
+
+    claimed = db.session.execute(
+        db.update(ScheduledJob).where(
+            ScheduledJob.name == job.name,
+            ScheduledJob.next_run_at == scheduled_at
+        ).values(
+            next_run_at=next_run_at,
+            last_status='running' if run_now else 'skipped',
+            last_started_at=now if run_now else ScheduledJob.last_started_at
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    if not claimed:
+        return None
+    if not run_now:
+        logger.info(f"Skipped missed run of '{job.name}' due {scheduled_at.isoformat()}; "
+                    f"next run {next_run_at.isoformat()}")
+        return 'skipped'
+
+    logger.info(f"Running periodic job '{job.name}' (due {scheduled_at.isoformat()})")
+    started = time.monotonic()
+    try:
+        result = job.func()
+        status, error = 'success', None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Periodic job '{job.name}' failed: {str(e)}")
+        result, status, error = None, 'failed', str(e)
+    duration = time.monotonic() - started
+
+    values = {
+        'last_status': status,
+        'last_error': error,
+        'last_finished_at': datetime.utcnow(),
+        'last_duration': duration,
+        'run_count': ScheduledJob.run_count + 1,
+        'failure_count': ScheduledJob.failure_count + (1 if error else 0)
+    }
+    if status == 'success':
+        values['last_result'] = result if isinstance(result, dict) else {'result': result}
+    db.session.execute(
+        db.update(ScheduledJob).where(ScheduledJob.name == job.name)
+        .values(**values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    logger.info(f"Periodic job '{job.name}' {status} in {duration:.1f}s; next run {next_run_at.isoformat()}")
+    return status
+
+
+def run_due_jobs(now=None):
+    """
+    Run every enabled declared job whose next run time has passed.
+    Must be called inside an application context, by the leader only.
+
+    Returns:
+        int: Number of jobs run or skipped
+    """
+    now = now or datetime.utcnow()
+    due = ScheduledJob.query.filter(
+        ScheduledJob.enabled == True,
+        ScheduledJob.next_run_at <= now,
+        ScheduledJob.name.in_(list(PERIODIC_JOBS))
+    ).order_by(ScheduledJob.next_run_at).all()
+
+    handled = 0
+    for row in due:
+        if run_job(PERIODIC_JOBS[row.name], row) is not None:
+            handled += 1
+    return handled
+
+
+class JobScheduler:
+    """Background thread that competes for leadership and runs due periodic jobs."""
+
+    def __init__(self, stop_event=None, tick_seconds=TICK_SECONDS):
+        self.stop_event = stop_event or threading.Event()
+        self.tick_seconds = tick_seconds
+        self.is_leader = False
+        self._lock_connection = None
+        self._holds_lock = False
+        self._thread = None
+
+    def start(self):
+        """Start the scheduler thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the scheduler and give up leadership"""
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.tick_seconds)
+
+    def _acquire_leadership(self):
+        """Try to take the leader lock on a dedicated connection; True when held"""
+        if self._holds_lock:
+            try:
+                with self._lock_connection.driver_connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                return True
+            except Exception as e:
+                logger.warning(f"Lost job scheduler leadership: {str(e)}")
+                self._release_leadership()
+
+        # Followers keep one connection for their lock attempts rather than
+        # opening a new one every tick; it becomes the leader connection on success
+        if self._lock_connection is None:
+            self._lock_connection = db.engine.raw_connection()
+        try:
+            connection = self._lock_connection.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LEADER_LOCK_KEY,))
+                acquired = cursor.fetchone()[0]
+        except Exception:
+            self._release_leadership()
+            raise
+
+        if not acquired:
+            return False
+
+        self._holds_lock = True
+        logger.info("This process is now the job scheduler leader")
+        return True
+
+    def _release_leadership(self):
+        """Drop the lock connection; closing it releases the advisory lock"""
+        if self._lock_connection is not None:
+            try:
+                # Never hand a connection that may hold the lock back to the pool
+                self._lock_connection.invalidate()
+            except Exception:
+                pass
+            self._lock_connection = None
+        self._holds_lock = False
+
+    def _run(self):
+        """Tick until stopped: lead if possible, then run due jobs"""
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    with app.app_context():
+                        was_leader = self.is_leader
+                        self.is_leader = self._acquire_leadership()
+                        if self.is_leader:
+                            if not was_leader:
+                                sync_jobs()
+                            run_due_jobs()
+                except Exception as e:
+                    logger.error(f"Job scheduler error: {str(e)}")
+                    self.is_leader = False
+                    self._release_leadership()
+                self.stop_event.wait(self.tick_seconds)
+        finally:
+            self.is_leader = False
+            self._release_leadership()
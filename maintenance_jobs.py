@@ -0,0 +1,105 @@
+"""
+Periodic maintenance jobs, run by the leading queue processor's JobScheduler.
+
+Long-running work is handed to the task queue (and its retries and timeouts) with
+TaskQueue.ensure_queued; quick housekeeping runs directly in the scheduler.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from app import db
+from models import AIEvaluationQueue, Invoice, Object, ReceiptCreationTracking, TaskQueue
+from job_scheduler import periodic_job, CATCH_UP_SKIP
+
+logger = logging.getLogger('queue_processor')
+
+# Temporary receipt invoices older than this are removed once their review task is gone
+TEMP_INVOICE_MAX_AGE = timedelta(days=1)
+
+# Task statuses in which a receipt is still waiting for review
+OPEN_RECEIPT_TASK_STATUSES = ('pending', 'processing', 'pending_review', 'ai_analysis_failed', 'needs_review')
+
+# Tables whose planner statistics are refreshed daily
+STATISTICS_TABLES = (
+    'objects', 'invoices', 'invoice_line_items', 'attachments', 'object_attachments',
+    'task_queue', 'ai_evaluation_queue', 'calendar_events', 'organizations',
+    'organization_relationships', 'reminders', 'vendors'
+)
+
+
+def _queue(task_type, priority=1):
+    """Queue a task unless one is already waiting; returns the job result"""
+    task = TaskQueue.ensure_queued(task_type, priority=priority)
+    return {'queued': task is not None, 'task_id': task.id if task else None}
+
+
+@periodic_job('schedule_ai_evaluations', every=timedelta(days=1), jitter=900)
+def schedule_ai_evaluations():
+    """Spread objects due for re-evaluation over the AI evaluation queue"""
+    scheduled = AIEvaluationQueue.schedule_evaluations()
+    db.session.commit()
+    return {'scheduled': scheduled}
+
+
+@periodic_job('ai_evaluation', every=timedelta(hours=1), jitter=300)
+def queue_ai_evaluation():
+    """Drain due AI evaluations within today's budget"""
+    return _queue('ai_evaluation')
+
+
+@periodic_job('stock_check', every=timedelta(days=7), jitter=3600)
+def queue_stock_check():
+    """Weekly check of stock levels against reorder thresholds"""
+    return _queue('stock_check', priority=2)
+
+
+@periodic_job('asset_valuation', every=timedelta(days=30), jitter=3600)
+def queue_asset_valuation():
+    """Monthly refresh of asset book values"""
+    return _queue('asset_valuation')
+
+
+@periodic_job('cleanup_temp_invoices', every=timedelta(hours=6), jitter=600)
+def cleanup_temp_invoices():
+    """
+    Delete TEMP-* invoices left behind by receipt uploads.
+
+    The upload creates a temporary invoice to hold the attachment until the receipt
+    is reviewed. Approving or rejecting the review task deletes it, but one whose
+    task is gone, finished or failed outright is never cleaned up otherwise.
+    """
+    open_task = db.select(TaskQueue.id).where(
+        TaskQueue.id == Invoice.data['created_from_task'].astext.cast(db.Integer),
+        TaskQueue.status.in_(OPEN_RECEIPT_TASK_STATUSES)
+    ).exists()
+    referenced = db.or_(
+        db.select(Object.id).where(Object.invoice_id == Invoice.id).exists(),
+        db.select(ReceiptCreationTracking.id).where(ReceiptCreationTracking.invoice_id == Invoice.id).exists()
+    )
+
+    orphans = Invoice.query.filter(
+        Invoice.invoice_number.like('TEMP-%'),
+        Invoice.created_at < datetime.utcnow() - TEMP_INVOICE_MAX_AGE,
+        ~open_task,
+        ~referenced
+    ).all()
+
+    # Delete through the ORM so attachments and line items cascade
+    for invoice in orphans:
+        db.session.delete(invoice)
+    db.session.commit()
+
+    if orphans:
+        logger.info(f"Deleted {len(orphans)} orphaned temporary invoices")
+    return {'deleted': len(orphans)}
+
+
+@periodic_job('refresh_statistics', every=timedelta(days=1), jitter=1800, catch_up=CATCH_UP_SKIP)
+def refresh_statistics():
+    """Refresh planner statistics of the busiest tables"""
+    existing = set(db.inspect(db.engine).get_table_names())
+    tables = [table for table in STATISTICS_TABLES if table in existing]
+    for table in tables:
+        db.session.execute(db.text(f'ANALYZE "{table}"'))
+    db.session.commit()
+    return {'tables': len(tables)}
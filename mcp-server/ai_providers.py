@@ -7,29 +7,51 @@ import os
 import asyncio
 import time
 import json
-from typing import Dict, Any, Optional, List
+import hashlib
+from collections import deque
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple, Union
 from datetime import datetime
 import base64
+import inspect
 
 import httpx
 import structlog
 from schemas import AIResponse, OUTPUT_SCHEMAS
+from images import ImageInput
+from rate_limiter import RateLimiterRegistry, rate_limit_headers, DEFAULT_PRIORITY
+from metrics import MetricsRegistry
 
 logger = structlog.get_logger()
 
+# Providers tried after the requested one, per prompt type ("default" for the rest),
+# e.g. {"receipt_analysis": ["openai", "claude"], "default": ["claude"]}
+PROVIDER_CHAINS = json.loads(os.environ.get("MCP_PROVIDER_CHAINS", "{}"))
+
+# Seconds before a provider attempt is abandoned and the next provider tried
+PROVIDER_TIMEOUT = float(os.environ.get("MCP_PROVIDER_TIMEOUT", 90))
+
+# Start a backup request when a provider is slower than its p95 latency
+HEDGE_REQUESTS = os.environ.get("MCP_HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = 20   # Latencies needed before a provider's p95 is trusted
+HEDGE_MIN_DELAY = 1.0    # Never hedge sooner than this many seconds
+LATENCY_SAMPLES = 200    # Recent latencies kept per provider for the p95
+
+# Tokens reserved for an image until the provider reports actual usage
+IMAGE_TOKEN_ESTIMATE = 1000
+
 class AIProviderManager:
     """Manages multiple AI providers with failover and load balancing"""
     
     def __init__(self):
         self.providers = {}
-        self.metrics = {
-            "total_requests": 0,
-            "requests_by_provider": {},
-            "requests_by_type": {},
-            "response_times": {},
-            "errors": {},
-            "costs": {}
-        }
+        self.metrics = MetricsRegistry()
+        # Provider calls in flight by request digest (single-flight)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.provider_chains: Dict[str, List[str]] = PROVIDER_CHAINS
+        self.attempt_timeout = PROVIDER_TIMEOUT
+        self.hedge_requests = HEDGE_REQUESTS
+        self._latencies: Dict[str, deque] = {}
+        self.rate_limits = RateLimiterRegistry()
         
     async def initialize(self):
         """Initialize all available AI providers"""
@@ -58,49 +80,350 @@ class AIProviderManager:
         self,
         provider: str,
         prompt: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[ImageInput] = None,
         schema: Optional[str] = None,
         max_tokens: int = 1000,
-        temperature: float = 0.1
+        temperature: float = 0.1,
+        prompt_type: Optional[str] = None,
+        priority: int = DEFAULT_PRIORITY
     ) -> AIResponse:
-        """Process an AI request with the specified provider"""
-        start_time = time.time()
+        """
+        Process an AI request, starting with the specified provider.
+        
+        The request goes down the provider chain configured for its prompt type:
+        a provider that errors or times out hands over to the next one, and with
+        hedging enabled a backup request is started when the provider has not
+        answered within its p95 latency. Every step is recorded in the response's
+        metadata. Calls wait for their provider's rate limits, most urgent
+        priority (lowest number) first.
+        
+        Identical requests of the same priority arriving while one is in flight (a
+        double submit, two workers evaluating the same receipt) share its provider
+        calls and result instead of paying for their own.
+        """
+        provider = getattr(provider, "value", provider)
+        if provider not in self.providers:
+            raise ValueError(f"Provider '{provider}' not available")
+        
+        digest = self._request_digest(provider, prompt_type, prompt, image_data, schema, max_tokens, temperature,
+                                      priority)
+        task = self._in_flight.get(digest)
+        if task is not None:
+            self.metrics.record_coalesced(provider)
+            logger.info("Coalesced AI request with one in flight", provider=provider, digest=digest[:12])
+            response = await asyncio.shield(task)
+            return response.model_copy(update={"metadata": {**response.metadata, "coalesced": True}})
         
+        call = {
+            "prompt": prompt,
+            "image_data": image_data,
+            "schema": schema,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "priority": priority,
+            "prompt_type": prompt_type
+        }
+        task = asyncio.ensure_future(self._run_chain(self.provider_chain(provider, prompt_type), prompt_type, call))
+        self._in_flight[digest] = task
+        task.add_done_callback(lambda finished: self._call_finished(digest, finished))
+        # Shielded, so a caller that goes away does not cancel the call for the others
+        return await asyncio.shield(task)
+    
+    async def stream_request(
+        self,
+        provider: str,
+        prompt: str,
+        image_data: Optional[ImageInput] = None,
+        schema: Optional[str] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.1,
+        prompt_type: Optional[str] = None,
+        priority: int = DEFAULT_PRIORITY
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream an AI request, starting with the specified provider.
+        
+        Yields ('started', provider) when a provider produces its first text,
+        ('text', chunk) for every chunk and finally ('result', AIResponse) with the
+        parsed answer. A provider that fails or times out before its first chunk
+        hands over to the next one in the chain; once text has been relayed there
+        is no failover and errors are raised. Streamed requests are neither
+        coalesced nor hedged.
+        """
+        provider = getattr(provider, "value", provider)
         if provider not in self.providers:
             raise ValueError(f"Provider '{provider}' not available")
         
+        chain = self.provider_chain(provider, prompt_type)
+        start_time = time.time()
+        steps = []
+        last_error = None
+        
+        def elapsed():
+            return round(time.time() - start_time, 3)
+        
+        for index, name in enumerate(chain):
+            steps.append({"provider": name, "event": "started", "reason": "primary" if index == 0 else "failover",
+                          "at": elapsed()})
+            stream = self._stream_provider(name, prompt, image_data, schema, max_tokens, temperature,
+                                           priority, prompt_type)
+            try:
+                # Waiting for the rate limit and the first chunk counts against the timeout
+                first = await asyncio.wait_for(stream.__anext__(), self.attempt_timeout)
+            except asyncio.TimeoutError:
+                await stream.aclose()
+                last_error = TimeoutError(f"Provider '{name}' timed out after {self.attempt_timeout}s")
+                steps.append({"provider": name, "event": "timeout", "at": elapsed()})
+                continue
+            except Exception as e:
+                await stream.aclose()
+                last_error = e
+                steps.append({"provider": name, "event": "error", "error": str(e), "at": elapsed()})
+                continue
+            
+            yield "started", name
+            text = []
+            stats = {}
+            try:
+                chunk = first
+                while True:
+                    if isinstance(chunk, str):
+                        text.append(chunk)
+                        yield "text", chunk
+                    else:
+                        stats = chunk
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+            finally:
+                await stream.aclose()
+            
+            steps.append({"provider": name, "event": "success", "at": elapsed()})
+            content_text = "".join(text)
+            try:
+                content = json.loads(content_text)
+            except json.JSONDecodeError:
+                content = {"response": content_text}
+            yield "result", self._build_response(
+                name, {**stats, "content": content}, prompt_type, start_time, chain, steps, False
+            )
+            return
+        
+        raise last_error or RuntimeError("No AI provider available")
+    
+    def provider_chain(self, provider: str, prompt_type: Optional[str] = None) -> List[str]:
+        """Providers to try in order: the requested one, then the configured chain"""
+        configured = self.provider_chains.get(prompt_type) or self.provider_chains.get("default") or []
+        chain = []
+        for name in [provider, *configured]:
+            if name in self.providers and name not in chain:
+                chain.append(name)
+        return chain
+    
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds after which a request to provider is hedged, or None when not hedging"""
+        if not self.hedge_requests:
+            return None
+        samples = self._latencies.get(provider)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return max(ordered[int(0.95 * (len(ordered) - 1))], HEDGE_MIN_DELAY)
+    
+    @staticmethod
+    def _request_digest(
+        provider: str,
+        prompt_type: Optional[str],
+        prompt: str,
+        image_data: Optional[ImageInput],
+        schema: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        priority: int
+    ) -> str:
+        """
+        Digest identifying identical requests.
+        
+        Priority is part of it: an urgent request must not wait on an identical
+        bulk request that is still queued behind the rate limiter.
+        """
+        digest = hashlib.sha256()
+        header = json.dumps([provider, prompt_type, schema, max_tokens, temperature, priority])
+        for part in (header, prompt, image_data.digest if image_data else ""):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _call_finished(self, digest: str, task: asyncio.Task):
+        """Forget a finished provider call"""
+        if self._in_flight.get(digest) is task:
+            del self._in_flight[digest]
+        # Mark the error retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+    
+    @staticmethod
+    def _is_valid(result: Dict[str, Any], schema: Optional[str]) -> bool:
+        """A usable result: JSON content, when a schema was asked for"""
+        content = result.get("content")
+        if not isinstance(content, dict):
+            return False
+        # Providers wrap output that is not JSON as {"response": text}
+        return not (schema and set(content) == {"response"} and isinstance(content["response"], str))
+    
+    async def _run_chain(self, chain: List[str], prompt_type: Optional[str], call: Dict[str, Any]) -> AIResponse:
+        """Try the providers of a chain with failover and optional hedging"""
+        start_time = time.time()
+        steps = []
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        hedged = False
+        fallback = None
+        last_error = None
+        
+        def elapsed():
+            return round(time.time() - start_time, 3)
+        
+        def launch(provider, reason):
+            pending[asyncio.ensure_future(self._call_provider(provider, **call))] = provider
+            steps.append({"provider": provider, "event": "started", "reason": reason, "at": elapsed()})
+        
+        def cancel_pending():
+            for task, provider in pending.items():
+                task.cancel()
+                steps.append({"provider": provider, "event": "cancelled", "at": elapsed()})
+            pending.clear()
+        
         try:
-            # Get the provider instance
-            provider_instance = self.providers[provider]
+            while pending or next_index < len(chain):
+                if not pending:
+                    launch(chain[next_index], "primary" if next_index == 0 else "failover")
+                    next_index += 1
+                
+                delay = None
+                if not hedged and len(pending) == 1 and next_index < len(chain):
+                    delay = self.hedge_delay(next(iter(pending.values())))
+                    if delay is not None:
+                        started_at = steps[-1]["at"]
+                        delay = max(delay - (elapsed() - started_at), 0)
+                
+                done, _ = await asyncio.wait(list(pending), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than its p95: race a backup request against it
+                    hedged = True
+                    launch(chain[next_index], "hedge")
+                    next_index += 1
+                    continue
+                
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        last_error = TimeoutError(f"Provider '{provider}' timed out after {self.attempt_timeout}s")
+                        steps.append({"provider": provider, "event": "timeout", "at": elapsed()})
+                        continue
+                    except Exception as e:
+                        last_error = e
+                        steps.append({"provider": provider, "event": "error", "error": str(e), "at": elapsed()})
+                        continue
+                    
+                    if not self._is_valid(result, call["schema"]):
+                        steps.append({"provider": provider, "event": "invalid", "at": elapsed()})
+                        fallback = fallback or (provider, result)
+                        continue
+                    
+                    steps.append({"provider": provider, "event": "success", "at": elapsed()})
+                    cancel_pending()
+                    return self._build_response(provider, result, prompt_type, start_time, chain, steps, hedged)
             
+            if fallback is not None:
+                # Nothing better came back: return the unstructured answer, as before failover
+                provider, result = fallback
+                return self._build_response(provider, result, prompt_type, start_time, chain, steps, hedged)
+            raise last_error or RuntimeError("No AI provider available")
+        finally:
+            cancel_pending()
+    
+    def _build_response(
+        self,
+        provider: str,
+        result: Dict[str, Any],
+        prompt_type: Optional[str],
+        start_time: float,
+        chain: List[str],
+        steps: List[Dict[str, Any]],
+        hedged: bool
+    ) -> AIResponse:
+        """AIResponse for the result that won, with the chain's steps as metadata"""
+        return AIResponse(
+            content=result["content"],
+            provider=provider,
+            prompt_type=prompt_type or result.get("prompt_type", "unknown"),
+            confidence=result.get("confidence"),
+            processing_time=time.time() - start_time,
+            timestamp=datetime.utcnow(),
+            tokens_used=result.get("tokens_used"),
+            cost_estimate=result.get("cost_estimate"),
+            metadata={
+                "chain": chain,
+                "served_by": provider,
+                "failed_over": provider != chain[0],
+                "hedged": hedged,
+                "steps": steps
+            }
+        )
+    
+    async def _call_provider(
+        self,
+        provider: str,
+        prompt: str,
+        image_data: Optional[ImageInput],
+        schema: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        priority: int = DEFAULT_PRIORITY,
+        prompt_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Make one rate-limited provider call within the attempt timeout and record its metrics"""
+        start_time = time.time()
+        provider_instance = self.providers[provider]
+        model = provider_instance.get_model(image_data)
+        
+        try:
             # Prepare the schema if specified
             output_schema = OUTPUT_SCHEMAS.get(schema) if schema else None
             
-            # Process the request
-            result = await provider_instance.process_request(
-                prompt=prompt,
-                image_data=image_data,
-                output_schema=output_schema,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            limiter = self.rate_limits.get(provider, model)
+            estimated_tokens = self._estimate_tokens(prompt, image_data, max_tokens)
+            
+            async def limited_call():
+                await limiter.acquire(priority, estimated_tokens)
+                try:
+                    result = await provider_instance.process_request(
+                        prompt=prompt,
+                        image_data=image_data,
+                        output_schema=output_schema,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                except BaseException as e:
+                    limiter.failure(e, estimated_tokens)
+                    raise
+                limiter.success(estimated_tokens, result.get("tokens_used"), result.get("rate_limits") or {})
+                return result
+            
+            # Waiting for the rate limit counts against the timeout, so a congested
+            # provider hands over to the next one in the chain
+            result = await asyncio.wait_for(limited_call(), self.attempt_timeout)
             
             processing_time = time.time() - start_time
             
             # Update metrics
-            self._update_metrics(provider, "success", processing_time, result.get("tokens_used"))
-            
-            # Create response
-            response = AIResponse(
-                content=result["content"],
-                provider=provider,
-                prompt_type=result.get("prompt_type", "unknown"),
-                confidence=result.get("confidence"),
-                processing_time=processing_time,
-                timestamp=datetime.utcnow(),
-                tokens_used=result.get("tokens_used"),
-                cost_estimate=result.get("cost_estimate")
-            )
+            self.metrics.record(provider, model, prompt_type, "success", processing_time,
+                                result.get("tokens_used"), result.get("cost_estimate"))
+            self._latencies.setdefault(provider, deque(maxlen=LATENCY_SAMPLES)).append(processing_time)
             
             logger.info(
                 "AI request processed",
@@ -109,20 +432,80 @@ class AIProviderManager:
                 tokens_used=result.get("tokens_used")
             )
             
-            return response
+            return result
             
+        except asyncio.CancelledError:
+            # Lost a hedged race
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
-            self._update_metrics(provider, "error", processing_time, 0)
+            self.metrics.record(provider, model, prompt_type, "error", processing_time)
             
             logger.error(
                 "AI request failed",
                 provider=provider,
-                error=str(e),
+                error=str(e) or e.__class__.__name__,
                 processing_time=processing_time
             )
             raise
     
+    async def _stream_provider(
+        self,
+        provider: str,
+        prompt: str,
+        image_data: Optional[ImageInput],
+        schema: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        priority: int = DEFAULT_PRIORITY,
+        prompt_type: Optional[str] = None
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        """Stream one rate-limited provider call and record its metrics"""
+        start_time = time.time()
+        provider_instance = self.providers[provider]
+        model = provider_instance.get_model(image_data)
+        output_schema = OUTPUT_SCHEMAS.get(schema) if schema else None
+        limiter = self.rate_limits.get(provider, model)
+        estimated_tokens = self._estimate_tokens(prompt, image_data, max_tokens)
+        
+        await limiter.acquire(priority, estimated_tokens)
+        stats = None
+        streamed = False
+        try:
+            async for chunk in provider_instance.stream_request(
+                prompt=prompt,
+                image_data=image_data,
+                output_schema=output_schema,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ):
+                streamed = True
+                if isinstance(chunk, dict):
+                    stats = chunk
+                yield chunk
+        except BaseException as e:
+            # Tokens were spent once the provider started answering; keep the reservation
+            limiter.failure(e, 0 if streamed else estimated_tokens)
+            if not isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                self.metrics.record(provider, model, prompt_type, "error", time.time() - start_time)
+                logger.error("AI stream failed", provider=provider, error=str(e) or e.__class__.__name__)
+            raise
+        
+        stats = stats or {}
+        processing_time = time.time() - start_time
+        limiter.success(estimated_tokens, stats.get("tokens_used"), stats.get("rate_limits") or {})
+        self.metrics.record(provider, model, prompt_type, "success", processing_time,
+                            stats.get("tokens_used"), stats.get("cost_estimate"))
+        self._latencies.setdefault(provider, deque(maxlen=LATENCY_SAMPLES)).append(processing_time)
+        logger.info("AI stream processed", provider=provider, processing_time=processing_time,
+                    tokens_used=stats.get("tokens_used"))
+    
+    @staticmethod
+    def _estimate_tokens(prompt: str, image_data: Optional[ImageInput], max_tokens: int) -> int:
+        """Tokens a request may use, reserved against tokens-per-minute until it finishes"""
+        # About four characters per token, plus a flat allowance per image
+        return len(prompt) // 4 + (IMAGE_TOKEN_ESTIMATE if image_data else 0) + max_tokens
+    
     async def check_all_providers(self) -> Dict[str, bool]:
         """Check the status of all providers"""
         status = {}
@@ -184,28 +567,22 @@ class AIProviderManager:
     async def get_metrics(self) -> Dict[str, Any]:
         """Get usage metrics"""
         return {
-            **self.metrics,
-            "providers_available": list(self.providers.keys()),
-            "period_start": datetime.utcnow().replace(hour=0, minute=0, second=0),
-            "period_end": datetime.utcnow()
+            **self.metrics.snapshot(),
+            "in_flight_requests": len(self._in_flight),
+            "rate_limits": self.rate_limits.snapshot(),
+            "providers_available": list(self.providers.keys())
         }
     
-    def _update_metrics(self, provider: str, status: str, processing_time: float, tokens_used: int):
-        """Update internal metrics"""
-        self.metrics["total_requests"] += 1
-        
-        if provider not in self.metrics["requests_by_provider"]:
-            self.metrics["requests_by_provider"][provider] = 0
-        self.metrics["requests_by_provider"][provider] += 1
-        
-        if provider not in self.metrics["response_times"]:
-            self.metrics["response_times"][provider] = []
-        self.metrics["response_times"][provider].append(processing_time)
-        
-        if status == "error":
-            if provider not in self.metrics["errors"]:
-                self.metrics["errors"][provider] = 0
-            self.metrics["errors"][provider] += 1
+    def prometheus_metrics(self) -> str:
+        """Usage metrics in the Prometheus text exposition format"""
+        limiters = self.rate_limits.snapshot()
+        return self.metrics.prometheus_text(gauges={
+            "mcp_ai_in_flight_requests": [({}, len(self._in_flight))],
+            "mcp_ai_concurrency_limit": [({"limiter": key}, state["concurrency_limit"])
+                                         for key, state in limiters.items()],
+            "mcp_ai_rate_limit_waiting": [({"limiter": key}, state["waiting"])
+                                          for key, state in limiters.items()]
+        })
     
     async def cleanup(self):
         """Cleanup all providers"""
@@ -229,7 +606,7 @@ class BaseAIProvider:
     async def process_request(
         self,
         prompt: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[ImageInput] = None,
         output_schema: Optional[Dict] = None,
         max_tokens: int = 1000,
         temperature: float = 0.1
@@ -237,10 +614,36 @@ class BaseAIProvider:
         """Process an AI request"""
         raise NotImplementedError
         
+    async def stream_request(
+        self,
+        prompt: str,
+        image_data: Optional[ImageInput] = None,
+        output_schema: Optional[Dict] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.1
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        """
+        Stream an AI request: yields text chunks as they are generated, then one dict
+        with tokens_used, cost_estimate and rate_limits.
+        
+        Providers without streaming produce the whole answer as a single chunk.
+        """
+        result = await self.process_request(prompt, image_data, output_schema, max_tokens, temperature)
+        content = result["content"]
+        if set(content) == {"response"} and isinstance(content["response"], str):
+            yield content["response"]
+        else:
+            yield json.dumps(content)
+        yield {key: value for key, value in result.items() if key != "content"}
+        
     async def health_check(self):
         """Check if the provider is available"""
         raise NotImplementedError
         
+    def get_model(self, image_data: Optional[ImageInput] = None) -> str:
+        """Model a request is sent to (rate limits are kept per model)"""
+        return "default"
+    
     def get_capabilities(self) -> List[str]:
         """Get provider capabilities"""
         return ["text"]
@@ -255,9 +658,19 @@ class BaseAIProvider:
             await self.client.close()
 
 
+async def _parse_raw_response(raw):
+    """Parse an SDK raw response (parse() is async in some SDK versions)"""
+    parsed = raw.parse()
+    if inspect.isawaitable(parsed):
+        parsed = await parsed
+    return parsed
+
+
 class ClaudeProvider(BaseAIProvider):
     """Anthropic Claude provider"""
     
+    MODEL = "claude-3-5-sonnet-20241022"
+    
     async def initialize(self):
         import anthropic
         self.client = anthropic.AsyncAnthropic(
@@ -267,24 +680,45 @@ class ClaudeProvider(BaseAIProvider):
     async def process_request(
         self,
         prompt: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[ImageInput] = None,
         output_schema: Optional[Dict] = None,
         max_tokens: int = 1000,
         temperature: float = 0.1
     ) -> Dict[str, Any]:
         
+        messages = self._build_messages(prompt, image_data, output_schema)
+        
+        # Raw response, for the rate limit headers
+        raw = await self.client.messages.with_raw_response.create(
+            model=self.MODEL,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=messages
+        )
+        response = await _parse_raw_response(raw)
+        
+        content_text = response.content[0].text
+        
+        # Try to parse JSON response
+        try:
+            content = json.loads(content_text)
+        except json.JSONDecodeError:
+            # If not JSON, return as text
+            content = {"response": content_text}
+        
+        return {
+            "content": content,
+            "tokens_used": response.usage.input_tokens + response.usage.output_tokens,
+            "cost_estimate": self._calculate_cost(response.usage.input_tokens, response.usage.output_tokens),
+            "rate_limits": rate_limit_headers(raw.headers)
+        }
+    
+    def _build_messages(self, prompt: str, image_data: Optional[ImageInput], output_schema: Optional[Dict]) -> List[Dict]:
+        """Messages of a request, with the image and the JSON schema instruction"""
         messages = []
         
         if image_data:
-            # Handle image data
-            if image_data.startswith('data:image/'):
-                # Extract base64 data from data URI
-                _, base64_data = image_data.split(',', 1)
-                media_type = image_data.split(';')[0].split(':')[1]
-            else:
-                base64_data = image_data
-                media_type = "image/jpeg"  # Default assumption
-                
+            # Encoded here, once, however many attempts share the image
             messages.append({
                 "role": "user",
                 "content": [
@@ -292,8 +726,8 @@ class ClaudeProvider(BaseAIProvider):
                         "type": "image",
                         "source": {
                             "type": "base64",
-                            "media_type": media_type,
-                            "data": base64_data
+                            "media_type": image_data.media_type,
+                            "data": image_data.base64
                         }
                     },
                     {
@@ -316,39 +750,48 @@ class ClaudeProvider(BaseAIProvider):
             else:
                 messages[-1]["content"] += schema_prompt
         
-        response = await self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
+        return messages
+    
+    async def stream_request(
+        self,
+        prompt: str,
+        image_data: Optional[ImageInput] = None,
+        output_schema: Optional[Dict] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.1
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        
+        async with self.client.messages.stream(
+            model=self.MODEL,
             max_tokens=max_tokens,
             temperature=temperature,
-            messages=messages
-        )
+            messages=self._build_messages(prompt, image_data, output_schema)
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+            headers = stream.response.headers
         
-        content_text = response.content[0].text
-        
-        # Try to parse JSON response
-        try:
-            content = json.loads(content_text)
-        except json.JSONDecodeError:
-            # If not JSON, return as text
-            content = {"response": content_text}
-        
-        return {
-            "content": content,
-            "tokens_used": response.usage.input_tokens + response.usage.output_tokens,
-            "cost_estimate": self._calculate_cost(response.usage.input_tokens, response.usage.output_tokens)
+        yield {
+            "tokens_used": message.usage.input_tokens + message.usage.output_tokens,
+            "cost_estimate": self._calculate_cost(message.usage.input_tokens, message.usage.output_tokens),
+            "rate_limits": rate_limit_headers(headers)
         }
     
     async def health_check(self):
         """Check Claude API availability"""
         try:
             await self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+                model=self.MODEL,
                 max_tokens=10,
                 messages=[{"role": "user", "content": "ping"}]
             )
         except Exception as e:
             raise Exception(f"Claude health check failed: {e}")
     
+    def get_model(self, image_data: Optional[ImageInput] = None) -> str:
+        return self.MODEL
+    
     def get_capabilities(self) -> List[str]:
         return ["text", "vision", "json_output"]
     
@@ -377,12 +820,42 @@ class OpenAIProvider(BaseAIProvider):
     async def process_request(
         self,
         prompt: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[ImageInput] = None,
         output_schema: Optional[Dict] = None,
         max_tokens: int = 1000,
         temperature: float = 0.1
     ) -> Dict[str, Any]:
         
+        messages = self._build_messages(prompt, image_data, output_schema)
+        
+        model = self.get_model(image_data)
+        
+        # Raw response, for the rate limit headers
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        response = await _parse_raw_response(raw)
+        
+        content_text = response.choices[0].message.content
+        
+        # Try to parse JSON response
+        try:
+            content = json.loads(content_text)
+        except json.JSONDecodeError:
+            content = {"response": content_text}
+        
+        return {
+            "content": content,
+            "tokens_used": response.usage.total_tokens,
+            "cost_estimate": self._calculate_cost(response.usage.prompt_tokens, response.usage.completion_tokens, model),
+            "rate_limits": rate_limit_headers(raw.headers)
+        }
+    
+    def _build_messages(self, prompt: str, image_data: Optional[ImageInput], output_schema: Optional[Dict]) -> List[Dict]:
+        """Messages of a request, with the image and the JSON schema instruction"""
         messages = []
         
         if image_data:
@@ -396,7 +869,7 @@ class OpenAIProvider(BaseAIProvider):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": image_data if image_data.startswith('data:') else f"data:image/jpeg;base64,{image_data}"
+                            "url": image_data.data_url
                         }
                     }
                 ]
@@ -415,27 +888,42 @@ class OpenAIProvider(BaseAIProvider):
             else:
                 messages[-1]["content"] += schema_prompt
         
-        model = "gpt-4o" if image_data else "gpt-4"
+        return messages
+    
+    async def stream_request(
+        self,
+        prompt: str,
+        image_data: Optional[ImageInput] = None,
+        output_schema: Optional[Dict] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.1
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
         
-        response = await self.client.chat.completions.create(
+        model = self.get_model(image_data)
+        raw = await self.client.chat.completions.with_raw_response.create(
             model=model,
-            messages=messages,
+            messages=self._build_messages(prompt, image_data, output_schema),
             max_tokens=max_tokens,
-            temperature=temperature
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
         )
+        stream = await _parse_raw_response(raw)
         
-        content_text = response.choices[0].message.content
-        
-        # Try to parse JSON response
+        usage = None
         try:
-            content = json.loads(content_text)
-        except json.JSONDecodeError:
-            content = {"response": content_text}
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if chunk.usage is not None:
+                    usage = chunk.usage
+        finally:
+            await stream.close()
         
-        return {
-            "content": content,
-            "tokens_used": response.usage.total_tokens,
-            "cost_estimate": self._calculate_cost(response.usage.prompt_tokens, response.usage.completion_tokens, model)
+        yield {
+            "tokens_used": usage.total_tokens if usage else None,
+            "cost_estimate": self._calculate_cost(usage.prompt_tokens, usage.completion_tokens, model) if usage else None,
+            "rate_limits": rate_limit_headers(raw.headers)
         }
     
     async def health_check(self):
@@ -449,6 +937,9 @@ class OpenAIProvider(BaseAIProvider):
         except Exception as e:
             raise Exception(f"OpenAI health check failed: {e}")
     
+    def get_model(self, image_data: Optional[ImageInput] = None) -> str:
+        return "gpt-4o" if image_data else "gpt-4"
+    
     def get_capabilities(self) -> List[str]:
         return ["text", "vision", "json_output"]
     
@@ -475,7 +966,7 @@ class LLMStudioProvider(BaseAIProvider):
     async def process_request(
         self,
         prompt: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[ImageInput] = None,
         output_schema: Optional[Dict] = None,
         max_tokens: int = 1000,
         temperature: float = 0.1
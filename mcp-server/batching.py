@@ -0,0 +1,240 @@
+"""
+Batched category suggestions.
+
+Categorizing the line items of a receipt, or re-categorizing a list of objects,
+one provider call per item pays the prompt (instructions and the list of existing
+categories) again for every item. A BatchProcessor packs as many items into one
+call as the token budgets allow, validates every item's suggestions against the
+CategorySuggestion schema, and retries only the items that failed: in smaller
+calls, since a batch that was cut off or confused the model usually does better
+when split.
+"""
+
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+import structlog
+from pydantic import ValidationError
+
+from schemas import (
+    BatchItem, BatchItemResult, BatchRequest, BatchResponse, CategorySuggestion, OUTPUT_SCHEMAS
+)
+
+logger = structlog.get_logger()
+
+# Output tokens one provider call may use (the AIRequest max_tokens limit)
+OUTPUT_TOKEN_BUDGET = int(os.environ.get("MCP_BATCH_OUTPUT_TOKENS", 4000))
+
+# Prompt tokens one provider call may use, including the shared context
+INPUT_TOKEN_BUDGET = int(os.environ.get("MCP_BATCH_INPUT_TOKENS", 12000))
+
+# Upper limit on items per call, whatever the budgets allow
+MAX_ITEMS_PER_CALL = int(os.environ.get("MCP_BATCH_MAX_ITEMS", 40))
+
+# Output tokens for the {"results": [...]} wrapper around the items
+RESPONSE_OVERHEAD_TOKENS = 50
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def pack(items: List[BatchItem], prompt_tokens: int, tokens_per_item: int,
+         max_items: int) -> List[List[BatchItem]]:
+    """
+    Split items into as few calls as the token budgets allow, keeping their order.
+
+    Args:
+        items: Items to pack
+        prompt_tokens: Prompt tokens of a call without any items
+        tokens_per_item: Output tokens reserved per item
+        max_items: Most items in one call
+
+    Returns:
+        list: Chunks of items, each fitting the input and output budgets
+    """
+    output_room = max(1, (OUTPUT_TOKEN_BUDGET - RESPONSE_OVERHEAD_TOKENS) // tokens_per_item)
+    max_items = max(1, min(max_items, output_room))
+
+    chunks = []
+    chunk, chunk_tokens = [], prompt_tokens
+    for item in items:
+        item_tokens = estimate_tokens(json.dumps(item.data, default=str)) + 10
+        if chunk and (len(chunk) >= max_items or chunk_tokens + item_tokens > INPUT_TOKEN_BUDGET):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], prompt_tokens
+        # An item too large for the budget on its own still gets a call
+        chunk.append(item)
+        chunk_tokens += item_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def validate_results(content: Dict[str, Any], chunk: List[BatchItem],
+                     max_suggestions: int) -> Tuple[Dict[str, List[CategorySuggestion]], Dict[str, str]]:
+    """
+    Check a provider's answer for a chunk item by item.
+
+    Returns:
+        tuple: ({item id: suggestions} for valid items, {item id: error} for the rest)
+    """
+    expected = {item.id for item in chunk}
+    results = content.get("results") if isinstance(content, dict) else None
+    if not isinstance(results, list):
+        reason = "response was not valid JSON" if isinstance(content, dict) and "response" in content \
+            else "response has no results list"
+        return {}, {item_id: reason for item_id in expected}
+
+    valid, errors = {}, {}
+    for entry in results:
+        if not isinstance(entry, dict):
+            continue
+        item_id = str(entry.get("id"))
+        if item_id not in expected or item_id in valid:
+            continue
+        suggestions = entry.get("suggestions")
+        if not isinstance(suggestions, list) or not suggestions:
+            errors[item_id] = "no suggestions"
+            continue
+        try:
+            parsed = [CategorySuggestion(**suggestion) for suggestion in suggestions[:max_suggestions]]
+        except (ValidationError, TypeError) as e:
+            errors[item_id] = f"invalid suggestion: {str(e).splitlines()[0]}"
+            continue
+        valid[item_id] = parsed
+        errors.pop(item_id, None)
+
+    for item_id in expected - valid.keys() - errors.keys():
+        errors[item_id] = "missing from response"
+    return valid, errors
+
+
+class BatchProcessor:
+    """Runs batch requests through the prompt manager and provider manager"""
+
+    def __init__(self, prompt_manager, ai_provider_manager):
+        self.prompt_manager = prompt_manager
+        self.ai_provider_manager = ai_provider_manager
+
+    async def process(self, request: BatchRequest, context: Dict[str, Any]) -> BatchResponse:
+        """
+        Suggest categories for every item of a batch request.
+
+        Args:
+            request: The batch request
+            context: Shared prompt context (registered context already merged in)
+
+        Returns:
+            BatchResponse: One result per item, in request order
+        """
+        start_time = time.time()
+        if request.provider.value not in self.ai_provider_manager.providers:
+            raise ValueError(f"Provider '{request.provider.value}' not available")
+        template = await self.prompt_manager.get_template(request.prompt_type.value)
+        base_context = {**context, "max_suggestions": request.max_suggestions}
+
+        empty_prompt = await self.prompt_manager.render_prompt(template, {**base_context, "items": []})
+        schema_text = json.dumps(OUTPUT_SCHEMAS.get(template.output_schema or "categories", {}))
+        prompt_tokens = estimate_tokens(empty_prompt) + estimate_tokens(schema_text)
+
+        results: Dict[str, BatchItemResult] = {}
+        attempts: Dict[str, int] = {item.id: 0 for item in request.items}
+        last_errors: Dict[str, str] = {}
+        calls, items_per_call = 0, []
+        tokens_used, cost = 0, 0.0
+
+        max_items = request.max_items_per_call or MAX_ITEMS_PER_CALL
+        chunks = pack(request.items, prompt_tokens, request.tokens_per_item, max_items)
+
+        for attempt in range(1, request.max_attempts + 1):
+            if not chunks:
+                break
+            outcomes = await asyncio.gather(
+                *(self._run_chunk(request, template, base_context, chunk) for chunk in chunks)
+            )
+
+            retry_chunks = []
+            for chunk, (response, valid, errors) in zip(chunks, outcomes):
+                calls += 1
+                items_per_call.append(len(chunk))
+                if response is not None:
+                    tokens_used += response.tokens_used or 0
+                    cost += response.cost_estimate or 0.0
+                failed = []
+                for item in chunk:
+                    attempts[item.id] = attempt
+                    if item.id in valid:
+                        results[item.id] = BatchItemResult(
+                            id=item.id,
+                            success=True,
+                            suggestions=valid[item.id],
+                            attempts=attempt,
+                            provider=response.provider
+                        )
+                    else:
+                        last_errors[item.id] = errors[item.id]
+                        failed.append(item)
+                if failed:
+                    # Retry in calls of at most half the size that failed
+                    retry_chunks.extend(pack(failed, prompt_tokens, request.tokens_per_item,
+                                             max(1, len(chunk) // 2)))
+
+            if retry_chunks and attempt < request.max_attempts:
+                logger.info("Retrying failed batch items", attempt=attempt,
+                            items=sum(len(chunk) for chunk in retry_chunks), calls=len(retry_chunks))
+            chunks = retry_chunks
+
+        ordered = [
+            results.get(item.id) or BatchItemResult(
+                id=item.id,
+                success=False,
+                error=last_errors.get(item.id, "not processed"),
+                attempts=attempts[item.id]
+            )
+            for item in request.items
+        ]
+
+        logger.info(
+            "Batch processed",
+            items=len(request.items),
+            succeeded=sum(1 for result in ordered if result.success),
+            provider_calls=calls
+        )
+
+        return BatchResponse(
+            results=ordered,
+            provider_calls=calls,
+            items_per_call=items_per_call,
+            processing_time=time.time() - start_time,
+            timestamp=datetime.utcnow(),
+            tokens_used=tokens_used,
+            cost_estimate=round(cost, 6)
+        )
+
+    async def _run_chunk(self, request: BatchRequest, template, base_context: Dict[str, Any],
+                         chunk: List[BatchItem]):
+        """One provider call for a chunk: (response or None, valid suggestions, errors)"""
+        items = [{"id": item.id, **item.data} for item in chunk]
+        try:
+            prompt = await self.prompt_manager.render_prompt(template, {**base_context, "items": items})
+            response = await self.ai_provider_manager.process_request(
+                provider=request.provider,
+                prompt=prompt,
+                schema=template.output_schema or "categories",
+                max_tokens=min(OUTPUT_TOKEN_BUDGET, len(chunk) * request.tokens_per_item + RESPONSE_OVERHEAD_TOKENS),
+                temperature=request.temperature,
+                prompt_type=request.prompt_type.value,
+                priority=request.priority
+            )
+        except Exception as e:
+            logger.warning("Batch call failed", items=len(chunk), error=str(e))
+            return None, {}, {item.id: f"provider call failed: {str(e)}" for item in chunk}
+
+        valid, errors = validate_results(response.content, chunk, request.max_suggestions)
+        return response, valid, errors
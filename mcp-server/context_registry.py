@@ -0,0 +1,45 @@
+"""
+Registry of shared prompt contexts for the MCP server.
+
+Clients register a large, rarely changing context (such as Homebase's object types
+and categories) once under a content-derived ID and then send only the ID with
+each AI request. Contexts live in memory; a request naming an unknown ID gets a
+409 so the client registers it again (e.g. after a server restart).
+"""
+
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import threading
+
+import structlog
+
+logger = structlog.get_logger()
+
+class ContextRegistry:
+    """Bounded in-memory store of registered contexts, least recently used evicted first"""
+    
+    def __init__(self, max_contexts: int = 64):
+        self.max_contexts = max_contexts
+        self._contexts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def register(self, context_id: str, context: Dict[str, Any]):
+        """Store a context under its ID, replacing any previous one"""
+        with self._lock:
+            self._contexts[context_id] = context
+            self._contexts.move_to_end(context_id)
+            while len(self._contexts) > self.max_contexts:
+                evicted, _ = self._contexts.popitem(last=False)
+                logger.info("Evicted registered context", context_id=evicted)
+        logger.info("Registered context", context_id=context_id, keys=list(context))
+    
+    def get(self, context_id: str) -> Optional[Dict[str, Any]]:
+        """Registered context for an ID, or None"""
+        with self._lock:
+            context = self._contexts.get(context_id)
+            if context is not None:
+                self._contexts.move_to_end(context_id)
+            return context
+    
+    def __len__(self):
+        return len(self._contexts)
@@ -0,0 +1,131 @@
+"""
+Images attached to AI requests.
+
+An ImageInput keeps an image in the form it arrived in: raw bytes from a
+multipart upload or a shared blob, or base64 text from a JSON request. It is
+converted to what a provider needs (base64 for Claude, a data URL for OpenAI)
+only when the provider builds its request, and each conversion is done at most
+once per request, however many failover or hedged attempts share the image.
+"""
+
+import os
+import base64
+import binascii
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+
+# Directory shared with the Homebase app; AI requests may reference images in it
+# by name (image_ref) instead of sending them
+SHARED_BLOB_DIR = os.environ.get("MCP_SHARED_BLOB_DIR")
+
+DEFAULT_MEDIA_TYPE = "image/jpeg"
+
+# Leading bytes of the image formats the providers accept
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def sniff_media_type(data: bytes) -> Optional[str]:
+    """Media type of an image from its leading bytes, or None when unknown"""
+    for magic, media_type in MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ImageInput:
+    """An image and its provider encodings, computed on first use"""
+
+    def __init__(self, data: Optional[bytes] = None, media_type: str = DEFAULT_MEDIA_TYPE,
+                 encoded: Optional[str] = None):
+        if data is None and encoded is None:
+            raise ValueError("An image needs either raw bytes or base64 data")
+        self._data = data
+        self._base64 = encoded
+        self._data_url = None
+        self._digest = None
+        self.media_type = media_type
+
+    @classmethod
+    def from_bytes(cls, data: bytes, media_type: Optional[str] = None) -> "ImageInput":
+        """
+        Image from raw bytes.
+
+        Args:
+            data: Image bytes
+            media_type: Media type declared by the sender, used when the bytes are
+                        not a recognized image format
+        """
+        if not data:
+            raise ValueError("Image is empty")
+        declared = media_type if media_type and media_type.startswith("image/") else None
+        return cls(data=data, media_type=sniff_media_type(data) or declared or DEFAULT_MEDIA_TYPE)
+
+    @classmethod
+    def from_encoded(cls, value: str) -> "ImageInput":
+        """Image from a data URL or bare base64 text, kept encoded"""
+        if value.startswith("data:"):
+            header, _, encoded = value.partition(",")
+            media_type = header[5:].split(";")[0] or DEFAULT_MEDIA_TYPE
+        else:
+            encoded = value
+            # The first 16 base64 characters decode to the first 12 bytes
+            try:
+                head = base64.b64decode(encoded[:16] + "=" * (-len(encoded[:16]) % 4))
+            except binascii.Error:
+                head = b""
+            media_type = sniff_media_type(head) or DEFAULT_MEDIA_TYPE
+        return cls(encoded=encoded, media_type=media_type)
+
+    @property
+    def base64(self) -> str:
+        """The image as base64 text"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        """The image as a data: URL"""
+        if self._data_url is None:
+            self._data_url = f"data:{self.media_type};base64,{self.base64}"
+        return self._data_url
+
+    @property
+    def digest(self) -> str:
+        """Hash identifying the image (for coalescing identical requests)"""
+        if self._digest is None:
+            content = self._data if self._data is not None else self._base64.encode("ascii")
+            self._digest = hashlib.sha256(content).hexdigest()
+        return self._digest
+
+
+async def load_blob(image_ref: str) -> ImageInput:
+    """
+    Image stored under a name in the shared blob directory.
+
+    Raises:
+        ValueError: No shared directory is configured, or the name points outside it
+        FileNotFoundError: No such image
+    """
+    if not SHARED_BLOB_DIR:
+        raise ValueError("Image references need MCP_SHARED_BLOB_DIR to be configured")
+    root = Path(SHARED_BLOB_DIR).resolve()
+    path = (root / image_ref).resolve()
+    if root not in path.parents:
+        raise ValueError(f"Invalid image reference '{image_ref}'")
+    try:
+        async with aiofiles.open(path, "rb") as f:
+            data = await f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        raise FileNotFoundError(f"Image '{image_ref}' not found in the shared blob directory")
+    return ImageInput.from_bytes(data)
@@ -5,20 +5,27 @@ Centralizes AI prompt management, provider abstraction, and structured outputs.
 """
 
 import os
+import json
 import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
 import structlog
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from jinja2 import TemplateSyntaxError
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
 
 from prompt_manager import PromptManager
 from ai_providers import AIProviderManager
-from schemas import AIRequest, AIResponse, PromptTemplate
+from context_registry import ContextRegistry
+from batching import BatchProcessor
+from streaming import StreamingJSONParser, sse_event
+from images import ImageInput, load_blob
+from schemas import AIRequest, AIResponse, BatchRequest, BatchResponse, PromptTemplate
 
 # Configure structured logging
 structlog.configure(
@@ -55,6 +62,8 @@ app.add_middleware(
 # Global managers
 prompt_manager = PromptManager()
 ai_provider_manager = AIProviderManager()
+context_registry = ContextRegistry(int(os.environ.get("MCP_MAX_CONTEXTS", 64)))
+batch_processor = BatchProcessor(prompt_manager, ai_provider_manager)
 
 class HealthResponse(BaseModel):
     status: str
@@ -74,35 +83,92 @@ async def health_check():
         providers=provider_status
     )
 
+def resolve_context(context_id: Optional[str], context: Dict[str, Any]) -> Dict[str, Any]:
+    """Request context merged over a registered context; 409 when the context is unknown"""
+    if not context_id:
+        return context
+    registered = context_registry.get(context_id)
+    if registered is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Unknown context '{context_id}'; register it with PUT /contexts/{context_id}"
+        )
+    # Request context entries override the registered ones
+    return {**registered, **context}
+
+async def request_image(request: AIRequest) -> Optional[ImageInput]:
+    """Image of a JSON request: inline base64 (image_data) or a shared blob (image_ref)"""
+    try:
+        if request.image_ref:
+            return await load_blob(request.image_ref)
+        if request.image_data:
+            return ImageInput.from_encoded(request.image_data)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return None
+
+async def upload_request(request: str, image: Optional[UploadFile]) -> Tuple[AIRequest, Optional[ImageInput]]:
+    """AIRequest (JSON form field) and image (raw file part) of a multipart request"""
+    try:
+        ai_request = AIRequest.model_validate_json(request)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    if image is None:
+        return ai_request, await request_image(ai_request)
+    try:
+        return ai_request, ImageInput.from_bytes(await image.read(), image.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/ai/process", response_model=AIResponse)
 async def process_ai_request(request: AIRequest):
     """
     Main AI processing endpoint.
     Handles prompt templating, provider selection, and structured output.
     """
+    return await run_ai_request(request, await request_image(request))
+
+@app.post("/ai/process/upload", response_model=AIResponse)
+async def process_ai_upload(request: str = Form(...), image: Optional[UploadFile] = File(None)):
+    """
+    /ai/process as a multipart request: the AIRequest as JSON in the 'request'
+    field and the image as raw bytes in the 'image' file part, so it is neither
+    base64-encoded on the way nor decoded here.
+    """
+    ai_request, image_input = await upload_request(request, image)
+    return await run_ai_request(ai_request, image_input)
+
+async def run_ai_request(request: AIRequest, image: Optional[ImageInput]) -> AIResponse:
+    """Render the request's prompt and run it through the provider manager"""
+    context = resolve_context(request.context_id, request.context)
+    
     try:
         logger.info(
             "Processing AI request",
             prompt_type=request.prompt_type,
             provider=request.provider,
-            has_image=bool(request.image_data)
+            has_image=image is not None
         )
         
         # Get and render the prompt template
         prompt_template = await prompt_manager.get_template(request.prompt_type)
         rendered_prompt = await prompt_manager.render_prompt(
             prompt_template,
-            request.context
+            context
         )
         
         # Process with selected AI provider
         result = await ai_provider_manager.process_request(
             provider=request.provider,
             prompt=rendered_prompt,
-            image_data=request.image_data,
+            image_data=image,
             schema=request.output_schema,
             max_tokens=request.max_tokens,
-            temperature=request.temperature
+            temperature=request.temperature,
+            prompt_type=request.prompt_type.value,
+            priority=request.priority
         )
         
         logger.info(
@@ -123,6 +189,117 @@ async def process_ai_request(request: AIRequest):
         )
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ai/stream")
+async def stream_ai_request(request: AIRequest):
+    """
+    Streaming variant of /ai/process, as server-sent events.
+    
+    Events: 'started' (provider), 'field' for every top-level field of the answer
+    as soon as it is complete, 'item' for every completed element of an array
+    field such as line_items, then 'complete' with the full AIResponse, or
+    'error'.
+    """
+    return await stream_ai_response(request, await request_image(request))
+
+@app.post("/ai/stream/upload")
+async def stream_ai_upload(request: str = Form(...), image: Optional[UploadFile] = File(None)):
+    """/ai/stream as a multipart request, like /ai/process/upload"""
+    ai_request, image_input = await upload_request(request, image)
+    return await stream_ai_response(ai_request, image_input)
+
+async def stream_ai_response(request: AIRequest, image: Optional[ImageInput]) -> StreamingResponse:
+    """Server-sent events of a streamed AI request"""
+    context = resolve_context(request.context_id, request.context)
+    try:
+        prompt_template = await prompt_manager.get_template(request.prompt_type)
+        rendered_prompt = await prompt_manager.render_prompt(prompt_template, context)
+    except Exception as e:
+        logger.error("Error preparing AI stream", error=str(e), prompt_type=request.prompt_type)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        parser = StreamingJSONParser()
+        try:
+            async for kind, value in ai_provider_manager.stream_request(
+                provider=request.provider,
+                prompt=rendered_prompt,
+                image_data=image,
+                schema=request.output_schema,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                prompt_type=request.prompt_type.value,
+                priority=request.priority
+            ):
+                if kind == "text":
+                    for event, data in parser.feed(value):
+                        yield sse_event(event, data)
+                elif kind == "started":
+                    yield sse_event("started", {"provider": value})
+                elif kind == "result":
+                    # Parsed by the stream parser, which tolerates text around the JSON
+                    result = value.model_copy(update={"content": parser.document()})
+                    yield sse_event("complete", result.model_dump(mode="json"))
+        except Exception as e:
+            logger.error(
+                "Error streaming AI request",
+                error=str(e),
+                prompt_type=request.prompt_type,
+                provider=request.provider
+            )
+            yield sse_event("error", {"error": str(e)})
+    
+    logger.info(
+        "Streaming AI request",
+        prompt_type=request.prompt_type,
+        provider=request.provider,
+        has_image=image is not None
+    )
+    # No proxy buffering, so events reach the client as they are produced
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/ai/batch", response_model=BatchResponse)
+async def process_batch(request: BatchRequest):
+    """
+    Category suggestions for many items, packed into as few provider calls as the
+    token budgets allow. Items whose output fails validation are retried in smaller
+    calls; each result says whether its item succeeded.
+    """
+    context = resolve_context(request.context_id, request.context)
+    
+    try:
+        logger.info(
+            "Processing AI batch",
+            prompt_type=request.prompt_type,
+            provider=request.provider,
+            items=len(request.items)
+        )
+        return await batch_processor.process(request, context)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(
+            "Error processing AI batch",
+            error=str(e),
+            prompt_type=request.prompt_type,
+            provider=request.provider
+        )
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/contexts/{context_id}")
+async def register_context(context_id: str, context: Dict[str, Any]):
+    """Register a shared context that AI requests can reference by context_id"""
+    context_registry.register(context_id, context)
+    return {"context_id": context_id, "registered": True}
+
+@app.get("/contexts/{context_id}")
+async def get_context(context_id: str):
+    """Get a registered context"""
+    context = context_registry.get(context_id)
+    if context is None:
+        raise HTTPException(status_code=404, detail=f"Context '{context_id}' not registered")
+    return context
+
 @app.get("/prompts/templates")
 async def list_prompt_templates():
     """List all available prompt templates"""
@@ -140,7 +317,10 @@ async def get_prompt_template(template_name: str):
 @app.post("/prompts/templates/{template_name}")
 async def update_prompt_template(template_name: str, template: PromptTemplate):
     """Update or create a prompt template"""
-    await prompt_manager.save_template(template_name, template)
+    try:
+        await prompt_manager.save_template(template_name, template)
+    except TemplateSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Jinja2 syntax error: {e}")
     return {"message": f"Template '{template_name}' updated successfully"}
 
 @app.get("/providers")
@@ -160,7 +340,15 @@ async def test_provider(provider_name: str):
 @app.get("/metrics")
 async def get_metrics():
     """Get usage metrics and statistics"""
-    return await ai_provider_manager.get_metrics()
+    metrics = await ai_provider_manager.get_metrics()
+    metrics["prompt_templates"] = prompt_manager.render_metrics()
+    return metrics
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Usage metrics in the Prometheus text exposition format"""
+    text = ai_provider_manager.prometheus_metrics() + "\n".join(prompt_manager.prometheus_lines()) + "\n"
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
 # Specialized endpoints for common Homebase tasks
 
@@ -234,6 +422,7 @@ async def startup_event():
     
     # Initialize prompt manager
     await prompt_manager.initialize()
+    prompt_manager.start_watching()
     logger.info("Prompt manager initialized")
     
     # Initialize AI providers
@@ -244,6 +433,7 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down MCP Server")
+    await prompt_manager.stop_watching()
     await ai_provider_manager.cleanup()
 
 if __name__ == "__main__":
@@ -0,0 +1,272 @@
+"""
+Usage and latency metrics for the MCP server.
+
+Provider calls are counted per provider, model and prompt type. Latencies go into
+log-bucketed histograms: each bucket is 25% wider than the previous one, so memory
+is fixed (about 50 counters per series) no matter how many requests are recorded,
+and any percentile is known to within half a bucket's width. The same numbers are
+available as JSON (snapshot) and in the Prometheus text format (prometheus_text).
+"""
+
+import math
+import bisect
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, List
+
+# Histogram range and resolution, in seconds
+LATENCY_MIN = 0.01
+LATENCY_MAX = 900.0
+LATENCY_GROWTH = 1.25
+
+# Bucket bounds exposed to Prometheus, snapped to the histogram's own (a subset keeps
+# the exposition small)
+PROMETHEUS_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def _labels(**values) -> str:
+    """Prometheus label set"""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in values.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(values, escaped)) + "}"
+
+
+def counter_text(name: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Exposition lines of one Prometheus counter, from (labels, value) samples"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines.extend(f"{name}{_labels(**sample_labels)} {value}" for sample_labels, value in samples)
+    return lines
+
+
+def histogram_text(name: str, help_text: str, series: List[Tuple[Dict[str, str], "LogHistogram"]],
+                   bounds) -> List[str]:
+    """
+    Exposition lines of one Prometheus histogram.
+
+    Args:
+        name: Metric name
+        help_text: HELP text
+        series: (labels, histogram) per series
+        bounds: Bucket bounds to expose, snapped to each histogram's own
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for series_labels, histogram in series:
+        for bound, count in histogram.cumulative(bounds):
+            lines.append(f"{name}_bucket{_labels(**series_labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**series_labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**series_labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(**series_labels)} {histogram.count}")
+    return lines
+
+
+class LogHistogram:
+    """Fixed-size histogram with logarithmically growing buckets"""
+
+    def __init__(self, minimum: float = LATENCY_MIN, maximum: float = LATENCY_MAX,
+                 growth: float = LATENCY_GROWTH):
+        self.minimum = minimum
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        # Bucket i holds values up to minimum * growth**i; the last one everything above
+        size = int(math.ceil(math.log(maximum / minimum) / self._log_growth)) + 1
+        self.bounds = [minimum * growth ** i for i in range(size)]
+        self.counts = [0] * (size + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        if value <= self.minimum:
+            return 0
+        return min(int(math.ceil(math.log(value / self.minimum) / self._log_growth - 1e-9)), len(self.bounds))
+
+    def record(self, value: float):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate of the q-quantile: the geometric middle of the bucket holding it
+        (within about 12% for the default growth), capped at the largest value seen
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if index >= len(self.bounds):
+                    return self.max
+                middle = self.bounds[index] / math.sqrt(self.growth) if index else self.bounds[0]
+                return min(middle, self.max)
+        return self.max
+
+    def cumulative(self, bounds) -> List[Tuple[float, int]]:
+        """
+        Counts of values at or below each bound. Each bound is snapped down to the
+        nearest bucket boundary, so the counts are exact for the bounds returned.
+        """
+        result = []
+        for bound in bounds:
+            index = bisect.bisect_right(self.bounds, bound * (1 + 1e-9)) - 1
+            if index < 0:
+                continue
+            snapped = round(self.bounds[index], 6)
+            if result and result[-1][0] == snapped:
+                continue
+            result.append((snapped, sum(self.counts[:index + 1])))
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.count else None
+        }
+
+
+class SeriesMetrics:
+    """Counters and latency histogram of one provider, model and prompt type"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self.latency = LogHistogram()
+
+
+class MetricsRegistry:
+    """Provider call metrics keyed by (provider, model, prompt type)"""
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self.series: Dict[Tuple[str, str, str], SeriesMetrics] = {}
+        self.coalesced: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: Optional[str], prompt_type: Optional[str], status: str,
+               processing_time: float, tokens_used: Optional[int] = None, cost: Optional[float] = None):
+        """Record one provider call"""
+        key = (provider, model or "default", prompt_type or "unknown")
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = SeriesMetrics()
+            series.requests += 1
+            if status == "error":
+                series.errors += 1
+            series.tokens += tokens_used or 0
+            series.cost += cost or 0.0
+            series.latency.record(processing_time)
+
+    def record_coalesced(self, provider: str):
+        """Record a request that shared another request's provider call"""
+        with self._lock:
+            self.coalesced[provider] = self.coalesced.get(provider, 0) + 1
+
+    def _totals(self, index: int) -> Dict[str, Dict[str, Any]]:
+        """Counters and a merged histogram per provider (index 0) or prompt type (index 2)"""
+        totals = {}
+        for key, series in self.series.items():
+            total = totals.setdefault(key[index], {"requests": 0, "errors": 0, "tokens": 0, "cost": 0.0,
+                                                   "latency": LogHistogram()})
+            total["requests"] += series.requests
+            total["errors"] += series.errors
+            total["tokens"] += series.tokens
+            total["cost"] += series.cost
+            histogram = total["latency"]
+            histogram.counts = [a + b for a, b in zip(histogram.counts, series.latency.counts)]
+            histogram.count += series.latency.count
+            histogram.sum += series.latency.sum
+            histogram.max = max(histogram.max, series.latency.max)
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Metrics as JSON, with the UsageMetrics fields at the top level"""
+        with self._lock:
+            by_provider = self._totals(0)
+            by_type = self._totals(2)
+            series = [
+                {
+                    "provider": provider,
+                    "model": model,
+                    "prompt_type": prompt_type,
+                    "requests": metrics.requests,
+                    "errors": metrics.errors,
+                    "tokens": metrics.tokens,
+                    "cost": round(metrics.cost, 6),
+                    "latency": metrics.latency.summary()
+                }
+                for (provider, model, prompt_type), metrics in sorted(self.series.items())
+            ]
+            coalesced = dict(self.coalesced)
+
+        total_requests = sum(total["requests"] for total in by_provider.values())
+        total_errors = sum(total["errors"] for total in by_provider.values())
+        latency_sum = sum(total["latency"].sum for total in by_provider.values())
+        return {
+            "total_requests": total_requests,
+            "requests_by_provider": {name: total["requests"] for name, total in by_provider.items()},
+            "requests_by_type": {name: total["requests"] for name, total in by_type.items()},
+            "average_response_time": latency_sum / total_requests if total_requests else 0.0,
+            "error_rate": total_errors / total_requests if total_requests else 0.0,
+            "errors": {name: total["errors"] for name, total in by_provider.items()},
+            "tokens": {name: total["tokens"] for name, total in by_provider.items()},
+            "cost_total": round(sum(total["cost"] for total in by_provider.values()), 6),
+            "cost_by_provider": {name: round(total["cost"], 6) for name, total in by_provider.items()},
+            "response_times": {name: total["latency"].summary() for name, total in by_provider.items()},
+            "coalesced_requests": sum(coalesced.values()),
+            "coalesced_by_provider": coalesced,
+            "series": series,
+            "period_start": self.started_at,
+            "period_end": datetime.utcnow()
+        }
+
+    def prometheus_text(self, gauges: Optional[Dict[str, List[Tuple[Dict[str, str], float]]]] = None) -> str:
+        """
+        Metrics in the Prometheus text exposition format.
+
+        Args:
+            gauges: Extra gauges, {name: [(labels, value), ...]}, e.g. in-flight requests
+        """
+        lines = []
+
+        def counter(name, help_text, samples):
+            lines.extend(counter_text(name, help_text, samples))
+
+        with self._lock:
+            items = sorted(self.series.items())
+            coalesced = sorted(self.coalesced.items())
+
+            def series_samples(attribute):
+                return [({"provider": p, "model": m, "prompt_type": t}, getattr(s, attribute))
+                        for (p, m, t), s in items]
+
+            counter("mcp_ai_requests_total", "Provider calls", series_samples("requests"))
+            counter("mcp_ai_errors_total", "Failed provider calls", series_samples("errors"))
+            counter("mcp_ai_tokens_total", "Tokens used by provider calls", series_samples("tokens"))
+            counter("mcp_ai_cost_dollars_total", "Estimated cost of provider calls", series_samples("cost"))
+            counter("mcp_ai_coalesced_requests_total", "Requests that shared an identical in-flight call",
+                    [({"provider": provider}, count) for provider, count in coalesced])
+
+            lines.extend(histogram_text(
+                "mcp_ai_request_duration_seconds",
+                "Provider call latency",
+                [({"provider": p, "model": m, "prompt_type": t}, series.latency) for (p, m, t), series in items],
+                PROMETHEUS_BUCKETS
+            ))
+
+        for name, samples in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            for sample_labels, value in samples:
+                lines.append(f"{name}{_labels(**sample_labels)} {value}")
+
+        return "\n".join(lines) + "\n"
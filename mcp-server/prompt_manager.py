@@ -1,21 +1,56 @@
 """
 Prompt Manager for MCP Server
 Handles loading, rendering, and managing AI prompt templates
+
+Templates are compiled once and cached under their name and a hash of their
+content, so a render only runs the compiled template. A polling watcher picks up
+edited, added and removed template files while the server runs: a changed file is
+parsed, validated and compiled before it replaces the cached version, so a broken
+edit is logged and the previous version keeps serving.
 """
 
 import os
+import time
 import asyncio
+import hashlib
 import aiofiles
 import yaml
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound
 import structlog
 
+from metrics import LogHistogram, counter_text, histogram_text
 from schemas import PromptTemplate
 
 logger = structlog.get_logger()
 
+# Watch the templates directory for changes, and how often to look (seconds)
+WATCH_TEMPLATES = os.environ.get("MCP_PROMPT_WATCH", "true").lower() == "true"
+WATCH_INTERVAL = float(os.environ.get("MCP_PROMPT_POLL_INTERVAL", 2))
+
+# Render time histogram range, in seconds
+RENDER_TIME_MIN = 0.00001
+RENDER_TIME_MAX = 10.0
+
+# Bucket bounds of render times exposed to Prometheus
+RENDER_PROMETHEUS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+def content_hash(content: str) -> str:
+    """Hash identifying a template's content"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class TemplateStats:
+    """Render count, compile count and render time histogram of one template"""
+
+    def __init__(self):
+        self.renders = 0
+        self.compiles = 0
+        self.render_time = LogHistogram(minimum=RENDER_TIME_MIN, maximum=RENDER_TIME_MAX)
+
+
 class PromptManager:
     """Manages AI prompt templates with Jinja2 templating"""
     
@@ -24,6 +59,12 @@ class PromptManager:
         self.templates_dir = self.prompts_dir / "templates"
         self.jinja_env = None
         self.templates_cache = {}
+        # Compiled templates: name -> (content hash, compiled template)
+        self.compiled_cache: Dict[str, Tuple[str, Template]] = {}
+        self.template_stats: Dict[str, TemplateStats] = {}
+        # Template files as last seen by the watcher: name -> (mtime, size)
+        self._file_state: Dict[str, Tuple[int, int]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
         
     async def initialize(self):
         """Initialize the prompt manager"""
@@ -417,20 +458,52 @@ Return structured analysis as JSON.""",
                 logger.info(f"Created default template: {template_name}")
     
     async def _load_templates(self):
-        """Load all templates from the templates directory"""
+        """Load and compile all templates from the templates directory"""
         self.templates_cache.clear()
+        self.compiled_cache.clear()
+        self._file_state = self._scan_files()
         
-        if not self.templates_dir.exists():
-            return
-            
-        for template_file in self.templates_dir.glob("*.yaml"):
+        for template_name in self._file_state:
             try:
-                template_name = template_file.stem
                 template = await self._load_template_file(template_name)
                 self.templates_cache[template_name] = template
+                self._compile(template)
                 logger.debug(f"Loaded template: {template_name}")
             except Exception as e:
-                logger.error(f"Error loading template {template_file}: {e}")
+                logger.error(f"Error loading template {template_name}: {e}")
+    
+    def _scan_files(self) -> Dict[str, Tuple[int, int]]:
+        """Modification time and size of every template file"""
+        state = {}
+        if not self.templates_dir.exists():
+            return state
+        for template_file in self.templates_dir.glob("*.yaml"):
+            try:
+                stat = template_file.stat()
+            except FileNotFoundError:
+                continue
+            state[template_file.stem] = (stat.st_mtime_ns, stat.st_size)
+        return state
+    
+    def _stats(self, template_name: str) -> TemplateStats:
+        stats = self.template_stats.get(template_name)
+        if stats is None:
+            stats = self.template_stats[template_name] = TemplateStats()
+        return stats
+    
+    def _compile(self, template: PromptTemplate) -> Template:
+        """
+        Compiled form of a template, compiling only when its content has changed
+        since it was last compiled.
+        """
+        digest = content_hash(template.content)
+        cached = self.compiled_cache.get(template.name)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        compiled = self.jinja_env.from_string(template.content)
+        self.compiled_cache[template.name] = (digest, compiled)
+        self._stats(template.name).compiles += 1
+        return compiled
     
     async def _load_template_file(self, template_name: str) -> PromptTemplate:
         """Load a template from file"""
@@ -482,15 +555,26 @@ Return structured analysis as JSON.""",
     
     async def save_template(self, template_name: str, template: PromptTemplate):
         """Save or update a template"""
+        compiled = self.jinja_env.from_string(template.content)
         await self._save_template_file(template_name, template)
         self.templates_cache[template_name] = template
+        self.compiled_cache[template.name] = (content_hash(template.content), compiled)
+        self._stats(template.name).compiles += 1
+        # The watcher need not reload the file we just wrote
+        state = self._scan_files().get(template_name)
+        if state is not None:
+            self._file_state[template_name] = state
         logger.info(f"Saved template: {template_name}")
     
     async def render_prompt(self, template: PromptTemplate, context: Dict[str, Any]) -> str:
         """Render a prompt template with the given context"""
         try:
-            jinja_template = self.jinja_env.from_string(template.content)
+            jinja_template = self._compile(template)
+            start_time = time.perf_counter()
             rendered = jinja_template.render(**context)
+            stats = self._stats(template.name)
+            stats.renders += 1
+            stats.render_time.record(time.perf_counter() - start_time)
             
             logger.debug(
                 "Rendered prompt template",
@@ -554,4 +638,100 @@ Return structured analysis as JSON.""",
     async def reload_templates(self):
         """Reload all templates from disk"""
         await self._load_templates()
-        logger.info("Reloaded all templates") 
\ No newline at end of file
+        logger.info("Reloaded all templates")
+    
+    async def check_for_changes(self) -> Dict[str, List[str]]:
+        """
+        Reload template files added, changed or removed since the last check.
+        
+        A changed file is loaded, validated and compiled before it replaces the
+        cached template; if any step fails the previous version stays in use and
+        the file is tried again once it changes.
+        
+        Returns:
+            dict: {'reloaded': [names], 'removed': [names], 'failed': [names]}
+        """
+        current = self._scan_files()
+        changes = {"reloaded": [], "removed": [], "failed": []}
+        
+        for template_name, state in current.items():
+            if self._file_state.get(template_name) == state:
+                continue
+            self._file_state[template_name] = state
+            try:
+                template = await self._load_template_file(template_name)
+                validation = await self.validate_template(template)
+                if not validation["valid"]:
+                    raise ValueError("; ".join(validation["issues"]))
+                compiled = self.jinja_env.from_string(template.content)
+            except Exception as e:
+                changes["failed"].append(template_name)
+                logger.error("Template change rejected, keeping the previous version",
+                             template_name=template_name, error=str(e))
+                continue
+            
+            # Swap in the template and its compiled form together
+            self.templates_cache[template_name] = template
+            self.compiled_cache[template.name] = (content_hash(template.content), compiled)
+            self._stats(template.name).compiles += 1
+            changes["reloaded"].append(template_name)
+            logger.info("Reloaded changed template", template_name=template_name)
+        
+        for template_name in set(self._file_state) - set(current):
+            del self._file_state[template_name]
+            self.templates_cache.pop(template_name, None)
+            self.compiled_cache.pop(template_name, None)
+            changes["removed"].append(template_name)
+            logger.info("Removed deleted template", template_name=template_name)
+        
+        return changes
+    
+    def start_watching(self, interval: float = WATCH_INTERVAL):
+        """Start polling the templates directory for changes"""
+        if not WATCH_TEMPLATES or self._watch_task is not None:
+            return
+        self._watch_task = asyncio.create_task(self._watch(interval))
+        logger.info("Watching prompt templates for changes", interval=interval)
+    
+    async def stop_watching(self):
+        """Stop polling the templates directory"""
+        if self._watch_task is None:
+            return
+        self._watch_task.cancel()
+        try:
+            await self._watch_task
+        except asyncio.CancelledError:
+            pass
+        self._watch_task = None
+    
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_for_changes()
+            except Exception as e:
+                logger.error(f"Error checking templates for changes: {e}")
+    
+    def render_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Render and compile counts and render times per template"""
+        return {
+            name: {
+                "renders": stats.renders,
+                "compiles": stats.compiles,
+                "render_time": stats.render_time.summary()
+            }
+            for name, stats in sorted(self.template_stats.items())
+        }
+    
+    def prometheus_lines(self) -> List[str]:
+        """Render metrics in the Prometheus text exposition format"""
+        items = sorted(self.template_stats.items())
+        lines = counter_text("mcp_prompt_compiles_total", "Template compilations",
+                             [({"template": name}, stats.compiles) for name, stats in items])
+        lines.extend(histogram_text(
+            "mcp_prompt_render_duration_seconds",
+            "Prompt template render time",
+            [({"template": name}, stats.render_time) for name, stats in items],
+            RENDER_PROMETHEUS_BUCKETS
+        ))
+        return lines 
\ No newline at end of file
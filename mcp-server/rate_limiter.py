@@ -0,0 +1,322 @@
+"""
+Rate limiting for AI provider calls.
+
+Every provider and model gets a ProviderLimiter combining:
+
+- token buckets for requests per minute and tokens per minute, configured from
+  MCP_RATE_LIMITS and re-synced from the rate limit headers the provider returns
+- an AIMD concurrency limit: it grows by one slot per window of successful calls
+  and halves on a 429, so bulk work backs off on its own instead of retrying blindly
+- a wait queue ordered by request priority (lower numbers first), so interactive
+  requests overtake bulk re-evaluations when the limit is reached
+
+Everything awaits instead of sleeping a thread, so waiting requests cost nothing
+but a coroutine.
+"""
+
+import os
+import re
+import time
+import json
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Configured limits by "provider" or "provider:model", e.g.
+# {"openai": {"rpm": 500, "tpm": 30000}, "claude:claude-3-5-sonnet-20241022": {"rpm": 50}}
+RATE_LIMITS = json.loads(os.environ.get("MCP_RATE_LIMITS", "{}"))
+
+# Concurrency limits per provider and model (the AIMD limit moves between these)
+MIN_CONCURRENCY = 1
+INITIAL_CONCURRENCY = int(os.environ.get("MCP_INITIAL_CONCURRENCY", 4))
+MAX_CONCURRENCY = int(os.environ.get("MCP_MAX_CONCURRENCY", 16))
+
+# Multiplicative decrease applied to the concurrency limit on a 429
+BACKOFF_FACTOR = 0.5
+
+# Pause used after a 429 that does not say when to retry
+DEFAULT_RETRY_AFTER = 5.0
+
+DEFAULT_PRIORITY = 5
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds until a rate limit resets, from a header value.
+
+    Accepts plain seconds ("20", "0.5"), Go-style durations ("6m0s", "250ms")
+    as sent by OpenAI, and RFC 3339 timestamps as sent by Anthropic.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if reset_at.tzinfo is None:
+            reset_at = reset_at.replace(tzinfo=timezone.utc)
+        return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except ValueError:
+        return None
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def rate_limit_headers(headers) -> Dict[str, Dict[str, Any]]:
+    """
+    Request and token limits reported by OpenAI or Anthropic response headers.
+
+    Returns:
+        dict: {'requests': {'limit', 'remaining', 'reset'}, 'tokens': {...}} with only
+              the kinds the headers reported
+    """
+    if headers is None:
+        return {}
+    limits = {}
+    for kind in ("requests", "tokens"):
+        # OpenAI: x-ratelimit-limit-requests; Anthropic: anthropic-ratelimit-requests-limit
+        limit = _header_int(headers, f"x-ratelimit-limit-{kind}")
+        if limit is not None:
+            remaining = _header_int(headers, f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+        else:
+            limit = _header_int(headers, f"anthropic-ratelimit-{kind}-limit")
+            remaining = _header_int(headers, f"anthropic-ratelimit-{kind}-remaining")
+            reset = parse_reset(headers.get(f"anthropic-ratelimit-{kind}-reset"))
+        if limit is not None:
+            limits[kind] = {"limit": limit, "remaining": remaining, "reset": reset}
+    return limits
+
+
+def is_throttled(error: Exception) -> bool:
+    """True when a provider error is a 429 rate limit response"""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status == 429
+
+
+def retry_after(error: Exception) -> float:
+    """Seconds a throttled provider asked us to wait"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after", "x-ratelimit-reset-requests", "anthropic-ratelimit-requests-reset"):
+        seconds = parse_reset(headers.get(name))
+        if seconds is not None:
+            return seconds
+    return DEFAULT_RETRY_AFTER
+
+
+class TokenBucket:
+    """Per-minute budget refilled continuously; unlimited until a limit is known"""
+
+    def __init__(self, per_minute: Optional[float] = None):
+        self.per_minute = per_minute
+        self.available = float(per_minute) if per_minute else 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute:
+            self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until amount can be taken from the bucket, then take it"""
+        # One waiter at a time, so large requests are not starved by small ones
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.blocked_until > now:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if not self.per_minute:
+                    return
+                self._refill()
+                # A request larger than the whole bucket waits for a full bucket
+                needed = min(amount, self.per_minute)
+                if self.available >= needed:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((needed - self.available) * 60.0 / self.per_minute)
+
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) tokens after the fact"""
+        if self.per_minute:
+            self._refill()
+            self.available = min(self.per_minute, self.available + amount)
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], reset: Optional[float]):
+        """Adopt the limit and remaining budget the provider reported"""
+        if limit:
+            self.per_minute = float(limit)
+        if remaining is not None and self.per_minute:
+            self._refill()
+            self.available = min(self.available, float(remaining))
+            if remaining <= 0 and reset:
+                self.block(reset)
+
+    def block(self, seconds: float):
+        """Hand out nothing for the next seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase, multiplicative decrease and a priority queue"""
+
+    def __init__(self, initial: int = INITIAL_CONCURRENCY, minimum: int = MIN_CONCURRENCY,
+                 maximum: int = MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_use = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = DEFAULT_PRIORITY):
+        """Wait for a slot; lower priority numbers are served first"""
+        if self.in_use < int(self.limit) and not self.waiting:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as we were cancelled: pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """Return a slot and wake the most urgent waiters that now fit"""
+        self.in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_use < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+    def on_success(self):
+        """Additive increase: about one more slot per limit successful calls"""
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_throttle(self):
+        """Multiplicative decrease after a 429"""
+        self.limit = max(self.minimum, self.limit * BACKOFF_FACTOR)
+
+
+class ProviderLimiter:
+    """Concurrency, request and token limits of one provider model"""
+
+    def __init__(self, key: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        self.key = key
+        self.concurrency = AIMDLimiter(maximum=max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.throttled = 0
+
+    async def acquire(self, priority: int = DEFAULT_PRIORITY, estimated_tokens: int = 0):
+        """Wait for a concurrency slot, then for request and token budget"""
+        await self.concurrency.acquire(priority)
+        request_taken = False
+        try:
+            await self.requests.acquire(1)
+            request_taken = True
+            await self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            # Cancelled while waiting for tokens: the request was never sent
+            if request_taken:
+                self.requests.adjust(1)
+            self.concurrency.release()
+            raise
+
+    def success(self, estimated_tokens: int, tokens_used: Optional[int], rate_limits: Dict[str, Any]):
+        """Record a completed call: settle token use and adopt reported limits"""
+        if tokens_used is not None:
+            self.tokens.adjust(estimated_tokens - tokens_used)
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            reported = rate_limits.get(kind)
+            if reported:
+                bucket.sync(reported["limit"], reported["remaining"], reported["reset"])
+        self.concurrency.on_success()
+        self.concurrency.release()
+
+    def failure(self, error: BaseException, estimated_tokens: int = 0):
+        """Record a failed or cancelled call: refund its token reservation, back off on a 429"""
+        self.tokens.adjust(estimated_tokens)
+        if isinstance(error, Exception) and is_throttled(error):
+            self.throttled += 1
+            pause = retry_after(error)
+            self.requests.block(pause)
+            self.concurrency.on_throttle()
+            logger.warning("Provider throttled", limiter=self.key, retry_after=pause,
+                           concurrency_limit=self.concurrency.limit)
+        self.concurrency.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_use,
+            "waiting": self.concurrency.waiting,
+            "rpm": self.requests.per_minute,
+            "tpm": self.tokens.per_minute,
+            "throttled": self.throttled
+        }
+
+
+class RateLimiterRegistry:
+    """ProviderLimiters by provider and model, created on first use"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self._limiters: Dict[str, ProviderLimiter] = {}
+
+    def get(self, provider: str, model: Optional[str] = None) -> ProviderLimiter:
+        key = f"{provider}:{model}" if model else provider
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            config = {**self.limits.get(provider, {}), **self.limits.get(key, {})}
+            limiter = ProviderLimiter(
+                key,
+                rpm=config.get("rpm"),
+                tpm=config.get("tpm"),
+                max_concurrency=config.get("max_concurrency", MAX_CONCURRENCY)
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {key: limiter.snapshot() for key, limiter in self._limiters.items()}
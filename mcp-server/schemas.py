@@ -33,18 +33,13 @@ class AIRequest(BaseModel):
     prompt_type: PromptType
     provider: AIProvider = AIProvider.CLAUDE
     context: Dict[str, Any] = Field(default_factory=dict)
-    image_data: Optional[str] = None  # Base64 encoded image
+    context_id: Optional[str] = None  # Registered context merged under context
+    image_data: Optional[str] = None  # Base64 encoded image or data URL
+    image_ref: Optional[str] = None  # Image in the shared blob directory, by name
     output_schema: Optional[OutputSchema] = None
     max_tokens: Optional[int] = Field(default=1000, ge=1, le=4000)
     temperature: Optional[float] = Field(default=0.1, ge=0.0, le=2.0)
-    
-    @validator('image_data')
-    def validate_image_data(cls, v):
-        if v and not v.startswith('data:image/'):
-            # If it's just base64 without the data URI prefix, add it
-            if v.startswith('/9j/') or v.startswith('iVBORw0KGgo'):  # JPEG or PNG
-                return f"data:image/jpeg;base64,{v}"
-        return v
+    priority: int = Field(default=5, ge=0, le=9)  # Rate limit queue order, 0 = most urgent
 
 class AIResponse(BaseModel):
     """Response model for AI processing"""
@@ -56,6 +51,7 @@ class AIResponse(BaseModel):
     timestamp: datetime
     tokens_used: Optional[int] = None
     cost_estimate: Optional[float] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)  # How the response was produced
 
 class PromptTemplate(BaseModel):
     """Model for prompt templates"""
@@ -254,6 +250,51 @@ class CategorySuggestion(BaseModel):
     icon_suggestion: Optional[str] = None
     color_suggestion: Optional[str] = None
 
+class BatchItem(BaseModel):
+    """One item of a batch request"""
+    id: str
+    data: Dict[str, Any]  # Description, price, vendor etc. as shown to the AI
+
+class BatchRequest(BaseModel):
+    """Request model for batched category suggestions"""
+    prompt_type: PromptType = PromptType.CATEGORY_SUGGESTION
+    provider: AIProvider = AIProvider.CLAUDE
+    items: List[BatchItem] = Field(min_length=1, max_length=1000)
+    context: Dict[str, Any] = Field(default_factory=dict)  # Shared by all items
+    context_id: Optional[str] = None  # Registered context merged under context
+    max_suggestions: int = Field(default=3, ge=1, le=10)
+    tokens_per_item: int = Field(default=150, ge=20, le=1000)  # Output tokens reserved per item
+    max_items_per_call: Optional[int] = Field(default=None, ge=1)
+    max_attempts: int = Field(default=3, ge=1, le=5)
+    temperature: Optional[float] = Field(default=0.1, ge=0.0, le=2.0)
+    priority: int = Field(default=5, ge=0, le=9)
+
+    @validator('items')
+    def validate_unique_ids(cls, v):
+        ids = [item.id for item in v]
+        if len(set(ids)) != len(ids):
+            raise ValueError("item ids must be unique")
+        return v
+
+class BatchItemResult(BaseModel):
+    """Suggestions for one batch item, or why there are none"""
+    id: str
+    success: bool
+    suggestions: List[CategorySuggestion] = Field(default_factory=list)
+    error: Optional[str] = None
+    attempts: int
+    provider: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    """Response model for batched category suggestions"""
+    results: List[BatchItemResult]  # In request order
+    provider_calls: int
+    items_per_call: List[int]
+    processing_time: float
+    timestamp: datetime
+    tokens_used: int = 0
+    cost_estimate: float = 0.0
+
 class ProviderStatus(BaseModel):
     """Schema for provider status information"""
     name: str
@@ -512,5 +553,36 @@ OUTPUT_SCHEMAS = {
             "confidence": {"type": "number", "minimum": 0, "maximum": 1}
         },
         "required": ["name", "confidence"]
+    },
+    
+    "categories": {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string"},
+                        "suggestions": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "category": {"type": "string"},
+                                    "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                                    "reason": {"type": "string"},
+                                    "icon_suggestion": {"type": "string"},
+                                    "color_suggestion": {"type": "string"}
+                                },
+                                "required": ["category", "confidence", "reason"]
+                            }
+                        }
+                    },
+                    "required": ["id", "suggestions"]
+                }
+            }
+        },
+        "required": ["results"]
     }
 } 
\ No newline at end of file
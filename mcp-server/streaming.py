@@ -0,0 +1,169 @@
+"""
+Incremental parsing of streamed provider output.
+
+A receipt analysis takes tens of seconds, most of it spent generating the JSON
+answer. StreamingJSONParser is fed the text as the provider produces it and
+reports every top-level field of the answer object as soon as its value is
+complete (vendor_name, date, total_amount, ...) and, for array fields such as
+line_items, every element as soon as that element is complete. The caller relays
+these as server-sent events, so a client can render the header fields while line
+items are still arriving.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Top-level array fields reported element by element
+DEFAULT_ARRAY_FIELDS = ("line_items",)
+
+
+class StreamingJSONParser:
+    """
+    Reports completed parts of a JSON object that arrives in chunks.
+
+    Text before the opening brace (such as a ```json fence) and after the closing
+    brace is ignored.
+    """
+
+    def __init__(self, array_fields: Iterable[str] = DEFAULT_ARRAY_FIELDS):
+        self.array_fields = set(array_fields)
+        self.text = ""
+        self.start: Optional[int] = None  # Index of the opening brace
+        self.end: Optional[int] = None    # Index of the closing brace
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._state = "key"        # At the top level: key, colon, value_start or value
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._array_key: Optional[str] = None
+        self._element_start: Optional[int] = None
+        self._element_index = 0
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Add streamed text.
+
+        Returns:
+            list: New events, ('field', {'name', 'value'}) for completed top-level
+                  fields and ('item', {'field', 'index', 'value'}) for completed
+                  elements of array fields
+        """
+        events = []
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.end is not None:
+                break
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._state == "key":
+                        self._key = self._load(text[self._key_start:i + 1])
+                        self._state = "colon"
+                continue
+
+            if self._depth == 0:
+                if ch == "{":
+                    self.start = i
+                    self._depth = 1
+                continue
+            if ch.isspace():
+                continue
+
+            # First character of a top-level value or of an array element
+            if self._depth == 1 and self._state == "value_start":
+                self._value_start = i
+                self._state = "value"
+                if ch == "[" and self._key in self.array_fields:
+                    self._array_key = self._key
+                    self._element_start = None
+                    self._element_index = 0
+            elif self._depth == 2 and self._array_key is not None and self._element_start is None \
+                    and ch not in ",]":
+                self._element_start = i
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._state == "key":
+                    self._key_start = i
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 2 and self._array_key is not None:
+                    self._finish_element(i, events)
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_field(i, events)
+                    self.end = i
+            elif ch == ",":
+                if self._depth == 1:
+                    self._finish_field(i, events)
+                elif self._depth == 2 and self._array_key is not None:
+                    self._finish_element(i, events)
+            elif ch == ":" and self._depth == 1 and self._state == "colon":
+                self._state = "value_start"
+
+        self._pos = len(text)
+        return events
+
+    def document(self) -> Dict[str, Any]:
+        """
+        The whole answer, parsed.
+
+        Returns:
+            dict: The JSON object, or {'response': text} when the output was not a
+                  complete JSON object (as the providers return non-JSON output)
+        """
+        if self.start is not None and self.end is not None:
+            try:
+                parsed = json.loads(self.text[self.start:self.end + 1])
+                if isinstance(parsed, dict):
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+        return {"response": self.text}
+
+    def _finish_field(self, index: int, events: List[Tuple[str, Dict[str, Any]]]):
+        if self._state == "value" and self._key is not None and self._key not in self.array_fields:
+            value = self._load(self.text[self._value_start:index])
+            if value is not _INVALID:
+                events.append(("field", {"name": self._key, "value": value}))
+        self._state = "key"
+        self._key = None
+
+    def _finish_element(self, index: int, events: List[Tuple[str, Dict[str, Any]]]):
+        if self._element_start is not None:
+            value = self._load(self.text[self._element_start:index])
+            if value is not _INVALID:
+                events.append(("item", {"field": self._array_key, "index": self._element_index, "value": value}))
+            self._element_index += 1
+        self._element_start = None
+
+    @staticmethod
+    def _load(raw: str) -> Any:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return _INVALID
+
+
+_INVALID = object()
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -4,22 +4,44 @@ Integrates the main application with the MCP server for AI processing
 """
 
 import os
+import atexit
 import asyncio
+import threading
 import json
-import base64
-from typing import Dict, Any, Optional, List
+import uuid
+import mimetypes
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator, Iterator, Tuple
 import httpx
+from flask import has_app_context
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+
+def _write_blob(path: str, data: bytes):
+    """Write an image into the shared blob directory"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _remove_blob(path: str):
+    """Remove an image from the shared blob directory, ignoring failures"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 class MCPClient:
     """Client for communicating with the MCP (Model Context Protocol) server"""
     
     def __init__(self, mcp_url: str = None):
         self.mcp_url = mcp_url or os.environ.get("MCP_SERVER_URL", "http://localhost:8080")
         self.client = None
+        self.registered_contexts = set()  # Context IDs the MCP server already has
         
     async def __aenter__(self):
         self.client = httpx.AsyncClient(timeout=60.0)
@@ -34,6 +56,94 @@ class MCPClient:
         if not self.client:
             self.client = httpx.AsyncClient(timeout=60.0)
     
+    async def register_context(self, ai_context: Dict[str, Any], force: bool = False):
+        """
+        Register a context snapshot with the MCP server unless this client already did
+        
+        Args:
+            ai_context: Snapshot with 'context_id' and 'context'
+            force: Register even if this client registered it before
+        """
+        self._ensure_client()
+        context_id = ai_context['context_id']
+        if context_id in self.registered_contexts and not force:
+            return
+        response = await self.client.put(
+            f"{self.mcp_url}/contexts/{context_id}",
+            json=ai_context['context']
+        )
+        response.raise_for_status()
+        self.registered_contexts.add(context_id)
+        logger.info(f"Registered AI context {context_id} with MCP server")
+    
+    async def _post_with_context(self, path: str, request_data: Dict[str, Any],
+                                 ai_context: Optional[Dict[str, Any]],
+                                 image: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """
+        POST a request that references ai_context by its context_id, registering it as needed
+        
+        Args:
+            path: Endpoint path, e.g. /ai/process
+            request_data: Request body
+            ai_context: Snapshot the request references, or None
+            image: Image from _image_transport, or None
+        """
+        if ai_context is not None:
+            await self.register_context(ai_context)
+        url, options = self._request_options(path, request_data, image)
+        response = await self.client.post(url, **options)
+        if response.status_code == 409 and ai_context is not None:
+            # The MCP server lost the context (e.g. it restarted): register it again
+            await self.register_context(ai_context, force=True)
+            response = await self.client.post(url, **options)
+        return response
+    
+    @asynccontextmanager
+    async def _image_transport(self, image_data: Optional[bytes], filename: str = "image"):
+        """
+        How an image travels to the MCP server, as raw bytes rather than base64 JSON:
+        by name through MCP_SHARED_BLOB_DIR when both services share it (the file is
+        removed afterwards), otherwise as a multipart file part. Shared storage is
+        written and cleaned up in a worker thread, off the event loop.
+        
+        Yields:
+            dict: {'image_ref': name} or {'file': (filename, bytes, media type)},
+                  or None without an image
+        """
+        if not image_data:
+            yield None
+            return
+        
+        if MCP_SHARED_BLOB_DIR:
+            name = f"{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}"
+            path = os.path.join(MCP_SHARED_BLOB_DIR, name)
+            try:
+                await asyncio.to_thread(_write_blob, path, image_data)
+            except OSError as e:
+                logger.warning(f"Could not write image to shared storage, uploading it instead: {e}")
+            else:
+                try:
+                    yield {"image_ref": name}
+                finally:
+                    await asyncio.to_thread(_remove_blob, path)
+                return
+        
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        yield {"file": (filename, image_data, media_type)}
+    
+    def _request_options(self, path: str, request_data: Dict[str, Any],
+                         image: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """URL and httpx options of an AI request carrying image (see _image_transport)"""
+        if image is None:
+            return f"{self.mcp_url}{path}", {"json": request_data}
+        if "image_ref" in image:
+            return f"{self.mcp_url}{path}", {"json": {**request_data, "image_ref": image["image_ref"]}}
+        # The request as a JSON form field next to the raw image
+        return f"{self.mcp_url}{path}/upload", {
+            "data": {"request": json.dumps(request_data)},
+            "files": {"image": image["file"]}
+        }
+    
     async def health_check(self) -> Dict[str, Any]:
         """Check MCP server health"""
         self._ensure_client()
@@ -45,11 +155,75 @@ class MCPClient:
             logger.error(f"MCP health check failed: {e}")
             raise
     
+    def _receipt_request(
+        self,
+        filename: str,
+        provider: str,
+        ai_context: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Request body of a receipt analysis (for /ai/process and /ai/stream), without the image"""
+        # Existing object types and categories, by reference when we have a snapshot
+        if ai_context is None:
+            context_id = None
+            classification_context = {
+                "existing_object_types": self._get_default_object_types(),
+                "existing_categories": self._get_default_categories()
+            }
+        else:
+            context_id = ai_context['context_id']
+            classification_context = {}
+        
+        # Enhanced analysis request with comprehensive metadata extraction
+        request_data = {
+            "prompt_type": "receipt_analysis",
+            "provider": provider,
+            "context": {
+                "filename": filename,
+                "enhanced_extraction": True,
+                **classification_context,
+                "extract_metadata": {
+                    "upc_codes": True,
+                    "manufacturer": True,
+                    "model_numbers": True,
+                    "serial_numbers": True,
+                    "event_detection": True,
+                    "qr_codes": True,
+                    "digital_assets": True,
+                    "object_classification": True,
+                    "person_detection": True  # Explicitly enable person detection
+                },
+                "instructions": (
+                    "Perform comprehensive analysis of this receipt with enhanced metadata extraction using OpenAI's advanced vision capabilities. "
+                    "IMPORTANT: When QR codes or UPC/barcode codes are detected, crop and return the actual IMAGE of the code as base64 data. "
+                    "Use the provided object types and categories as context for classification. "
+                    "For EVERY line item, extract: UPC/barcode codes, manufacturer/brand, model numbers, serial numbers. "
+                    "For event tickets/passes: detect QR codes, confirmation codes, venue details, event dates. "
+                    "CROP AND RETURN QR CODE IMAGES: When QR codes are found, extract the actual image region and return as base64. "
+                    "CROP AND RETURN UPC/BARCODE IMAGES: When barcodes are found, extract the actual code image and return as base64. "
+                    "For assets: identify depreciation category, maintenance requirements, serial tracking needs. "
+                    "Classify each item using the provided object types: asset, consumable, component, service, software, person, pet. "
+                    "Use existing categories when possible, but suggest NEW categories if none fit. "
+                    "ALWAYS detect people mentioned in receipts (customers, staff, attendees, contacts). "
+                    "For event-related purchases, extract venue location, event date/time, ticket types. "
+                    "Include digital asset URLs, QR code data, confirmation codes, and any ticket images. "
+                    "Return cropped images for QR codes and UPC codes in the digital_assets section as: "
+                    "{'qr_code_image': 'base64_data', 'upc_code_image': 'base64_data', 'qr_code': 'text_data', 'upc_code': 'code_data'}. "
+                    "Suggest object creation for line items that represent physical or digital goods."
+                )
+            },
+            "output_schema": "receipt_data",
+            "max_tokens": 1500,
+            "temperature": 0.1,
+            "context_id": context_id
+        }
+        return request_data
+    
     async def analyze_receipt(
         self,
         image_data: bytes,
         filename: str,
-        provider: str = "claude"
+        provider: str = "claude",
+        ai_context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Analyze a receipt image and extract structured data with context from existing object types and categories
@@ -58,71 +232,20 @@ class MCPClient:
             image_data: Raw image bytes
             filename: Original filename for format detection
             provider: AI provider to use (claude, openai, llm_studio)
+            ai_context: Snapshot from ai_context.get_ai_context(); registered with the
+                        MCP server once and then referenced by its context_id.
+                        Bootstrap defaults are sent inline when omitted.
             
         Returns:
             Structured receipt data including digital assets like QR codes for event tickets
         """
         self._ensure_client()
         
-        # Convert image to base64
-        base64_data = base64.b64encode(image_data).decode('utf-8')
-        
-        # Get existing object types and categories context
-        object_types_context = await self._get_object_types_context()
-        categories_context = await self._get_categories_context()
+        request_data = self._receipt_request(filename, provider, ai_context)
         
         try:
-            # Enhanced analysis request with comprehensive metadata extraction
-            image_url = f"data:image/jpeg;base64,{base64_data}"
-            
-            request_data = {
-                "prompt_type": "receipt_analysis",
-                "provider": provider,
-                "image_data": image_url,
-                "context": {
-                    "filename": filename,
-                    "enhanced_extraction": True,
-                    "existing_object_types": object_types_context,
-                    "existing_categories": categories_context,
-                    "extract_metadata": {
-                        "upc_codes": True,
-                        "manufacturer": True,
-                        "model_numbers": True,
-                        "serial_numbers": True,
-                        "event_detection": True,
-                        "qr_codes": True,
-                        "digital_assets": True,
-                        "object_classification": True,
-                        "person_detection": True  # Explicitly enable person detection
-                    },
-                    "instructions": (
-                        "Perform comprehensive analysis of this receipt with enhanced metadata extraction using OpenAI's advanced vision capabilities. "
-                        "IMPORTANT: When QR codes or UPC/barcode codes are detected, crop and return the actual IMAGE of the code as base64 data. "
-                        "Use the provided object types and categories as context for classification. "
-                        "For EVERY line item, extract: UPC/barcode codes, manufacturer/brand, model numbers, serial numbers. "
-                        "For event tickets/passes: detect QR codes, confirmation codes, venue details, event dates. "
-                        "CROP AND RETURN QR CODE IMAGES: When QR codes are found, extract the actual image region and return as base64. "
-                        "CROP AND RETURN UPC/BARCODE IMAGES: When barcodes are found, extract the actual code image and return as base64. "
-                        "For assets: identify depreciation category, maintenance requirements, serial tracking needs. "
-                        "Classify each item using the provided object types: asset, consumable, component, service, software, person, pet. "
-                        "Use existing categories when possible, but suggest NEW categories if none fit. "
-                        "ALWAYS detect people mentioned in receipts (customers, staff, attendees, contacts). "
-                        "For event-related purchases, extract venue location, event date/time, ticket types. "
-                        "Include digital asset URLs, QR code data, confirmation codes, and any ticket images. "
-                        "Return cropped images for QR codes and UPC codes in the digital_assets section as: "
-                        "{'qr_code_image': 'base64_data', 'upc_code_image': 'base64_data', 'qr_code': 'text_data', 'upc_code': 'code_data'}. "
-                        "Suggest object creation for line items that represent physical or digital goods."
-                    )
-                },
-                "output_schema": "receipt_data",
-                "max_tokens": 1500,
-                "temperature": 0.1
-            }
-            
-            response = await self.client.post(
-                f"{self.mcp_url}/ai/process",
-                json=request_data
-            )
+            async with self._image_transport(image_data, filename) as image:
+                response = await self._post_with_context("/ai/process", request_data, ai_context, image)
             response.raise_for_status()
             result = response.json()
             
@@ -168,11 +291,64 @@ class MCPClient:
                 }
             }
     
+    async def stream_receipt(
+        self,
+        image_data: bytes,
+        filename: str,
+        provider: str = "claude",
+        ai_context: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Analyze a receipt image, yielding partial results as the AI produces them
+        
+        Args:
+            image_data: Raw image bytes
+            filename: Original filename for format detection
+            provider: AI provider to use (claude, openai, llm_studio)
+            ai_context: Snapshot from ai_context.get_ai_context(), sent by reference
+            
+        Yields:
+            (event, data) from the MCP server's /ai/stream: 'started', 'field'
+            ({'name', 'value'}), 'item' ({'field', 'index', 'value'}), then
+            'complete' (the same response analyze_receipt returns) or 'error'
+        """
+        self._ensure_client()
+        request_data = self._receipt_request(filename, provider, ai_context)
+        
+        if ai_context is not None:
+            await self.register_context(ai_context)
+        async with self._image_transport(image_data, filename) as image:
+            url, options = self._request_options("/ai/stream", request_data, image)
+            for attempt in range(2):
+                # Events may be far apart while the provider is busy with the image
+                async with self.client.stream("POST", url, **options,
+                                              timeout=httpx.Timeout(MCP_REQUEST_TIMEOUT, read=MCP_STREAM_TIMEOUT)) as response:
+                    if response.status_code == 409 and ai_context is not None and attempt == 0:
+                        # The MCP server lost the context (e.g. it restarted): register it again
+                        await response.aread()
+                        await self.register_context(ai_context, force=True)
+                        continue
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+                    
+                    event, data = None, []
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and event:
+                            yield event, json.loads("\n".join(data)) if data else None
+                            event, data = None, []
+                    return
+    
     async def categorize_object(
         self,
         object_data: Dict[str, Any],
         image_data: Optional[bytes] = None,
-        provider: str = "claude"
+        provider: str = "claude",
+        priority: int = 5
     ) -> Dict[str, Any]:
         """
         Categorize and analyze an object
@@ -181,33 +357,27 @@ class MCPClient:
             object_data: Object information
             image_data: Optional image of the object
             provider: AI provider to use
+            priority: Queue order when the provider is rate limited (0 = most urgent, 9 = bulk)
             
         Returns:
             Object analysis and categorization
         """
         self._ensure_client()
         
-        image_url = None
-        if image_data:
-            base64_data = base64.b64encode(image_data).decode('utf-8')
-            image_url = f"data:image/jpeg;base64,{base64_data}"
-        
         try:
             # Use the main AI processing endpoint with proper JSON structure
             request_data = {
                 "prompt_type": "object_categorization",
                 "provider": provider,
-                "image_data": image_url,
                 "context": {"object": object_data},
                 "output_schema": "object_analysis",
                 "max_tokens": 1000,
-                "temperature": 0.1
+                "temperature": 0.1,
+                "priority": priority
             }
             
-            response = await self.client.post(
-                f"{self.mcp_url}/ai/process",
-                json=request_data
-            )
+            async with self._image_transport(image_data) as image:
+                response = await self._post_with_context("/ai/process", request_data, None, image)
             response.raise_for_status()
             result = response.json()
             
@@ -218,6 +388,56 @@ class MCPClient:
             logger.error(f"Object categorization failed: {e}")
             raise
     
+    async def categorize_batch(
+        self,
+        items: List[Dict[str, Any]],
+        context: Optional[Dict[str, Any]] = None,
+        ai_context: Optional[Dict[str, Any]] = None,
+        provider: str = "claude",
+        max_suggestions: int = 3,
+        priority: int = 5
+    ) -> Dict[str, Any]:
+        """
+        Suggest categories for many line items or objects at once
+        
+        The MCP server packs the items into as few provider calls as its token
+        budgets allow and retries only the items whose output failed validation.
+        
+        Args:
+            items: [{'id': str, 'data': {...}}], e.g. data with description and price
+            context: Prompt context shared by all items (e.g. vendor)
+            ai_context: Snapshot from ai_context.get_ai_context(), sent by reference,
+                        so the AI prefers the existing categories
+            provider: AI provider to use
+            max_suggestions: Suggestions per item
+            priority: Queue order when the provider is rate limited (0 = most urgent, 9 = bulk)
+            
+        Returns:
+            Batch response: 'results' in item order, each with success, suggestions and error
+        """
+        self._ensure_client()
+        
+        request_data = {
+            "provider": provider,
+            "items": [{"id": str(item["id"]), "data": item["data"]} for item in items],
+            "context": context or {},
+            "context_id": ai_context['context_id'] if ai_context is not None else None,
+            "max_suggestions": max_suggestions,
+            "priority": priority
+        }
+        
+        try:
+            response = await self._post_with_context("/ai/batch", request_data, ai_context)
+            response.raise_for_status()
+            result = response.json()
+            
+            logger.info(f"Categorized {len(items)} items in {result.get('provider_calls')} calls with {provider}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Batch categorization failed: {e}")
+            raise
+    
     async def extract_vendor_info(
         self,
         image_data: bytes,
@@ -235,25 +455,19 @@ class MCPClient:
         """
         self._ensure_client()
         
-        base64_data = base64.b64encode(image_data).decode('utf-8')
-        image_url = f"data:image/jpeg;base64,{base64_data}"
-        
         try:
             # Use the main AI processing endpoint with proper JSON structure
             request_data = {
                 "prompt_type": "vendor_extraction",
                 "provider": provider,
-                "image_data": image_url,
                 "context": {},
                 "output_schema": "vendor_info",
                 "max_tokens": 1000,
                 "temperature": 0.1
             }
             
-            response = await self.client.post(
-                f"{self.mcp_url}/ai/process",
-                json=request_data
-            )
+            async with self._image_transport(image_data) as image:
+                response = await self._post_with_context("/ai/process", request_data, None, image)
             response.raise_for_status()
             result = response.json()
             
@@ -272,7 +486,8 @@ class MCPClient:
         image_data: Optional[bytes] = None,
         output_schema: Optional[str] = None,
         max_tokens: int = 1000,
-        temperature: float = 0.1
+        temperature: float = 0.1,
+        priority: int = 5
     ) -> Dict[str, Any]:
         """
         Generic AI request processing
@@ -285,32 +500,26 @@ class MCPClient:
             output_schema: Expected output schema
             max_tokens: Maximum tokens to generate
             temperature: Generation temperature
+            priority: Queue order when the provider is rate limited (0 = most urgent, 9 = bulk)
             
         Returns:
             AI response
         """
         self._ensure_client()
         
-        image_url = None
-        if image_data:
-            base64_data = base64.b64encode(image_data).decode('utf-8')
-            image_url = f"data:image/jpeg;base64,{base64_data}"
-        
         payload = {
             "prompt_type": prompt_type,
             "provider": provider,
             "context": context,
-            "image_data": image_url,
             "output_schema": output_schema,
             "max_tokens": max_tokens,
-            "temperature": temperature
+            "temperature": temperature,
+            "priority": priority
         }
         
         try:
-            response = await self.client.post(
-                f"{self.mcp_url}/ai/process",
-                json=payload
-            )
+            async with self._image_transport(image_data) as image:
+                response = await self._post_with_context("/ai/process", payload, None, image)
             response.raise_for_status()
             result = response.json()
             
@@ -321,6 +530,25 @@ class MCPClient:
             logger.error(f"AI request failed: {e}")
             raise
     
+    async def analyze_vendor_organization(
+        self,
+        vendor_name: str,
+        analysis_data: Dict[str, Any],
+        provider: str = "claude"
+    ) -> Dict[str, Any]:
+        """Suggest organizational details for a vendor from its receipt and transaction data"""
+        return await self.process_ai_request(
+            prompt_type="vendor_organization_analysis",
+            context={
+                "vendor_name": vendor_name,
+                "analysis_data": analysis_data
+            },
+            provider=provider,
+            output_schema="organization_details",
+            max_tokens=1500,
+            temperature=0.1
+        )
+    
     async def get_available_providers(self) -> List[Dict[str, Any]]:
         """Get list of available AI providers"""
         self._ensure_client()
@@ -397,31 +625,20 @@ class MCPClient:
         """
         self._ensure_client()
         
-        # Convert image to base64
-        base64_data = base64.b64encode(image_data).decode('utf-8')
-        
-        # Determine image format
-        if filename.lower().endswith('.png'):
-            image_url = f"data:image/png;base64,{base64_data}"
-        else:
-            image_url = f"data:image/jpeg;base64,{base64_data}"
-        
         try:
             # Use object categorization with enhanced context for valuation
             request_data = {
                 "prompt_type": "object_categorization",
                 "provider": provider,
-                "image_data": image_url,
                 "context": context or {},
                 "output_schema": "object_analysis",
                 "max_tokens": 1000,
                 "temperature": 0.1
             }
             
-            response = await self.client.post(
-                f"{self.mcp_url}/ai/process",
-                json=request_data
-            )
+            # The MCP server detects the image format from its bytes
+            async with self._image_transport(image_data, filename) as image:
+                response = await self._post_with_context("/ai/process", request_data, None, image)
             response.raise_for_status()
             result = response.json()
             
@@ -432,27 +649,6 @@ class MCPClient:
             logger.error(f"Object photo analysis failed: {e}")
             raise
 
-    async def _get_object_types_context(self) -> Dict[str, Any]:
-        """Get existing object types for AI context from API with sensible defaults as fallback"""
-        try:
-            # Try to get object types from our API
-            api_base = self.mcp_url.replace(':8080', ':5000')  # Convert MCP server URL to Flask app URL
-            response = await self.client.get(f"{api_base}/api/object-types")
-            
-            if response.status_code == 200:
-                api_result = response.json()
-                if api_result.get('success'):
-                    logger.debug("Retrieved object types from API")
-                    return api_result['object_types']
-            
-            # Fall back to defaults (helps bootstrap new installations)
-            logger.debug("Using default object types (API unavailable or returned no data)")
-            return self._get_default_object_types()
-            
-        except Exception as e:
-            logger.warning(f"Could not get object types from API: {e}, using defaults")
-            return self._get_default_object_types()
-    
     def _get_default_object_types(self) -> Dict[str, Any]:
         """Default object types for bootstrapping new installations"""
         return {
@@ -493,41 +689,6 @@ class MCPClient:
             }
         }
     
-    async def _get_categories_context(self) -> Dict[str, Any]:
-        """Get existing categories for AI context from API with sensible defaults as fallback"""
-        try:
-            # Try to get categories from our API
-            api_base = self.mcp_url.replace(':8080', ':5000')  # Convert MCP server URL to Flask app URL
-            response = await self.client.get(f"{api_base}/api/categories")
-            
-            if response.status_code == 200:
-                api_result = response.json()
-                if api_result.get('success'):
-                    # Convert API format to simplified format for AI context
-                    categories_by_type = api_result.get('categories_by_type', {})
-                    
-                    # Simplify to just lists of category names
-                    simplified_categories = {}
-                    for obj_type, categories in categories_by_type.items():
-                        simplified_categories[obj_type] = [cat['name'] for cat in categories]
-                    
-                    # Add common new suggestions for AI to consider
-                    simplified_categories['common_new_suggestions'] = [
-                        'Entertainment', 'Travel', 'Health', 'Education', 'Sports', 'Hobby',
-                        'Automotive', 'Home Improvement', 'Security', 'Communication'
-                    ]
-                    
-                    logger.debug(f"Retrieved {api_result.get('total_categories', 0)} categories from API")
-                    return simplified_categories
-            
-            # Fall back to defaults (helps bootstrap new installations)
-            logger.debug("Using default categories (API unavailable or returned no data)")
-            return self._get_default_categories()
-            
-        except Exception as e:
-            logger.warning(f"Could not get categories from API: {e}, using defaults")
-            return self._get_default_categories()
-    
     def _get_default_categories(self) -> Dict[str, Any]:
         """Default categories for bootstrapping new installations"""
         return {
@@ -619,7 +780,7 @@ async def analyze_receipt_async(
     filename: str,
     provider: str = "claude"
 ) -> Dict[str, Any]:
-    """Async wrapper for receipt analysis"""
+    """Async wrapper for receipt analysis (sends the bootstrap context)"""
     async with MCPClient() as client:
         return await client.analyze_receipt(image_data, filename, provider)
 
@@ -652,23 +813,223 @@ async def analyze_object_photo_async(
 
 # Utility functions for Flask integration
 
-def run_async_in_thread(coro):
-    """Run an async coroutine in a thread (for Flask integration)"""
-    import asyncio
-    import threading
-    from concurrent.futures import ThreadPoolExecutor
-    
-    def run_in_thread():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+# Connection pool of the process-wide client (see MCPRuntime)
+MCP_MAX_CONNECTIONS = int(os.environ.get("MCP_MAX_CONNECTIONS", 20))
+MCP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("MCP_MAX_KEEPALIVE_CONNECTIONS", 10))
+MCP_KEEPALIVE_EXPIRY = float(os.environ.get("MCP_KEEPALIVE_EXPIRY", 30.0))
+MCP_REQUEST_TIMEOUT = float(os.environ.get("MCP_REQUEST_TIMEOUT", 60.0))
+
+# Seconds to wait for each event of a streamed analysis
+MCP_STREAM_TIMEOUT = float(os.environ.get("MCP_STREAM_TIMEOUT", 120.0))
+
+# Directory shared with the MCP server (as mounted here); images are passed to
+# the MCP server by name through it instead of being uploaded
+MCP_SHARED_BLOB_DIR = os.environ.get("MCP_SHARED_BLOB_DIR")
+
+# Negotiate HTTP/2 with the MCP server (needs the h2 package and an https:// URL)
+MCP_HTTP2 = os.environ.get("MCP_HTTP2", "false").lower() in ("1", "true", "yes")
+
+
+def _http2_available() -> bool:
+    """True when httpx can speak HTTP/2 (the optional h2 package is installed)"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class MCPRuntime:
+    """
+    Process-wide MCP client running on one long-lived background event loop.
+
+    The loop thread owns a single MCPClient whose httpx.AsyncClient keeps a pool of
+    keep-alive connections to the MCP server, so sync callers (Flask request threads,
+    queue workers) reuse connections instead of paying for a new event loop, client
+    and TCP/TLS handshake on every call. Coroutines are handed to the loop with
+    submit(), which returns a concurrent.futures.Future usable from any thread.
+    """
+
+    def __init__(self, mcp_url: str = None):
+        self.mcp_url = mcp_url
+        self.client: Optional[MCPClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def start(self) -> "MCPRuntime":
+        """Start the loop thread and open the pooled client (idempotent)"""
+        with self._lock:
+            if self.running:
+                return self
+            # A runtime inherited across fork has no thread in this process
+            self._loop = None
+            self._thread = None
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run_loop, name="mcp-client-loop", daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+            self.client = asyncio.run_coroutine_threadsafe(self._open_client(), loop).result()
+            logger.info(f"MCP client runtime started for {self.client.mcp_url}")
+            return self
+
+    async def _open_client(self) -> MCPClient:
+        """Create the pooled client on the loop it will be used from"""
+        http2 = MCP_HTTP2 and _http2_available()
+        if MCP_HTTP2 and not http2:
+            logger.warning("MCP_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+
+        client = MCPClient(self.mcp_url)
+        client.client = httpx.AsyncClient(
+            timeout=MCP_REQUEST_TIMEOUT,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=MCP_MAX_CONNECTIONS,
+                max_keepalive_connections=MCP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=MCP_KEEPALIVE_EXPIRY
+            )
+        )
+        return client
+
+    def submit(self, coro) -> Future:
+        """
+        Schedule a coroutine on the runtime's loop from any thread.
+
+        Args:
+            coro: Coroutine to run; it may use self.client
+
+        Returns:
+            concurrent.futures.Future resolving to the coroutine's result
+        """
+        if not self.running:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine on the runtime's loop and wait for its result.
+
+        Args:
+            coro: Coroutine to run
+            timeout: Seconds to wait; the coroutine is cancelled when exceeded
+
+        Raises:
+            concurrent.futures.TimeoutError: The coroutine did not finish in time
+            RuntimeError: Called from the runtime's own loop, which would deadlock
+        """
+        if self.running and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("MCPRuntime.run() cannot be called from the runtime's event loop; await instead")
+
+        future = self.submit(coro)
         try:
-            return loop.run_until_complete(coro)
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def iterate(self, agen, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Iterate an async generator on the runtime's loop from a sync caller.
+
+        Args:
+            agen: Async generator to consume
+            timeout: Seconds to wait for each item
+
+        Yields:
+            The generator's items; closing this iterator closes the generator
+        """
+        done = object()
+
+        async def next_item():
+            try:
+                return await agen.__anext__()
+            except StopAsyncIteration:
+                return done
+
+        finished = False
+        try:
+            while True:
+                item = self.run(next_item(), timeout)
+                if item is done:
+                    finished = True
+                    return
+                yield item
         finally:
-            loop.close()
-    
-    with ThreadPoolExecutor() as executor:
-        future = executor.submit(run_in_thread)
-        return future.result()
+            if not finished:
+                # Stopped early (e.g. the HTTP client went away): release the stream
+                try:
+                    self.run(agen.aclose(), timeout)
+                except Exception as e:
+                    logger.warning(f"Error closing MCP stream: {e}")
+
+    def shutdown(self, timeout: float = 10.0):
+        """Close the pooled client and stop the loop thread"""
+        with self._lock:
+            if not self.running:
+                self._loop = None
+                self._thread = None
+                self.client = None
+                return
+
+            loop, thread, client = self._loop, self._thread, self.client
+            try:
+                if client is not None and client.client is not None:
+                    asyncio.run_coroutine_threadsafe(client.client.aclose(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Error closing MCP client: {e}")
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(timeout)
+                if not thread.is_alive():
+                    loop.close()
+                self._loop = None
+                self._thread = None
+                self.client = None
+            logger.info("MCP client runtime stopped")
+
+
+_runtime = MCPRuntime()
+
+
+def get_mcp_runtime() -> MCPRuntime:
+    """The process-wide MCP runtime, started on first use"""
+    return _runtime.start()
+
+
+def start_mcp_client():
+    """Start the process-wide MCP client (gunicorn post_worker_init hook)"""
+    get_mcp_runtime()
+
+
+def shutdown_mcp_client():
+    """Stop the process-wide MCP client (gunicorn worker_exit hook, atexit)"""
+    _runtime.shutdown()
+
+
+atexit.register(shutdown_mcp_client)
+
+
+def run_async_in_thread(coro, timeout: Optional[float] = None):
+    """Run an async coroutine on the shared MCP event loop (for Flask integration)"""
+    return get_mcp_runtime().run(coro, timeout)
 
 # Flask-friendly sync wrappers
 def analyze_receipt_sync(
@@ -676,9 +1037,36 @@ def analyze_receipt_sync(
     filename: str,
     provider: str = "claude"
 ) -> Dict[str, Any]:
-    """Synchronous wrapper for receipt analysis"""
-    return run_async_in_thread(
-        analyze_receipt_async(image_data, filename, provider)
+    """
+    Synchronous wrapper for receipt analysis.
+    Inside an application context the current ai_context snapshot is used.
+    """
+    ai_context = None
+    if has_app_context():
+        try:
+            from ai_context import get_ai_context
+            ai_context = get_ai_context()
+        except Exception as e:
+            logger.warning(f"Could not load AI context, using defaults: {e}")
+    
+    runtime = get_mcp_runtime()
+    return runtime.run(runtime.client.analyze_receipt(image_data, filename, provider, ai_context))
+
+def stream_receipt_sync(
+    image_data: bytes,
+    filename: str,
+    provider: str = "claude",
+    ai_context: Optional[Dict[str, Any]] = None
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Synchronous wrapper for streaming receipt analysis: yields (event, data)
+    pairs as MCPClient.stream_receipt does. Load the ai_context snapshot before
+    iterating, since streamed responses may outlive the application context.
+    """
+    runtime = get_mcp_runtime()
+    return runtime.iterate(
+        runtime.client.stream_receipt(image_data, filename, provider, ai_context),
+        MCP_STREAM_TIMEOUT
     )
 
 def categorize_object_sync(
@@ -687,18 +1075,40 @@ def categorize_object_sync(
     provider: str = "claude"
 ) -> Dict[str, Any]:
     """Synchronous wrapper for object categorization"""
-    return run_async_in_thread(
-        categorize_object_async(object_data, image_data, provider)
-    )
+    runtime = get_mcp_runtime()
+    return runtime.run(runtime.client.categorize_object(object_data, image_data, provider))
+
+def categorize_batch_sync(
+    items: List[Dict[str, Any]],
+    context: Optional[Dict[str, Any]] = None,
+    provider: str = "claude",
+    max_suggestions: int = 3,
+    priority: int = 5
+) -> Dict[str, Any]:
+    """
+    Synchronous wrapper for batch categorization.
+    Inside an application context the current ai_context snapshot is used.
+    """
+    ai_context = None
+    if has_app_context():
+        try:
+            from ai_context import get_ai_context
+            ai_context = get_ai_context()
+        except Exception as e:
+            logger.warning(f"Could not load AI context: {e}")
+    
+    runtime = get_mcp_runtime()
+    return runtime.run(runtime.client.categorize_batch(
+        items, context, ai_context, provider, max_suggestions, priority
+    ))
 
 def extract_vendor_info_sync(
     image_data: bytes,
     provider: str = "claude"
 ) -> Dict[str, Any]:
     """Synchronous wrapper for vendor extraction"""
-    return run_async_in_thread(
-        extract_vendor_info_async(image_data, provider)
-    )
+    runtime = get_mcp_runtime()
+    return runtime.run(runtime.client.extract_vendor_info(image_data, provider))
 
 def analyze_object_photo_sync(
     image_data: bytes,
@@ -707,9 +1117,8 @@ def analyze_object_photo_sync(
     context: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """Synchronous wrapper for object photo analysis"""
-    return run_async_in_thread(
-        analyze_object_photo_async(image_data, filename, provider, context)
-    )
+    runtime = get_mcp_runtime()
+    return runtime.run(runtime.client.analyze_object_photo(image_data, filename, provider, context))
 
 async def analyze_vendor_organization_async(
     vendor_name: str,
@@ -718,17 +1127,7 @@ async def analyze_vendor_organization_async(
 ) -> Dict[str, Any]:
     """Async wrapper for vendor organization analysis"""
     async with MCPClient() as client:
-        return await client.process_ai_request(
-            prompt_type="vendor_organization_analysis",
-            context={
-                "vendor_name": vendor_name,
-                "analysis_data": analysis_data
-            },
-            provider=provider,
-            output_schema="organization_details",
-            max_tokens=1500,
-            temperature=0.1
-        )
+        return await client.analyze_vendor_organization(vendor_name, analysis_data, provider)
 
 def analyze_vendor_organization_sync(
     vendor_name: str,
@@ -754,9 +1153,8 @@ def analyze_vendor_organization_sync(
         Organization analysis with suggestions and confidence scores
     """
     try:
-        return run_async_in_thread(
-            analyze_vendor_organization_async(vendor_name, analysis_data, provider)
-        )
+        runtime = get_mcp_runtime()
+        return runtime.run(runtime.client.analyze_vendor_organization(vendor_name, analysis_data, provider))
     except Exception as e:
         logger.warning(f"MCP vendor analysis failed for {vendor_name}: {str(e)}")
         
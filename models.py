@@ -1,9 +1,15 @@
+import json
 import uuid
+import logging
 from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import JSONB, BYTEA
 from sqlalchemy.orm import deferred
 from app import db
 
+logger = logging.getLogger(__name__)
+
 # Association table for the many-to-many relationship between objects and categories
 object_categories = db.Table('object_categories',
     db.Column('object_id', db.Integer, db.ForeignKey('objects.id'), primary_key=True),
@@ -25,8 +31,36 @@ class Vendor(db.Model):
     # Relationships
     invoices = db.relationship('Invoice', backref='vendor', lazy='dynamic')
     
+    # Cached (id, name) options shared by vendor dropdowns in this process
+    _options_cache = None
+    
     def __repr__(self):
         return f"<Vendor {self.name}>"
+    
+    @classmethod
+    def get_options(cls):
+        """
+        Lightweight vendor list for dropdowns, ordered by name.
+        Only id and name are loaded, and the list is reused until the vendors
+        table's row count or latest update time changes.
+        
+        Returns:
+            list: Dicts with 'id' and 'name'
+        """
+        fingerprint = tuple(db.session.query(
+            db.func.count(cls.id), db.func.max(cls.updated_at)
+        ).one())
+        
+        cached = cls._options_cache
+        if cached and cached['fingerprint'] == fingerprint:
+            return cached['options']
+        
+        options = [
+            {'id': vendor_id, 'name': name}
+            for vendor_id, name in db.session.query(cls.id, cls.name).order_by(cls.name)
+        ]
+        cls._options_cache = {'fingerprint': fingerprint, 'options': options}
+        return options
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
@@ -39,13 +73,62 @@ class Invoice(db.Model):
     is_paid = db.Column(db.Boolean, default=True)  # Marked as paid for receipts automatically
     data = db.Column(JSONB, nullable=False)  # JSON document format for flexible data storage
     
+    # Typed copies of data['due_date'] and data['total_amount'], kept in sync on flush
+    due_date = db.Column(db.Date, nullable=True)
+    total_amount = db.Column(db.Numeric(12, 2), nullable=True)
+    
+    # Amounts must fit total_amount's NUMERIC(12, 2): below 10^10 in magnitude
+    AMOUNT_LIMIT = Decimal(10) ** 10
+    
     # Relationships
     line_items = db.relationship('InvoiceLineItem', backref='invoice', cascade="all, delete-orphan")
     attachments = db.relationship('Attachment', backref='invoice', cascade="all, delete-orphan")
     
+    __table_args__ = (
+        db.Index('idx_invoices_paid_due_date', 'is_paid', 'due_date'),
+    )
+    
     def __repr__(self):
         return f"<Invoice {self.invoice_number}>"
     
+    @staticmethod
+    def parse_due_date(value):
+        """Parse a YYYY-MM-DD due date (time part ignored), returning None when invalid"""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def parse_amount(value):
+        """
+        Parse an amount such as 12.5, "12.50" or "$1,250.00", rounded to cents.
+        Returns None when invalid or too large for the total_amount column (e.g. an
+        OCR misread), so the invoice still saves with the value kept in its JSON data.
+        """
+        if value is None or value == '':
+            return None
+        try:
+            amount = Decimal(str(value).replace('$', '').replace(',', '').strip())
+        except InvalidOperation:
+            return None
+        if not amount.is_finite():
+            return None
+        if abs(amount) < Invoice.AMOUNT_LIMIT:
+            amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        if abs(amount) >= Invoice.AMOUNT_LIMIT:
+            logger.warning(f"Ignoring out-of-range invoice amount {value!r}")
+            return None
+        return amount
+    
+    def sync_typed_fields(self):
+        """Copy due_date and total_amount from the JSON data into their typed columns"""
+        data = self.data or {}
+        self.due_date = self.parse_due_date(data.get('due_date'))
+        self.total_amount = self.parse_amount(data.get('total_amount'))
+    
     @staticmethod
     def generate_invoice_number():
         """Generate a unique invoice number"""
@@ -54,6 +137,11 @@ class Invoice(db.Model):
         date_part = datetime.utcnow().strftime("%Y%m%d")
         return f"{prefix}-{date_part}-{random_part}"
 
+@event.listens_for(Invoice, 'before_insert')
+@event.listens_for(Invoice, 'before_update')
+def _sync_invoice_typed_fields(mapper, connection, target):
+    target.sync_typed_fields()
+
 class InvoiceLineItem(db.Model):
     __tablename__ = 'invoice_line_items'
     
@@ -112,6 +200,12 @@ class Object(db.Model):
     ai_evaluation_pending = db.Column(db.Boolean, default=False)  # Flag for AI evaluation queue
     evaluation_history = db.Column(JSONB, default=lambda: [])  # List of previous evaluations
     
+    # Typed copies of data['track_stock'], data['quantity'] and data['reorder_threshold'],
+    # kept in sync on flush so low-stock checks can run as one indexed query
+    track_stock = db.Column(db.Boolean, default=False, nullable=False, server_default=db.false())
+    stock_quantity = db.Column(db.Float, nullable=True)
+    reorder_threshold = db.Column(db.Float, nullable=True)
+    
     # Self-referential relationship for components
     children = db.relationship('Object', backref=db.backref('parent', remote_side=[id]), 
                                cascade="all, delete-orphan")
@@ -133,10 +227,34 @@ class Object(db.Model):
     categories = db.relationship('Category', secondary=object_categories,
                                  lazy='dynamic', backref=db.backref('objects', lazy='dynamic'))
     
+    __table_args__ = (
+        # Low-stock checks only look at stock-tracked objects
+        db.Index('idx_objects_stock_tracked', 'object_type', 'stock_quantity', 'reorder_threshold',
+                 postgresql_where=db.text('track_stock')),
+    )
+    
     def __repr__(self):
         object_name = self.data.get('name', 'Unnamed')
         return f"<{self.object_type.capitalize()} '{object_name}' ({self.id})>"
     
+    @staticmethod
+    def parse_stock_number(value, default=0.0):
+        """Parse a quantity or threshold from the JSON data, returning default when invalid"""
+        if value is None or value == '' or isinstance(value, bool):
+            return default
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return default
+        return number if number == number and abs(number) != float('inf') else default
+    
+    def sync_stock_fields(self):
+        """Copy the stock tracking fields from the JSON data into their typed columns"""
+        data = self.data or {}
+        self.track_stock = bool(data.get('track_stock', False))
+        self.stock_quantity = self.parse_stock_number(data.get('quantity'))
+        self.reorder_threshold = self.parse_stock_number(data.get('reorder_threshold'))
+    
     @property
     def is_asset(self):
         return self.object_type == 'asset'
@@ -247,6 +365,11 @@ class Object(db.Model):
         
         return evaluation_record
 
+@event.listens_for(Object, 'before_insert')
+@event.listens_for(Object, 'before_update')
+def _sync_object_stock_fields(mapper, connection, target):
+    target.sync_stock_fields()
+
 # Association table for person-pet relationship (many-to-many)
 class PersonPetAssociation(db.Model):
     __tablename__ = 'person_pet_associations'
@@ -299,6 +422,9 @@ class ObjectAttachment(db.Model):
             return len(self.file_data)
         return 0
 
+# Bumped whenever categories change (see ai_context.py); created by create_all
+AI_CONTEXT_VERSION_SEQUENCE = db.Sequence('ai_context_version_seq', metadata=db.metadata)
+
 class Category(db.Model):
     """
     Categories for objects, organized by object type.
@@ -370,6 +496,31 @@ class Category(db.Model):
         
         return new_category, True
 
+class AssetBookValue(db.Model):
+    """
+    Monthly book value snapshots for depreciable objects.
+    Rows are generated in bulk by valuation.persist_book_values() so that
+    portfolio value on any month can be answered with a single aggregate query.
+    """
+    __tablename__ = 'asset_book_values'
+
+    id = db.Column(db.Integer, primary_key=True)
+    object_id = db.Column(db.Integer, db.ForeignKey('objects.id', ondelete='CASCADE'), nullable=False)
+    period = db.Column(db.Date, nullable=False, index=True)  # First day of the month
+    acquisition_cost = db.Column(db.Float, nullable=False)
+    book_value = db.Column(db.Float, nullable=False)
+    accumulated_depreciation = db.Column(db.Float, nullable=False)
+    depreciation_method = db.Column(db.String(30), nullable=False)  # straight_line, declining_balance
+    depreciation_category = db.Column(db.String(50), nullable=True)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('object_id', 'period', name='unique_asset_book_value_period'),
+    )
+
+    def __repr__(self):
+        return f"<AssetBookValue object {self.object_id} {self.period}: {self.book_value:.2f}>"
+
 class AIEvaluationQueue(db.Model):
     """
     Queue for AI evaluation of objects.
@@ -378,6 +529,9 @@ class AIEvaluationQueue(db.Model):
     """
     __tablename__ = 'ai_evaluation_queue'
     
+    # Evaluations run per day
+    DAILY_LIMIT = 30
+    
     id = db.Column(db.Integer, primary_key=True)
     object_id = db.Column(db.Integer, db.ForeignKey('objects.id'), nullable=False)
     scheduled_date = db.Column(db.DateTime, nullable=False, index=True)
@@ -388,15 +542,23 @@ class AIEvaluationQueue(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
+    tokens_used = db.Column(db.Integer, nullable=True)  # Tokens spent on the last attempt
+    
+    __table_args__ = (
+        # Daily queue and queue metrics filter by status and schedule
+        db.Index('idx_ai_evaluation_queue_status', 'status', 'scheduled_date'),
+        db.Index('idx_ai_evaluation_queue_completed_at', 'completed_at'),
+    )
     
     def __repr__(self):
         return f"<AIEvaluationQueue {self.object_id} ({self.status})>"
     
     @staticmethod
-    def get_daily_queue(date=None, limit=30):
+    def get_daily_queue(date=None, limit=DAILY_LIMIT, include_overdue=False):
         """
         Get the queue for a specific date, limited to a maximum number of items.
-        If no date is provided, defaults to today.
+        If no date is provided, defaults to today. With include_overdue, pending
+        entries from earlier days that were never processed come first.
         """
         if date is None:
             date = datetime.utcnow().date()
@@ -405,11 +567,16 @@ class AIEvaluationQueue(db.Model):
         day_start = datetime.combine(date, datetime.min.time())
         day_end = datetime.combine(date, datetime.max.time())
         
+        if include_overdue:
+            window = AIEvaluationQueue.scheduled_date <= day_end
+        else:
+            window = AIEvaluationQueue.scheduled_date.between(day_start, day_end)
+        
         # Get the queue for the day, prioritizing oldest objects first
         return AIEvaluationQueue.query.filter(
-            AIEvaluationQueue.scheduled_date.between(day_start, day_end),
+            window,
             AIEvaluationQueue.status == 'pending'
-        ).order_by(AIEvaluationQueue.scheduled_date).limit(limit).all()
+        ).order_by(AIEvaluationQueue.scheduled_date, AIEvaluationQueue.id).limit(limit).all()
     
     @staticmethod
     def schedule_object(object_id, scheduled_date=None):
@@ -493,51 +660,126 @@ class AIEvaluationQueue(db.Model):
         return due_objects
     
     @staticmethod
-    def schedule_evaluations():
+    def pending_counts_by_day(start_date, end_date=None):
+        """
+        Count pending evaluations per day over a date range in one query.
+        
+        Args:
+            start_date: First day (date)
+            end_date: Last day (date), inclusive; None for no upper bound
+            
+        Returns:
+            dict: {date: pending count}; days without entries are absent
+        """
+        day = db.func.date(AIEvaluationQueue.scheduled_date)
+        query = db.session.query(day, db.func.count(AIEvaluationQueue.id)).filter(
+            AIEvaluationQueue.scheduled_date >= datetime.combine(start_date, datetime.min.time()),
+            AIEvaluationQueue.status == 'pending'
+        )
+        if end_date is not None:
+            query = query.filter(
+                AIEvaluationQueue.scheduled_date < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            )
+        rows = query.group_by(day).all()
+        return {row_day: count for row_day, count in rows}
+    
+    @staticmethod
+    def allocate_slots(count, start_date, used_by_day, daily_limit=DAILY_LIMIT):
+        """
+        Assign count evaluations to the earliest days with free slots.
+        
+        Args:
+            count: Number of evaluations to place
+            start_date: First day that may be used (date)
+            used_by_day: {date: slots already taken}
+            daily_limit: Evaluations allowed per day
+            
+        Returns:
+            list: One date per evaluation, in order
+        """
+        if daily_limit < 1:
+            raise ValueError("daily_limit must be at least 1")
+        
+        dates = []
+        day = start_date
+        while len(dates) < count:
+            free = max(0, daily_limit - used_by_day.get(day, 0))
+            dates.extend([day] * min(free, count - len(dates)))
+            day += timedelta(days=1)
+        return dates
+    
+    @staticmethod
+    def schedule_evaluations(daily_limit=DAILY_LIMIT):
         """
         Schedule objects for evaluation that are due.
         This function is meant to be called daily by a scheduler.
+        
+        Due objects, most overdue first, fill today's free slots and then each
+        following day's. Slot usage for the whole horizon is read with one grouped
+        query and the queue rows and ai_evaluation_pending flags are written with
+        one statement, however many objects are due. Runs under a transaction-level
+        advisory lock so concurrent schedulers cannot overfill a day; the caller
+        commits.
+        
+        Args:
+            daily_limit: Evaluations allowed per day
+            
+        Returns:
+            int: Number of objects scheduled
         """
-        due_objects = AIEvaluationQueue.find_objects_due_for_evaluation()
-        scheduled_count = 0
-        
-        # Get current date
-        today = datetime.utcnow().date()
-        
-        # Check how many slots are available today
-        pending_count = AIEvaluationQueue.count_pending_for_day(today)
-        completed_count = AIEvaluationQueue.count_completed_for_day(today)
-        daily_limit = 30
-        available_slots = max(0, daily_limit - (pending_count + completed_count))
-        
-        # Schedule objects up to the available slot limit
-        for obj in due_objects[:available_slots]:
-            AIEvaluationQueue.schedule_object(obj.id)
-            scheduled_count += 1
-        
-        # For objects beyond today's limit, schedule for future days
-        if len(due_objects) > available_slots:
-            days_ahead = 1
-            for obj in due_objects[available_slots:]:
-                # Keep advancing days until we find a day with an open slot
-                while True:
-                    future_date = today + timedelta(days=days_ahead)
-                    pending_for_day = AIEvaluationQueue.count_pending_for_day(future_date)
-                    
-                    if pending_for_day < daily_limit:
-                        # This day has an available slot
-                        scheduled_date = datetime.combine(future_date, datetime.min.time())
-                        AIEvaluationQueue.schedule_object(obj.id, scheduled_date)
-                        scheduled_count += 1
-                        break
-                    
-                    days_ahead += 1
-                    
-                    # Safety limit to prevent infinite loop
-                    if days_ahead > 365:
-                        break
+        db.session.execute(db.text("SELECT pg_advisory_xact_lock(hashtext('ai_evaluation_schedule'))"))
+        
+        now = datetime.utcnow()
+        pending = db.select(AIEvaluationQueue.id).where(
+            AIEvaluationQueue.object_id == Object.id,
+            AIEvaluationQueue.status == 'pending'
+        ).exists()
+        due_ids = db.session.scalars(
+            db.select(Object.id).where(
+                Object.next_evaluation_date <= now,
+                Object.ai_evaluation_pending == False,
+                ~pending
+            ).order_by(Object.next_evaluation_date, Object.id)
+        ).all()
+        
+        if not due_ids:
+            return 0
         
-        return scheduled_count
+        # Slot usage of every day that already has pending entries
+        today = now.date()
+        used_by_day = AIEvaluationQueue.pending_counts_by_day(today)
+        used_by_day[today] = used_by_day.get(today, 0) + AIEvaluationQueue.count_completed_for_day(today)
+        
+        dates = AIEvaluationQueue.allocate_slots(len(due_ids), today, used_by_day, daily_limit)
+        
+        # Today's entries are due now; later ones at the start of their day
+        scheduled_dates = [now if day == today else datetime.combine(day, datetime.min.time())
+                           for day in dates]
+        
+        db.session.execute(db.text("""
+            WITH queued AS (
+                INSERT INTO ai_evaluation_queue (object_id, scheduled_date, status, attempts, created_at)
+                SELECT object_id, scheduled_date, 'pending', 0, :now
+                FROM unnest(CAST(:object_ids AS integer[]), CAST(:scheduled_dates AS timestamp[]))
+                     AS t(object_id, scheduled_date)
+                RETURNING object_id
+            )
+            UPDATE objects SET ai_evaluation_pending = TRUE
+            FROM queued
+            WHERE objects.id = queued.object_id
+        """), {
+            'object_ids': list(due_ids),
+            'scheduled_dates': scheduled_dates,
+            'now': now
+        })
+        
+        # Loaded objects must not keep a stale ai_evaluation_pending
+        scheduled = set(due_ids)
+        for instance in list(db.session.identity_map.values()):
+            if isinstance(instance, Object) and instance.id in scheduled:
+                db.session.expire(instance, ['ai_evaluation_pending'])
+        
+        return len(due_ids)
 
 class AISettings(db.Model):
     """
@@ -672,7 +914,7 @@ class TaskQueue(db.Model):
     task_type = db.Column(db.String(50), nullable=False, index=True)  # consumable_expiration, stock_check, etc.
     object_id = db.Column(db.Integer, db.ForeignKey('objects.id'), nullable=True)  # Optional reference to an object
     execute_at = db.Column(db.DateTime, nullable=False, index=True)  # When to execute this task
-    status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, completed, failed
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, completed, failed, dead_letter
     priority = db.Column(db.Integer, default=1)  # 1-10, higher values are processed first
     data = db.Column(JSONB, nullable=False, default=lambda: {})  # Task-specific data
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -681,6 +923,25 @@ class TaskQueue(db.Model):
     completed_at = db.Column(db.DateTime, nullable=True)
     result = db.Column(JSONB, nullable=True)  # Result of the task
     error_message = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)  # Worker currently holding the task
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # Claim is reclaimable after this time
+    
+    __table_args__ = (
+        # Workers claim ready tasks by status, priority and due time
+        db.Index('idx_task_queue_claim', 'status', 'priority', 'execute_at'),
+        # Queue metrics: depth and lag per type, throughput over a recent window
+        db.Index('idx_task_queue_type_status', 'task_type', 'status', 'execute_at'),
+        db.Index('idx_task_queue_completed_at', 'completed_at'),
+    )
+    
+    # Default claim lease; a worker that crashes releases its tasks after this long
+    DEFAULT_LEASE_SECONDS = 600
+    
+    # Postgres channel idle workers LISTEN on for newly queued tasks
+    NOTIFY_CHANNEL = 'task_queue'
+    
+    # Status of tasks that failed on every attempt their retry policy allows
+    DEAD_LETTER = 'dead_letter'
     
     def __repr__(self):
         return f"<TaskQueue {self.id} ({self.task_type}, {self.status})>"
@@ -713,6 +974,13 @@ class TaskQueue(db.Model):
             )
             
             db.session.add(task)
+            if task.status == 'pending':
+                db.session.flush()
+                TaskQueue.notify_workers({
+                    'id': task.id,
+                    'task_type': task.task_type,
+                    'execute_at': task.execute_at.isoformat() if isinstance(task.execute_at, datetime) else task.execute_at
+                })
             db.session.commit()
             
             return task
@@ -721,6 +989,39 @@ class TaskQueue(db.Model):
             db.session.rollback()
             raise e
     
+    @staticmethod
+    def notify_workers(payload):
+        """
+        Wake idle queue workers.
+        NOTIFY is transactional, so workers only hear about it once the
+        current transaction commits.
+        
+        Args:
+            payload: JSON-serializable description of what changed
+        """
+        db.session.execute(
+            db.text("SELECT pg_notify(:channel, :payload)"),
+            {'channel': TaskQueue.NOTIFY_CHANNEL, 'payload': json.dumps(payload)}
+        )
+    
+    @staticmethod
+    def next_execute_at(exclude_types=None):
+        """
+        Scheduled time of the earliest pending task.
+        
+        Args:
+            exclude_types: Ignore tasks of these types
+        
+        Returns:
+            datetime: Earliest execute_at, or None when nothing is pending
+        """
+        query = db.session.query(db.func.min(TaskQueue.execute_at)).filter(
+            TaskQueue.status == 'pending'
+        )
+        if exclude_types:
+            query = query.filter(TaskQueue.task_type.notin_(exclude_types))
+        return query.scalar()
+    
     @staticmethod
     def schedule_consumable_expiration(object_id, expiration_date, quantity=1):
         """
@@ -779,6 +1080,237 @@ class TaskQueue(db.Model):
             TaskQueue.priority.desc(),
             TaskQueue.execute_at
         ).limit(limit).all()
+    
+    @staticmethod
+    def claim_tasks(worker_id, limit=10, lease_seconds=DEFAULT_LEASE_SECONDS,
+                    task_types=None, exclude_types=None, max_in_flight=None, due_before=None):
+        """
+        Atomically claim a batch of ready tasks for a worker.
+        
+        The candidate rows are locked with FOR UPDATE SKIP LOCKED and flipped to
+        'processing' in the same statement, so concurrent workers (threads, processes
+        or containers) never claim the same task and never block on each other.
+        
+        Args:
+            worker_id: Identifier of the claiming worker
+            limit: Maximum number of tasks to claim
+            lease_seconds: How long the claim is held before it can be reclaimed
+            task_types: Only claim these task types
+            exclude_types: Never claim these task types
+            max_in_flight: With task_types, cap the tasks of those types processing at
+                once across all workers. Claims for the same types are serialized with
+                a transaction-level advisory lock so the cap holds under concurrency.
+            due_before: Only claim tasks scheduled at or before this time (default: now)
+            
+        Returns:
+            list: Claimed TaskQueue objects, ordered by priority and scheduled time
+        """
+        now = datetime.utcnow()
+        
+        filters = [TaskQueue.status == 'pending', TaskQueue.execute_at <= (due_before or now)]
+        if task_types:
+            filters.append(TaskQueue.task_type.in_(task_types))
+        if exclude_types:
+            filters.append(TaskQueue.task_type.notin_(exclude_types))
+        
+        if task_types and max_in_flight is not None:
+            db.session.execute(
+                db.text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                {'key': f"task_queue:{','.join(sorted(task_types))}"}
+            )
+            in_flight = db.session.query(db.func.count(TaskQueue.id)).filter(
+                TaskQueue.status == 'processing',
+                TaskQueue.task_type.in_(task_types),
+                TaskQueue.lease_expires_at > now
+            ).scalar()
+            limit = min(limit, max_in_flight - in_flight)
+            if limit <= 0:
+                db.session.commit()
+                return []
+        
+        candidates = db.select(TaskQueue.id).where(*filters).order_by(
+            TaskQueue.priority.desc(),
+            TaskQueue.execute_at
+        ).limit(limit).with_for_update(skip_locked=True).scalar_subquery()
+        
+        claimed_ids = db.session.execute(
+            db.update(TaskQueue).where(TaskQueue.id.in_(candidates)).values(
+                status='processing',
+                locked_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                last_attempt=now,
+                attempts=db.func.coalesce(TaskQueue.attempts, 0) + 1
+            ).returning(TaskQueue.id).execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+        
+        if not claimed_ids:
+            return []
+        
+        return TaskQueue.query.filter(TaskQueue.id.in_(claimed_ids)).order_by(
+            TaskQueue.priority.desc(),
+            TaskQueue.execute_at
+        ).all()
+    
+    @staticmethod
+    def renew_lease(task_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extend a worker's claim on a task.
+        
+        Returns:
+            bool: False when the task is no longer held by this worker
+        """
+        renewed = db.session.execute(
+            db.update(TaskQueue).where(
+                TaskQueue.id == task_id,
+                TaskQueue.status == 'processing',
+                TaskQueue.locked_by == worker_id
+            ).values(
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return renewed > 0
+    
+    @staticmethod
+    def renew_leases(task_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extend a worker's claim on several tasks in one statement.
+        
+        Returns:
+            set: IDs of the tasks still held by this worker
+        """
+        if not task_ids:
+            return set()
+        renewed = db.session.scalars(
+            db.update(TaskQueue).where(
+                TaskQueue.id.in_(task_ids),
+                TaskQueue.status == 'processing',
+                TaskQueue.locked_by == worker_id
+            ).values(
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds)
+            ).returning(TaskQueue.id).execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return set(renewed)
+    
+    @staticmethod
+    def _dead_letter_query(task_ids=None, task_type=None):
+        """Dead-lettered tasks, optionally restricted to ids and/or a task type"""
+        query = TaskQueue.query.filter(TaskQueue.status == TaskQueue.DEAD_LETTER)
+        if task_ids:
+            query = query.filter(TaskQueue.id.in_(task_ids))
+        if task_type:
+            query = query.filter(TaskQueue.task_type == task_type)
+        return query
+    
+    @staticmethod
+    def requeue_dead_letters(task_ids=None, task_type=None):
+        """
+        Move dead-lettered tasks back to pending with a fresh attempt budget.
+        
+        Args:
+            task_ids: Optional list of task IDs
+            task_type: Optional task type
+            
+        Returns:
+            int: Number of tasks requeued
+        """
+        requeued = TaskQueue._dead_letter_query(task_ids, task_type).update({
+            TaskQueue.status: 'pending',
+            TaskQueue.attempts: 0,
+            TaskQueue.execute_at: datetime.utcnow(),
+            TaskQueue.locked_by: None,
+            TaskQueue.lease_expires_at: None
+        }, synchronize_session=False)
+        if requeued:
+            TaskQueue.notify_workers({'requeued': requeued})
+        db.session.commit()
+        return requeued
+    
+    @staticmethod
+    def purge_dead_letters(task_ids=None, task_type=None):
+        """
+        Delete dead-lettered tasks.
+        
+        Args:
+            task_ids: Optional list of task IDs
+            task_type: Optional task type
+            
+        Returns:
+            int: Number of tasks deleted
+        """
+        purged = TaskQueue._dead_letter_query(task_ids, task_type).delete(synchronize_session=False)
+        db.session.commit()
+        return purged
+    
+    @staticmethod
+    def reclaim_expired_leases():
+        """
+        Return tasks whose worker died mid-processing to the pending state.
+        
+        Returns:
+            int: Number of tasks reclaimed
+        """
+        reclaimed = db.session.execute(
+            db.update(TaskQueue).where(
+                TaskQueue.status == 'processing',
+                TaskQueue.lease_expires_at < datetime.utcnow()
+            ).values(
+                status='pending',
+                locked_by=None,
+                lease_expires_at=None
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return reclaimed
+    
+    @staticmethod
+    def ensure_queued(task_type, priority=1, data=None):
+        """
+        Queue a task to run now unless one of the same type is already waiting or running.
+        
+        Returns:
+            TaskQueue: The new task, or None when one was already queued
+        """
+        existing = db.session.query(TaskQueue.id).filter(
+            TaskQueue.task_type == task_type,
+            TaskQueue.status.in_(['pending', 'processing'])
+        ).first()
+        if existing:
+            return None
+        return TaskQueue.queue_task({
+            'task_type': task_type,
+            'execute_at': datetime.utcnow(),
+            'priority': priority,
+            'data': data or {}
+        })
+
+
+class ScheduledJob(db.Model):
+    """
+    Schedule and last-run status of a periodic job.
+    Jobs are declared in code (see job_scheduler.periodic_job); one row per job
+    records when it runs next and how its last run went.
+    """
+    __tablename__ = 'scheduled_jobs'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    interval_seconds = db.Column(db.Integer, nullable=False)
+    enabled = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # running, success, failed, skipped
+    last_error = db.Column(db.Text, nullable=True)
+    last_duration = db.Column(db.Float, nullable=True)  # Seconds
+    last_result = db.Column(JSONB, nullable=True)
+    run_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    failure_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ScheduledJob {self.name} next {self.next_run_at} ({self.last_status})>"
 
 
 class Reminder(db.Model):
@@ -932,7 +1464,8 @@ class OrganizationRelationship(db.Model):
         db.UniqueConstraint('from_organization_id', 'to_organization_id', 'relationship_type', 
                            name='unique_org_relationship'),
         db.CheckConstraint('from_organization_id != to_organization_id', 
-                          name='no_self_relationship')
+                          name='no_self_relationship'),
+        db.Index('idx_org_relationships_to_org', 'to_organization_id', 'is_active')
     )
     
     def __repr__(self):
@@ -978,6 +1511,7 @@ class OrganizationRelationship(db.Model):
             db.session.add(reverse_relationship)
             
         db.session.commit()
+        cls.invalidate_network_cache()
         return relationship
     
     @staticmethod
@@ -1005,58 +1539,172 @@ class OrganizationRelationship(db.Model):
             return f"Reverse of: {original_label}"
         return OrganizationRelationship._get_reverse_relationship_type(relationship_type).replace('_', ' ').title()
     
+    # Recursive walk over active relationships in either direction. The path array
+    # carries every organization visited on the current branch so cycles are cut in SQL.
+    _NETWORK_CTE = """
+        WITH RECURSIVE walk(org_id, depth, path) AS (
+            SELECT CAST(:org_id AS INTEGER), 0, ARRAY[CAST(:org_id AS INTEGER)]
+            UNION ALL
+            SELECT step.next_id, w.depth + 1, w.path || step.next_id
+            FROM walk w
+            JOIN organization_relationships r
+              ON r.is_active AND (r.from_organization_id = w.org_id OR r.to_organization_id = w.org_id)
+            CROSS JOIN LATERAL (
+                SELECT CASE WHEN r.from_organization_id = w.org_id
+                            THEN r.to_organization_id ELSE r.from_organization_id END AS next_id
+            ) step
+            WHERE w.depth < :max_depth
+              AND NOT step.next_id = ANY(w.path)
+        ),
+        reached AS (
+            SELECT org_id, MIN(depth) AS depth FROM walk GROUP BY org_id
+        ),
+        edges AS (
+            SELECT r.id, r.from_organization_id, r.to_organization_id, r.relationship_type,
+                   r.relationship_label, r.strength
+            FROM organization_relationships r
+            WHERE r.is_active
+              AND (r.from_organization_id IN (SELECT org_id FROM reached)
+                   OR r.to_organization_id IN (SELECT org_id FROM reached))
+        ),
+        nodes AS (
+            SELECT org_id FROM reached
+            UNION SELECT from_organization_id FROM edges
+            UNION SELECT to_organization_id FROM edges
+        )
+        SELECT
+            (SELECT COALESCE(json_agg(e ORDER BY e.id), '[]'::json) FROM edges e) AS edges,
+            (SELECT COALESCE(json_agg(json_build_object(
+                        'id', o.id, 'name', o.name, 'organization_type', o.organization_type)), '[]'::json)
+             FROM organizations o WHERE o.id IN (SELECT org_id FROM nodes)) AS organizations
+    """
+    
+    # Cached adjacency snapshot shared by repeated network views in this process
+    _adjacency_snapshot = None
+    
     @classmethod
-    def get_organization_network(cls, org_id, max_depth=3):
+    def get_organization_network(cls, org_id, max_depth=3, use_cache=False):
         """
         Get the complete network of relationships for an organization.
         Returns a nested structure showing all connected organizations.
+        
+        All edges and organization rows up to max_depth are fetched in a single recursive
+        query and the nested structure is assembled in memory. With use_cache=True the
+        traversal runs against a process-wide adjacency snapshot instead, which is only
+        reloaded when the relationship or organization tables change.
         """
-        visited = set()
-        network = {}
+        if use_cache:
+            snapshot = cls._get_adjacency_snapshot()
+            return cls._assemble_network(org_id, max_depth, snapshot['edges'], snapshot['organizations'])
         
-        def _traverse(current_org_id, depth=0):
-            if depth > max_depth or current_org_id in visited:
-                return {}
-            
-            visited.add(current_org_id)
-            
-            # Get all relationships for this organization
-            outgoing = cls.query.filter_by(from_organization_id=current_org_id, is_active=True).all()
-            incoming = cls.query.filter_by(to_organization_id=current_org_id, is_active=True).all()
-            
-            org_network = {
-                'organization_id': current_org_id,
+        row = db.session.execute(
+            db.text(cls._NETWORK_CTE),
+            {'org_id': org_id, 'max_depth': max_depth}
+        ).one()
+        
+        organizations = {org['id']: org for org in row.organizations}
+        return cls._assemble_network(org_id, max_depth, row.edges, organizations)
+    
+    @classmethod
+    def _get_adjacency_snapshot(cls):
+        """
+        Return the cached snapshot of all active relationships and organizations,
+        reloading it when the tables' row counts or latest update times have changed.
+        """
+        fingerprint = tuple(db.session.execute(db.text("""
+            SELECT (SELECT COUNT(*) FROM organization_relationships),
+                   (SELECT MAX(updated_at) FROM organization_relationships),
+                   (SELECT COUNT(*) FROM organizations),
+                   (SELECT MAX(updated_at) FROM organizations)
+        """)).one())
+        
+        snapshot = cls._adjacency_snapshot
+        if snapshot and snapshot['fingerprint'] == fingerprint:
+            return snapshot
+        
+        edges = [
+            {
+                'id': rel_id,
+                'from_organization_id': from_id,
+                'to_organization_id': to_id,
+                'relationship_type': rel_type,
+                'relationship_label': rel_label,
+                'strength': strength
+            }
+            for rel_id, from_id, to_id, rel_type, rel_label, strength in db.session.query(
+                cls.id, cls.from_organization_id, cls.to_organization_id,
+                cls.relationship_type, cls.relationship_label, cls.strength
+            ).filter(cls.is_active == True).order_by(cls.id)
+        ]
+        organizations = {
+            org_id: {'id': org_id, 'name': name, 'organization_type': org_type}
+            for org_id, name, org_type in db.session.query(
+                Organization.id, Organization.name, Organization.organization_type
+            )
+        }
+        
+        snapshot = {'fingerprint': fingerprint, 'edges': edges, 'organizations': organizations}
+        cls._adjacency_snapshot = snapshot
+        return snapshot
+    
+    @classmethod
+    def invalidate_network_cache(cls):
+        """Drop the cached adjacency snapshot"""
+        cls._adjacency_snapshot = None
+    
+    @staticmethod
+    def _assemble_network(org_id, max_depth, edges, organizations):
+        """
+        Build the nested network structure from a flat edge list.
+        Each organization is expanded once, at its shallowest depth; later references
+        to it (and anything beyond max_depth) get an empty connected_network.
+        """
+        outgoing = {}
+        incoming = {}
+        for edge in edges:
+            outgoing.setdefault(edge['from_organization_id'], []).append(edge)
+            incoming.setdefault(edge['to_organization_id'], []).append(edge)
+        
+        def _node(node_id):
+            node = {
+                'organization_id': node_id,
                 'outgoing_relationships': [],
                 'incoming_relationships': []
             }
-            
-            # Process outgoing relationships
-            for rel in outgoing:
-                rel_data = {
-                    'relationship_id': rel.id,
-                    'to_organization_id': rel.to_organization_id,
-                    'relationship_type': rel.relationship_type,
-                    'relationship_label': rel.relationship_label,
-                    'strength': rel.strength,
-                    'connected_network': _traverse(rel.to_organization_id, depth + 1)
-                }
-                org_network['outgoing_relationships'].append(rel_data)
-            
-            # Process incoming relationships
-            for rel in incoming:
-                rel_data = {
-                    'relationship_id': rel.id,
-                    'from_organization_id': rel.from_organization_id,
-                    'relationship_type': rel.relationship_type,
-                    'relationship_label': rel.relationship_label,
-                    'strength': rel.strength,
-                    'connected_network': _traverse(rel.from_organization_id, depth + 1)
-                }
-                org_network['incoming_relationships'].append(rel_data)
-            
-            return org_network
-        
-        return _traverse(org_id)
+            if node_id in organizations:
+                node['organization'] = organizations[node_id]
+            return node
+        
+        root = _node(org_id)
+        visited = {org_id}
+        frontier = [(org_id, root)]
+        
+        for depth in range(max_depth + 1):
+            next_frontier = []
+            for node_id, node in frontier:
+                for direction, other_key, rels in (
+                    ('outgoing_relationships', 'to_organization_id', outgoing.get(node_id, [])),
+                    ('incoming_relationships', 'from_organization_id', incoming.get(node_id, []))
+                ):
+                    for rel in rels:
+                        other_id = rel[other_key]
+                        connected = {}
+                        if depth < max_depth and other_id not in visited:
+                            visited.add(other_id)
+                            connected = _node(other_id)
+                            next_frontier.append((other_id, connected))
+                        
+                        node[direction].append({
+                            'relationship_id': rel['id'],
+                            other_key: other_id,
+                            'relationship_type': rel['relationship_type'],
+                            'relationship_label': rel['relationship_label'],
+                            'strength': rel['strength'],
+                            'connected_network': connected
+                        })
+            frontier = next_frontier
+        
+        return root
     
     @classmethod
     def get_relationship_types(cls):
@@ -1367,6 +2015,11 @@ class CalendarEvent(db.Model):
     # Relationships
     object = db.relationship('Object', backref='calendar_events')
     
+    __table_args__ = (
+        # Calendar views query events overlapping a start/end window
+        db.Index('idx_calendar_events_window', 'start_time', 'end_time'),
+    )
+    
     def __repr__(self):
         return f"<CalendarEvent {self.title}>"
     
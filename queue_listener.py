@@ -0,0 +1,178 @@
+"""
+LISTEN/NOTIFY wake-ups for task queue workers.
+
+TaskQueue.queue_task() sends a pg_notify on the task queue channel when it commits.
+A QueueListener holds one dedicated connection per process that LISTENs on that
+channel and wakes the process's idle workers. Workers sleep until they are woken,
+until the next scheduled task they could claim is due, or until the fallback poll
+interval elapses. Whichever comes first ends the wait.
+"""
+import logging
+import select
+import threading
+import time
+from datetime import datetime
+
+from app import app, db
+from models import TaskQueue
+from task_registry import HANDLERS
+
+logger = logging.getLogger('queue_processor')
+
+# Seconds to wait before re-establishing a dropped LISTEN connection
+RECONNECT_DELAY = 5
+
+# Shortest sleep when the earliest pending task is already due but could not be claimed
+MIN_WAIT_SECONDS = 1.0
+
+
+class QueueListener:
+    """Background LISTEN connection that wakes idle workers in this process."""
+
+    def __init__(self, channel=TaskQueue.NOTIFY_CHANNEL):
+        self.channel = channel
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._stopped = threading.Event()
+        self._thread = None
+        self.connected = False
+
+    def start(self):
+        """Start the listener thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="queue-listener", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop listening and release every waiting worker"""
+        self._stopped.set()
+        self.wake()
+
+    def wake(self):
+        """Wake all workers currently waiting"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    @property
+    def generation(self):
+        """Counter bumped by every wake-up; pass it to wait() to not miss one"""
+        with self._condition:
+            return self._generation
+
+    def wait(self, timeout, stop_event=None, generation=None):
+        """
+        Block until a notification arrives, timeout seconds pass, or the listener
+        or stop_event is stopped.
+
+        Args:
+            timeout: Maximum seconds to wait
+            stop_event: Optional Event that ends the wait early
+            generation: Value of self.generation read before the worker last checked the
+                queue; a wake-up since then returns immediately
+
+        Returns:
+            bool: True when woken by a notification
+        """
+        deadline = time.monotonic() + max(timeout, 0)
+        with self._condition:
+            if generation is None:
+                generation = self._generation
+            while self._generation == generation and not self._stopped.is_set():
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Wake up at least once a second to notice stop_event
+                self._condition.wait(min(remaining, 1.0))
+            return self._generation != generation
+
+    def _run(self):
+        """Hold a LISTEN connection, reconnecting after failures"""
+        while not self._stopped.is_set():
+            raw_connection = None
+            try:
+                with app.app_context():
+                    raw_connection = db.engine.raw_connection()
+                connection = raw_connection.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                self.connected = True
+                logger.info(f"Listening for queued tasks on channel '{self.channel}'")
+
+                # Notifications sent while we were disconnected are lost; check the queue now
+                self.wake()
+
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select([connection], [], [], 1.0)
+                    if not readable:
+                        continue
+                    connection.poll()
+                    if connection.notifies:
+                        for notification in connection.notifies:
+                            logger.debug(f"Task queue notification: {notification.payload}")
+                        connection.notifies.clear()
+                        self.wake()
+
+            except Exception as e:
+                logger.warning(f"Task queue listener error, falling back to polling: {str(e)}")
+                self._stopped.wait(RECONNECT_DELAY)
+            finally:
+                self.connected = False
+                # Never hand a LISTENing connection back to the pool
+                if raw_connection is not None:
+                    try:
+                        raw_connection.invalidate()
+                    except Exception:
+                        pass
+
+
+def _saturated_types(now):
+    """
+    Task types whose handler is at its max_concurrency across all workers.
+
+    Returns:
+        dict: {task_type: when the earliest running task's lease expires}
+    """
+    caps = {handler.task_type: handler.max_concurrency
+            for handler in HANDLERS.values() if handler.max_concurrency is not None}
+    if not caps:
+        return {}
+    running = db.session.query(
+        TaskQueue.task_type,
+        db.func.count(TaskQueue.id),
+        db.func.min(TaskQueue.lease_expires_at)
+    ).filter(
+        TaskQueue.status == 'processing',
+        TaskQueue.task_type.in_(list(caps)),
+        TaskQueue.lease_expires_at > now
+    ).group_by(TaskQueue.task_type).all()
+    return {task_type: lease_expires_at for task_type, count, lease_expires_at in running
+            if count >= caps[task_type]}
+
+
+def seconds_until_next_task(poll_interval):
+    """
+    How long an idle worker should sleep: until the earliest pending task it could
+    claim is due, but never longer than the fallback poll interval.
+
+    Tasks of a type at its max_concurrency cannot be claimed, however overdue, so
+    they only count from the moment a running task's lease would expire. Workers
+    finishing such a task notify the queue, which ends the wait sooner.
+
+    Must be called inside an application context.
+    """
+    now = datetime.utcnow()
+    saturated = _saturated_types(now)
+    wake_times = [TaskQueue.next_execute_at(exclude_types=list(saturated))]
+    wake_times += saturated.values()
+    wake_times = [wake_time for wake_time in wake_times if wake_time is not None]
+    if not wake_times:
+        return poll_interval
+    delay = (min(wake_times) - now).total_seconds()
+    if delay <= 0:
+        return min(MIN_WAIT_SECONDS, poll_interval)
+    return min(delay, poll_interval)
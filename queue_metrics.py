@@ -0,0 +1,239 @@
+"""
+Instrumentation for the task queue and the AI evaluation queue.
+
+Everything is computed with a few aggregate queries per queue (grouped counts,
+FILTER clauses and min() over indexed columns), never by loading rows. Depth and
+lag are current values; throughput, success rates, retries and latency cover the
+trailing window. queue_metrics() returns the JSON form, prometheus_text() the
+Prometheus text exposition of the same numbers.
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from models import AIEvaluationQueue, TaskQueue
+
+# Trailing window for throughput and latency, in seconds
+DEFAULT_WINDOW_SECONDS = 3600
+
+# Upper bounds (seconds) of the claim-to-complete latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Statuses that mean a task or entry finished unsuccessfully, per queue
+FAILED_STATUSES = {
+    'task_queue': (TaskQueue.DEAD_LETTER, 'failed'),
+    'ai_evaluation_queue': ('failed',),
+}
+
+
+def _queue_columns(model):
+    """Columns of a queue model under common names"""
+    if model is TaskQueue:
+        return {
+            'type': TaskQueue.task_type,
+            'due_at': TaskQueue.execute_at,
+        }
+    return {
+        # The AI evaluation queue has a single kind of entry
+        # (cast, since Postgres cannot GROUP BY a bare constant)
+        'type': db.cast(db.literal('ai_evaluation'), db.String),
+        'due_at': AIEvaluationQueue.scheduled_date,
+    }
+
+
+def _depth(model, now):
+    """Count, due count and oldest due age per type and open status"""
+    columns = _queue_columns(model)
+    task_type = columns['type'].label('task_type')
+    due = columns['due_at'] <= now
+
+    rows = db.session.query(
+        task_type,
+        model.status,
+        db.func.count(model.id),
+        db.func.count(model.id).filter(due),
+        db.func.min(columns['due_at']).filter(due)
+    ).filter(
+        model.status.in_(['pending', 'processing'])
+    ).group_by(task_type, model.status).all()
+
+    return [
+        {
+            'task_type': row_type,
+            'status': status,
+            'count': count,
+            'due': due_count,
+            'oldest_due_age_seconds': (now - oldest).total_seconds() if oldest else 0.0
+        }
+        for row_type, status, count, due_count, oldest in rows
+    ]
+
+
+def _throughput(model, queue_name, since):
+    """Completions, failures, retries and latency histogram per type since a time"""
+    columns = _queue_columns(model)
+    task_type = columns['type'].label('task_type')
+    latency = db.func.extract('epoch', model.completed_at - model.last_attempt)
+    completed = model.status == 'completed'
+
+    bucket_counts = [
+        db.func.count(model.id).filter(completed, latency <= bound)
+        for bound in LATENCY_BUCKETS
+    ]
+
+    finished_recently = db.or_(
+        db.and_(completed, model.completed_at >= since),
+        db.and_(model.status.in_(FAILED_STATUSES[queue_name]), model.last_attempt >= since)
+    )
+
+    rows = db.session.query(
+        task_type,
+        db.func.count(model.id).filter(completed),
+        db.func.count(model.id).filter(~completed),
+        db.func.coalesce(db.func.sum(db.func.greatest(db.func.coalesce(model.attempts, 1) - 1, 0)), 0),
+        db.func.coalesce(db.func.sum(latency).filter(completed), 0.0),
+        *bucket_counts
+    ).filter(finished_recently).group_by(task_type).all()
+
+    # Tasks waiting to be retried right now
+    retrying = dict(db.session.query(task_type, db.func.count(model.id)).filter(
+        model.status == 'pending',
+        model.attempts > 0
+    ).group_by(task_type).all())
+
+    result = {}
+    for row in rows:
+        row_type, completed_count, failed_count, retries, latency_sum = row[:5]
+        finished = completed_count + failed_count
+        result[row_type] = {
+            'completed': completed_count,
+            'failed': failed_count,
+            'success_rate': completed_count / finished if finished else None,
+            'retries': int(retries),
+            'retrying': retrying.pop(row_type, 0),
+            'latency_seconds': {
+                'buckets': {str(bound): count for bound, count in zip(LATENCY_BUCKETS, row[5:])},
+                'count': completed_count,
+                'sum': float(latency_sum)
+            }
+        }
+
+    # Types with retries pending but nothing finished in the window
+    for row_type, count in retrying.items():
+        result[row_type] = {
+            'completed': 0,
+            'failed': 0,
+            'success_rate': None,
+            'retries': 0,
+            'retrying': count,
+            'latency_seconds': {
+                'buckets': {str(bound): 0 for bound in LATENCY_BUCKETS},
+                'count': 0,
+                'sum': 0.0
+            }
+        }
+    return result
+
+
+def queue_metrics(window_seconds=DEFAULT_WINDOW_SECONDS):
+    """
+    Depth, lag, throughput and latency of both queues.
+    Must be called inside an application context.
+
+    Args:
+        window_seconds: Trailing window for throughput, success rates and latency
+
+    Returns:
+        dict: {'task_queue': {...}, 'ai_evaluation_queue': {...}} with 'depth' (per type
+              and status) and 'throughput' (per type) for each queue
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(seconds=window_seconds)
+    return {
+        'generated_at': now.isoformat(),
+        'window_seconds': window_seconds,
+        'task_queue': {
+            'depth': _depth(TaskQueue, now),
+            'throughput': _throughput(TaskQueue, 'task_queue', since)
+        },
+        'ai_evaluation_queue': {
+            'depth': _depth(AIEvaluationQueue, now),
+            'throughput': _throughput(AIEvaluationQueue, 'ai_evaluation_queue', since)
+        }
+    }
+
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    """Prometheus label set"""
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus_text(metrics=None, window_seconds=DEFAULT_WINDOW_SECONDS):
+    """
+    Render queue metrics in the Prometheus text exposition format.
+
+    Throughput, retry and latency series cover the trailing window rather than the
+    process lifetime, so they are all exposed as gauges; the latency distribution
+    is a gauge per bucket bound (le) instead of a histogram.
+
+    Args:
+        metrics: Result of queue_metrics(), computed when omitted
+        window_seconds: Window used when computing the metrics
+
+    Returns:
+        str: Exposition text
+    """
+    metrics = metrics or queue_metrics(window_seconds)
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {value}")
+
+    queues = ('task_queue', 'ai_evaluation_queue')
+
+    depth = [(queue, row) for queue in queues for row in metrics[queue]['depth']]
+    metric('homebase_queue_depth', 'gauge', 'Open tasks by type and status',
+           [({'queue': q, 'task_type': r['task_type'], 'status': r['status']}, r['count']) for q, r in depth])
+    metric('homebase_queue_due', 'gauge', 'Open tasks whose execution time has passed',
+           [({'queue': q, 'task_type': r['task_type'], 'status': r['status']}, r['due']) for q, r in depth])
+    metric('homebase_queue_oldest_due_age_seconds', 'gauge', 'Age of the oldest due open task',
+           [({'queue': q, 'task_type': r['task_type'], 'status': r['status']}, r['oldest_due_age_seconds'])
+            for q, r in depth])
+
+    throughput = [(queue, task_type, stats) for queue in queues
+                  for task_type, stats in sorted(metrics[queue]['throughput'].items())]
+    window = metrics['window_seconds']
+    metric('homebase_queue_completed', 'gauge', f'Tasks completed in the last {window}s',
+           [({'queue': q, 'task_type': t}, s['completed']) for q, t, s in throughput])
+    metric('homebase_queue_failed', 'gauge', f'Tasks failed permanently in the last {window}s',
+           [({'queue': q, 'task_type': t}, s['failed']) for q, t, s in throughput])
+    metric('homebase_queue_success_ratio', 'gauge', f'Completed / finished tasks in the last {window}s',
+           [({'queue': q, 'task_type': t}, s['success_rate']) for q, t, s in throughput
+            if s['success_rate'] is not None])
+    metric('homebase_queue_retries', 'gauge', f'Retries used by tasks finished in the last {window}s',
+           [({'queue': q, 'task_type': t}, s['retries']) for q, t, s in throughput])
+    metric('homebase_queue_retrying', 'gauge', 'Tasks waiting for a retry',
+           [({'queue': q, 'task_type': t}, s['retrying']) for q, t, s in throughput])
+
+    # Windowed counts go down as old tasks leave the window, so the latency
+    # distribution is published as gauges rather than as a Prometheus histogram
+    metric('homebase_queue_completed_within', 'gauge',
+           f'Tasks completed in the last {window}s within le seconds of being claimed',
+           [({'queue': q, 'task_type': t, 'le': bound}, count) for q, t, s in throughput
+            for bound, count in list(s['latency_seconds']['buckets'].items())
+            + [('+Inf', s['latency_seconds']['count'])]])
+    metric('homebase_queue_latency_sum_seconds', 'gauge',
+           f'Total claim-to-complete latency of tasks completed in the last {window}s',
+           [({'queue': q, 'task_type': t}, s['latency_seconds']['sum']) for q, t, s in throughput])
+    metric('homebase_queue_latency_samples', 'gauge',
+           f'Tasks completed in the last {window}s with a measured latency',
+           [({'queue': q, 'task_type': t}, s['latency_seconds']['count']) for q, t, s in throughput])
+
+    return '\n'.join(lines) + '\n'
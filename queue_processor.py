@@ -1,13 +1,22 @@
 import os
 import json
+import socket
+import signal
 import logging
 import argparse
-import time
+import threading
+import multiprocessing
 import traceback
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
 from app import app, db
 from models import Object, TaskQueue, Reminder
+from queue_listener import QueueListener, seconds_until_next_task
+from retry_policy import RetryPolicy, get_retry_policy
+from job_scheduler import JobScheduler
+import maintenance_jobs  # noqa: F401 - declares the periodic jobs
+from task_registry import (HANDLERS, PRIORITY_CLASSES, TaskTimeout, ClaimLost, task_handler, get_handler,
+                           handlers_by_priority, held_claims, run_handler, run_batch_handler)
 
 # Setup logging
 logging.basicConfig(
@@ -18,126 +27,433 @@ logging.basicConfig(
 )
 logger = logging.getLogger('queue_processor')
 
-def process_tasks():
+# Worker pool defaults, overridable per node through the environment
+DEFAULT_WORKERS = int(os.environ.get('QUEUE_WORKERS', 2))
+DEFAULT_WORKER_MODE = os.environ.get('QUEUE_WORKER_MODE', 'thread')
+DEFAULT_BATCH_SIZE = int(os.environ.get('QUEUE_BATCH_SIZE', 10))
+DEFAULT_LEASE_SECONDS = int(os.environ.get('QUEUE_LEASE_SECONDS', TaskQueue.DEFAULT_LEASE_SECONDS))
+DEFAULT_POLL_INTERVAL = float(os.environ.get('QUEUE_POLL_INTERVAL', 60))
+DEFAULT_SCHEDULER = os.environ.get('QUEUE_SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+
+# Extra lease time beyond a handler's timeout. Running handlers also renew their
+# lease every task_registry.HEARTBEAT_INTERVAL seconds, so the margin only covers
+# the gap between the handler finishing and its completion being committed.
+LEASE_MARGIN_SECONDS = 60
+
+# Seconds a due task of a lower priority class waits before it is claimed ahead of
+# the higher classes
+PRIORITY_AGING_SECONDS = int(os.environ.get('QUEUE_PRIORITY_AGING_SECONDS', 900))
+
+def default_worker_id(index=0):
+    """Identifier for a worker: host, process and worker index"""
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+def _handler_lease(handler, lease_seconds):
+    """Claim lease for a handler's tasks: never shorter than its timeout plus a margin"""
+    if handler is None:
+        return lease_seconds
+    return max(lease_seconds, handler.timeout + LEASE_MARGIN_SECONDS)
+
+def claim_batch(worker_id, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Claim up to batch_size tasks for a worker.
+    
+    Registered task types are offered work by priority class (high, normal, low),
+    each limited to its own batch size and cluster-wide max concurrency. Tasks of
+    lower classes that have been due for over PRIORITY_AGING_SECONDS are offered
+    work first, so a steady stream of high priority work cannot starve them. A
+    batch handler's tasks run in a single handler call, so they count as one unit
+    of batch_size however many are claimed. Tasks of unregistered types are claimed
+    last, only to be dead-lettered.
+    
+    Returns:
+        list: Claimed TaskQueue objects
     """
-    Main function to process all pending tasks in the queue.
+    handlers = handlers_by_priority()
+    aged_before = datetime.utcnow() - timedelta(seconds=PRIORITY_AGING_SECONDS)
+    passes = [(handler, aged_before) for handler in handlers
+              if handler.priority_class != PRIORITY_CLASSES[0]]
+    passes += [(handler, None) for handler in handlers]
+    
+    tasks = []
+    remaining = batch_size
+    for handler, due_before in passes:
+        if remaining <= 0:
+            return tasks
+        claimed = TaskQueue.claim_tasks(
+            worker_id,
+            limit=handler.batch_size if handler.batch else min(handler.batch_size, remaining),
+            lease_seconds=_handler_lease(handler, lease_seconds),
+            task_types=[handler.task_type],
+            max_in_flight=handler.max_concurrency,
+            due_before=due_before
+        )
+        if claimed:
+            remaining -= 1 if handler.batch else len(claimed)
+        tasks += claimed
+    
+    if remaining > 0:
+        tasks += TaskQueue.claim_tasks(
+            worker_id,
+            limit=remaining,
+            lease_seconds=lease_seconds,
+            exclude_types=list(HANDLERS)
+        )
+    return tasks
+
+def process_tasks(worker_id=None, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
     """
-    logger.info("Starting task queue processor")
+    Claim and process one batch of pending tasks.
+    
+    Tasks are claimed atomically (FOR UPDATE SKIP LOCKED), so any number of workers
+    can run this concurrently without processing a task twice. Each task runs through
+    its registered handler (see task_registry) with that handler's timeout; tasks of
+    a batch handler go through it together.
+    
+    Args:
+        worker_id: Identifier of this worker, defaults to host:pid:0
+        batch_size: Maximum number of tasks to claim
+        lease_seconds: Claim lease; unfinished tasks are reclaimed after it expires
+        
+    Returns:
+        int: Number of tasks claimed
+    """
+    worker_id = worker_id or default_worker_id()
     
     with app.app_context():
-        # Get all pending tasks that are ready to be executed
-        tasks = TaskQueue.get_pending_tasks()
+        reclaimed = TaskQueue.reclaim_expired_leases()
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} tasks with expired leases")
+        
+        tasks = claim_batch(worker_id, batch_size=batch_size, lease_seconds=lease_seconds)
         
         if not tasks:
-            logger.info("No pending tasks found")
-            return
+            logger.debug(f"[{worker_id}] No pending tasks found")
+            return 0
         
-        logger.info(f"Found {len(tasks)} pending tasks to process")
+        logger.info(f"[{worker_id}] Claimed {len(tasks)} tasks")
         
+        # Tasks of a batch handler run together, at the position of the first one
+        units = []
+        batches = {}
         for task in tasks:
-            try:
-                # Mark task as processing
-                task.status = 'processing'
-                task.last_attempt = datetime.utcnow()
-                task.attempts += 1
-                db.session.commit()
-                
-                logger.info(f"Processing task {task.id} of type {task.task_type}")
-                
-                # Process task based on type
-                result = None
-                if task.task_type == 'consumable_expiration':
-                    result = process_consumable_expiration(task)
-                elif task.task_type == 'stock_check':
-                    result = process_stock_check(task)
-                else:
-                    logger.warning(f"Unknown task type: {task.task_type}")
-                    task.status = 'failed'
-                    task.error_message = f"Unknown task type: {task.task_type}"
-                    db.session.commit()
-                    continue
-                
-                # Mark task as completed
-                task.status = 'completed'
-                task.completed_at = datetime.utcnow()
-                task.result = result
-                db.session.commit()
-                logger.info(f"Task {task.id} completed successfully")
-                
-            except Exception as e:
-                logger.error(f"Error processing task {task.id}: {str(e)}")
-                logger.error(traceback.format_exc())
-                
-                # Mark task as failed
-                task.status = 'failed'
-                task.error_message = str(e)
-                db.session.commit()
+            handler = get_handler(task.task_type)
+            if handler is not None and handler.batch:
+                if task.task_type not in batches:
+                    batches[task.task_type] = []
+                    units.append((handler, batches[task.task_type]))
+                batches[task.task_type].append(task)
+            else:
+                units.append((handler, [task]))
+        
+        for handler, unit in units:
+            if handler is not None and handler.batch:
+                _process_batch(worker_id, handler, unit, lease_seconds)
+            else:
+                _process_task(worker_id, handler, unit[0], lease_seconds)
+        
+        return len(tasks)
 
-def process_consumable_expiration(task):
+def _runnable(task):
+    """
+    Dead-letter a claimed task that must not run, otherwise return True.
     """
-    Process a consumable expiration task.
-    Reduces the quantity of a consumable when it expires.
+    if get_handler(task.task_type) is None:
+        # Retrying cannot help; park it until a handler exists
+        logger.warning(f"Unknown task type: {task.task_type}")
+        _dead_letter(task, f"Unknown task type: {task.task_type}")
+        return False
     
-    Args:
-        task: TaskQueue object with task_type='consumable_expiration'
+    # Guard against tasks whose status was reset by hand after exhausting retries
+    policy = get_retry_policy(task.task_type)
+    if (task.attempts or 0) > policy.max_attempts:
+        _dead_letter(task, f"Exceeded {policy.max_attempts} attempts")
+        return False
+    
+    return True
+
+def _process_task(worker_id, handler, task, lease_seconds):
+    """Run one claimed task through its handler and record the outcome"""
+    task_id = task.id
+    claim = {task_id: task.attempts}
+    try:
+        # Later tasks in the batch have been waiting; refresh the claim first
+        if not TaskQueue.renew_lease(task_id, worker_id, _handler_lease(handler, lease_seconds)):
+            logger.warning(f"[{worker_id}] Lost lease on task {task_id}, skipping")
+            return
         
-    Returns:
-        dict: Result information
+        if not _runnable(task):
+            return
+        
+        logger.info(f"[{worker_id}] Processing task {task_id} of type {task.task_type}")
+        lease = _handler_lease(handler, lease_seconds)
+        run_handler(handler, task_id, worker_id, claim[task_id],
+                    heartbeat=lambda: TaskQueue.renew_lease(task_id, worker_id, lease))
+        
+        # The task was completed and committed by the handler's session
+        db.session.expire_all()
+        logger.info(f"Task {task_id} completed successfully")
+        
+    except ClaimLost as e:
+        db.session.rollback()
+        logger.warning(f"[{worker_id}] Task {task_id}: {str(e)}; its changes were discarded")
+        
+    except Exception as e:
+        logger.error(f"Error processing task {task_id}: {str(e)}")
+        if not isinstance(e, TaskTimeout):
+            logger.error(traceback.format_exc())
+        
+        db.session.rollback()
+        _retry_held(worker_id, claim, [task], str(e))
+    
+    finally:
+        _slot_released(handler)
+
+def _process_batch(worker_id, handler, tasks, lease_seconds):
+    """
+    Run all claimed tasks of a batch handler's type in one handler call.
+    
+    The handler's changes and the completed tasks are committed together by
+    run_batch_handler. If the handler fails as a whole, every task is retried;
+    tasks it reported as failed are retried on their own.
     """
-    logger.info(f"Processing consumable expiration for object {task.object_id}")
+    held = TaskQueue.renew_leases([task.id for task in tasks], worker_id,
+                                  _handler_lease(handler, lease_seconds))
+    runnable = []
+    for task in tasks:
+        if task.id not in held:
+            logger.warning(f"[{worker_id}] Lost lease on task {task.id}, skipping")
+        elif _runnable(task):
+            runnable.append(task)
     
-    # Get the consumable object
-    obj = Object.query.get(task.object_id)
-    if not obj:
-        return {'error': f"Object with ID {task.object_id} not found"}
+    if not runnable:
+        return
     
-    if obj.object_type != 'consumable':
-        return {'error': f"Object {task.object_id} is not a consumable"}
-        
-    # Get the expiring quantity from task data
-    expiring_quantity = task.data.get('quantity', 1)
+    logger.info(f"[{worker_id}] Processing {len(runnable)} tasks of type {handler.task_type} as one batch")
+    claims = {task.id: task.attempts for task in runnable}
+    lease = _handler_lease(handler, lease_seconds)
+    try:
+        failures = run_batch_handler(
+            handler, claims, worker_id,
+            heartbeat=lambda: TaskQueue.renew_leases(list(claims), worker_id, lease) == set(claims)
+        )
+    except Exception as e:
+        logger.error(f"Error processing {handler.task_type} batch of {len(runnable)} tasks: {str(e)}")
+        if not isinstance(e, (TaskTimeout, ClaimLost)):
+            logger.error(traceback.format_exc())
+        db.session.rollback()
+        _retry_held(worker_id, claims, runnable, str(e))
+        return
+    
+    # The completed tasks were committed by the handler's session
+    db.session.expire_all()
+    for task in runnable:
+        if task.id in failures:
+            logger.error(f"Error processing task {task.id}: {failures[task.id]}")
+            _schedule_retry(task, failures[task.id])
     
-    # Get current quantity
-    current_quantity = obj.data.get('quantity', 0)
+    logger.info(f"{handler.task_type} batch completed: {len(runnable) - len(failures)} succeeded, "
+                f"{len(failures)} failed")
+
+def _slot_released(handler):
+    """
+    Wake idle workers once a task of a type with max_concurrency stops running.
+    They do not wait for overdue tasks of a type at its cap, so without this they
+    would only claim the next one after their poll interval.
+    """
+    if handler is None or handler.max_concurrency is None:
+        return
+    TaskQueue.notify_workers({'released': handler.task_type})
+    db.session.commit()
+
+def _retry_held(worker_id, claims, tasks, error):
+    """
+    Schedule retries for the failed tasks this worker still holds.
     
-    # Calculate new quantity
-    new_quantity = max(0, current_quantity - expiring_quantity)
+    A handler thread abandoned on timeout may still be running. Locking the task
+    rows first means it either committed already (the task is no longer held, so
+    it is not retried) or its commit will fail the claim check after the retry.
+    """
+    held = held_claims(claims, worker_id)
+    for task in tasks:
+        if task.id in held:
+            _schedule_retry(task, error)
+        else:
+            logger.warning(f"[{worker_id}] Task {task.id} is no longer held by this attempt; not retrying")
+    db.session.commit()
+
+def _release(task):
+    """Clear the worker claim on a finished task"""
+    task.locked_by = None
+    task.lease_expires_at = None
+
+def _schedule_retry(task, error):
+    """
+    Record a failed attempt: reschedule the task with backoff, or move it to
+    dead_letter once its retry policy is exhausted.
+    """
+    policy = get_retry_policy(task.task_type)
+    if policy.exhausted(task.attempts):
+        _dead_letter(task, error)
+        return
+    
+    task.status = 'pending'
+    task.execute_at = policy.next_execute_at(task.attempts)
+    task.error_message = f"Attempt {task.attempts} failed: {error}"
+    _release(task)
+    db.session.commit()
+    logger.info(f"Task {task.id} will retry at {task.execute_at.isoformat()} "
+                f"(attempt {task.attempts} of {policy.max_attempts})")
+
+def _dead_letter(task, error):
+    """Park a task that will not be retried automatically"""
+    task.status = TaskQueue.DEAD_LETTER
+    task.error_message = error
+    _release(task)
+    db.session.commit()
+    logger.error(f"Task {task.id} ({task.task_type}) moved to dead letter after "
+                 f"{task.attempts} attempts: {error}")
+
+@task_handler('consumable_expiration', timeout=120, priority_class='high', batch_size=500, batch=True,
+              retry_policy=RetryPolicy(max_attempts=5, base_delay=15, backoff_factor=2.0, max_delay=900))
+def process_consumable_expirations(tasks):
+    """
+    Process every due consumable expiration task in one pass.
+    Reduces the quantity of each consumable by the amount that expired.
     
-    # Update the object
-    obj.data['quantity'] = new_quantity
+    Tasks come from TaskQueue.schedule_consumable_expiration, one per consumable and
+    expiry date, so a shopping trip produces many tasks due in the same window. Their
+    objects are loaded (and locked) in one query. Windows are applied in order; within
+    a window each object's decrements are applied in execution order and its data is
+    written once. All low-stock items are merged into the shopping list at once.
+    Quantities are parsed with Object.parse_stock_number, and tasks whose numbers do
+    not parse are skipped with an error result. Nothing is committed here:
+    run_batch_handler commits the changes together with the completed tasks.
     
-    # If this consumable is stock tracked and quantity is now 0 or below threshold, 
-    # add it to the shopping list
-    track_stock = obj.data.get('track_stock', False)
-    reorder_threshold = obj.data.get('reorder_threshold', 0)
+    Args:
+        tasks: TaskQueue objects with task_type='consumable_expiration'
+        
+    Returns:
+        dict: Result information per task ID
+    """
+    windows = {}
+    for task in tasks:
+        windows.setdefault(task.execute_at.date() if task.execute_at else None, []).append(task)
+    logger.info(f"Processing {len(tasks)} consumable expirations in {len(windows)} execution windows")
     
-    if track_stock and new_quantity <= reorder_threshold:
-        # Add to shopping list
-        add_to_shopping_list(obj)
+    object_ids = {task.object_id for task in tasks if task.object_id}
+    objects = {
+        obj.id: obj
+        for obj in Object.query.filter(Object.id.in_(object_ids)).order_by(Object.id).with_for_update()
+    } if object_ids else {}
     
-    # If not stock tracked and quantity is 0, mark for deletion
-    if not track_stock and new_quantity <= 0:
-        obj.data['marked_for_deletion'] = True
+    results = {}
+    low_stock = {}
+    # Windows in execution order; within a window each object's decrements are applied
+    # in order and its data is written back once
+    for window in sorted(windows, key=lambda day: day or date.min):
+        by_object = {}
+        for task in sorted(windows[window], key=lambda t: (t.execute_at or datetime.min, t.id)):
+            by_object.setdefault(task.object_id, []).append(task)
         
-    # Save changes
-    db.session.commit()
+        for object_id, object_tasks in by_object.items():
+            obj = objects.get(object_id)
+            if not obj:
+                for task in object_tasks:
+                    results[task.id] = {'error': f"Object with ID {object_id} not found"}
+                continue
+            
+            if obj.object_type != 'consumable':
+                for task in object_tasks:
+                    results[task.id] = {'error': f"Object {object_id} is not a consumable"}
+                continue
+            
+            try:
+                _expire_consumable(obj, object_tasks, results, low_stock)
+            except Exception as e:
+                # Only these tasks are retried
+                for task in object_tasks:
+                    results[task.id] = e
     
-    # Return result info
-    return {
-        'object_id': obj.id,
-        'name': obj.data.get('name', 'Unknown Consumable'),
-        'previous_quantity': current_quantity,
-        'expired_quantity': expiring_quantity,
-        'new_quantity': new_quantity,
-        'track_stock': track_stock,
-        'added_to_shopping_list': track_stock and new_quantity <= reorder_threshold
-    }
+    add_items_to_shopping_list(list(low_stock.values()), commit=False)
+    return results
+
+def _stock_number(value):
+    """Parse a stock quantity from JSON data, keeping whole numbers as ints; None when invalid"""
+    number = Object.parse_stock_number(value, default=None)
+    if number is None:
+        return None
+    return int(number) if number.is_integer() else number
+
+def _expire_consumable(obj, tasks, results, low_stock):
+    """
+    Apply one window's expiration tasks to a consumable and write its data back once.
+    
+    Tasks whose quantities cannot be parsed are skipped with an error result.
+    """
+    data = dict(obj.data or {})
+    name = data.get('name', 'Unknown Consumable')
+    track_stock = data.get('track_stock', False)
+    reorder_threshold = _stock_number(data.get('reorder_threshold', 0))
+    if reorder_threshold is None:
+        logger.warning(f"Consumable {obj.id} has an invalid reorder threshold "
+                       f"{data.get('reorder_threshold')!r}; skipping its expirations")
+        for task in tasks:
+            results[task.id] = {'error': f"Invalid reorder threshold for object {obj.id}"}
+        return
+    
+    changed = False
+    for task in tasks:
+        current_quantity = _stock_number(data.get('quantity', 0))
+        # Get the expiring quantity from task data
+        expiring_quantity = _stock_number((task.data or {}).get('quantity', 1))
+        if current_quantity is None or expiring_quantity is None:
+            logger.warning(f"Skipping expiration task {task.id}: invalid quantity "
+                           f"(object {obj.id} has {data.get('quantity')!r}, "
+                           f"expiring {(task.data or {}).get('quantity')!r})")
+            results[task.id] = {'error': f"Invalid quantity for object {obj.id}"}
+            continue
+        
+        new_quantity = max(0, current_quantity - expiring_quantity)
+        data['quantity'] = new_quantity
+        changed = True
+        
+        # If this consumable is stock tracked and quantity is now 0 or below threshold,
+        # add it to the shopping list
+        added_to_shopping_list = bool(track_stock and new_quantity <= reorder_threshold)
+        if added_to_shopping_list:
+            low_stock[obj.id] = shopping_list_item(obj.id, obj.object_type, data.get('name'),
+                                                   new_quantity, reorder_threshold)
+        
+        # If not stock tracked and quantity is 0, mark for deletion
+        if not track_stock and new_quantity <= 0:
+            data['marked_for_deletion'] = True
+        
+        results[task.id] = {
+            'object_id': obj.id,
+            'name': name,
+            'previous_quantity': current_quantity,
+            'expired_quantity': expiring_quantity,
+            'new_quantity': new_quantity,
+            'track_stock': track_stock,
+            'added_to_shopping_list': added_to_shopping_list
+        }
+    
+    if changed:
+        # Reassign so the JSON change is saved
+        obj.data = data
 
+@task_handler('stock_check', max_concurrency=1, timeout=600, priority_class='low', batch_size=1,
+              retry_policy=RetryPolicy(max_attempts=3, base_delay=300, backoff_factor=3.0, max_delay=7200))
 def process_stock_check(task):
     """
     Process a stock check task.
     Checks inventory levels for all tracked consumables and components.
     
+    Low-stock items are found with one query over the typed stock columns and
+    merged into the shopping list with a single update, committed by run_handler
+    together with the task's completion.
+    
     Args:
         task: TaskQueue object with task_type='stock_check'
         
@@ -146,51 +462,172 @@ def process_stock_check(task):
     """
     logger.info("Processing stock check task")
     
-    # Get all consumables and components that are stock tracked
-    consumables = Object.query.filter_by(object_type='consumable').all()
-    components = Object.query.filter_by(object_type='component').all()
+    stock_types = ('consumable', 'component')
     
-    low_stock_items = []
+    items_checked = db.session.query(db.func.count(Object.id)).filter(
+        Object.object_type.in_(stock_types)
+    ).scalar()
     
-    # Check consumables
-    for item in consumables:
-        if item.data.get('track_stock', False):
-            quantity = item.data.get('quantity', 0)
-            threshold = item.data.get('reorder_threshold', 0)
-            
-            if quantity <= threshold:
-                low_stock_items.append(item)
-                logger.info(f"Consumable {item.id} ({item.data.get('name')}) is below threshold: {quantity}/{threshold}")
-    
-    # Check components
-    for item in components:
-        if item.data.get('track_stock', False):
-            quantity = item.data.get('quantity', 0)
-            threshold = item.data.get('reorder_threshold', 0)
-            
-            if quantity <= threshold:
-                low_stock_items.append(item)
-                logger.info(f"Component {item.id} ({item.data.get('name')}) is below threshold: {quantity}/{threshold}")
-    
-    # Add all low stock items to shopping list
-    for item in low_stock_items:
-        add_to_shopping_list(item)
-    
-    # Schedule next stock check (weekly)
-    next_check = datetime.utcnow() + timedelta(days=7)
-    TaskQueue.queue_task({
-        'task_type': 'stock_check',
-        'execute_at': next_check,
-        'priority': 2,  # Medium-low priority
-        'data': {}
-    })
+    low_stock_items = db.session.query(
+        Object.id,
+        Object.object_type,
+        Object.data['name'].astext,
+        Object.data['quantity'],
+        Object.data['reorder_threshold']
+    ).filter(
+        Object.object_type.in_(stock_types),
+        Object.track_stock == True,
+        Object.stock_quantity <= Object.reorder_threshold
+    ).order_by(Object.id).all()
+    
+    for obj_id, object_type, name, quantity, threshold in low_stock_items:
+        logger.info(f"{object_type.capitalize()} {obj_id} ({name}) is below threshold: {quantity}/{threshold}")
     
+    # Add all low stock items to shopping list, committed with the task's completion
+    added = add_items_to_shopping_list([
+        shopping_list_item(obj_id, object_type, name, quantity, threshold)
+        for obj_id, object_type, name, quantity, threshold in low_stock_items
+    ], commit=False)
+    
+    # The next weekly check is queued by the 'stock_check' periodic job
     return {
-        'items_checked': len(consumables) + len(components),
+        'items_checked': items_checked,
         'low_stock_items': len(low_stock_items),
-        'next_check': next_check.isoformat()
+        'added_to_shopping_list': added
+    }
+
+@task_handler('asset_valuation', max_concurrency=1, timeout=1800, priority_class='low', batch_size=1,
+              retry_policy=RetryPolicy(max_attempts=3, base_delay=600, backoff_factor=4.0, max_delay=21600))
+def process_asset_valuation(task):
+    """
+    Process an asset valuation task.
+    Recomputes and persists monthly book values for all depreciable objects.
+    
+    Args:
+        task: TaskQueue object with task_type='asset_valuation'
+        
+    Returns:
+        dict: Result information
+    """
+    from valuation import persist_book_values
+    
+    logger.info("Processing asset valuation task")
+    
+    # The next monthly refresh is queued by the 'asset_valuation' periodic job; the
+    # book values are committed by run_handler together with the task's completion
+    return persist_book_values(months_ahead=(task.data or {}).get('months_ahead', 12), commit=False)
+
+@task_handler('ai_evaluation', max_concurrency=1, timeout=1800, priority_class='low', batch_size=1,
+              retry_policy=RetryPolicy(max_attempts=3, base_delay=300, backoff_factor=4.0, max_delay=7200))
+def process_ai_evaluation(task):
+    """
+    Process an AI evaluation task.
+    Drains the due entries of the AI evaluation queue within today's budget.
+    
+    Args:
+        task: TaskQueue object with task_type='ai_evaluation'
+        
+    Returns:
+        dict: Result information
+    """
+    from ai_evaluation import run_evaluations
+    
+    logger.info("Processing AI evaluation task")
+    
+    # Queued hourly by the 'ai_evaluation' periodic job; the daily budget caps
+    # how much each day gets done
+    options = task.data or {}
+    return run_evaluations(
+        limit=options.get('limit'),
+        stale_after=get_handler(task.task_type).timeout,
+        **{key: options[key] for key in ('concurrency', 'provider') if key in options}
+    )
+
+def shopping_list_item(obj_id, object_type, name, quantity, reorder_threshold):
+    """Build a shopping list entry for a low-stock object"""
+    return {
+        'object_id': obj_id,
+        'name': name or 'Unknown Item',
+        'object_type': object_type,
+        'current_quantity': quantity if quantity is not None else 0,
+        'suggested_quantity': max(1, reorder_threshold if reorder_threshold is not None else 1),
+        'purchased': False,
+        'added_at': datetime.utcnow().isoformat()
     }
 
+def add_items_to_shopping_list(items, commit=True):
+    """
+    Merge items into the open shopping list reminder, creating it if needed.
+    
+    Items whose object is already on the list are skipped. The merge is a single
+    UPDATE done inside the database, under a transaction-level advisory lock so
+    concurrent workers cannot create two lists or lose each other's items.
+    
+    Args:
+        items: List of dicts from shopping_list_item()
+        commit: Commit the transaction (False lets a caller batch more work into it)
+        
+    Returns:
+        int: Number of items added
+    """
+    if not items:
+        return 0
+    
+    db.session.execute(db.text("SELECT pg_advisory_xact_lock(hashtext('shopping_list'))"))
+    
+    shopping_list_id = db.session.query(Reminder.id).filter_by(
+        reminder_type='shopping_list',
+        status='open'
+    ).order_by(Reminder.id).limit(1).scalar()
+    
+    if shopping_list_id is None:
+        # Create a new shopping list
+        shopping_list = Reminder(
+            title="Shopping List - Inventory Restock",
+            description="Items that need to be reordered based on inventory thresholds",
+            reminder_type='shopping_list',
+            status='open',
+            due_date=datetime.utcnow() + timedelta(days=7),
+            items=[]
+        )
+        db.session.add(shopping_list)
+        db.session.flush()  # Get the ID without committing
+        shopping_list_id = shopping_list.id
+    
+    # Append the items not already on the list; duplicates within items keep the first
+    added = db.session.execute(db.text("""
+        WITH incoming AS (
+            SELECT DISTINCT ON (item->>'object_id') item, ord
+            FROM jsonb_array_elements(CAST(:items AS jsonb)) WITH ORDINALITY AS t(item, ord)
+            ORDER BY item->>'object_id', ord
+        ),
+        new_items AS (
+            SELECT item, ord FROM incoming
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM reminders r, jsonb_array_elements(COALESCE(r.items, '[]'::jsonb)) existing
+                WHERE r.id = :reminder_id
+                  AND existing->>'object_id' = incoming.item->>'object_id'
+            )
+        )
+        UPDATE reminders
+        SET items = COALESCE(items, '[]'::jsonb)
+                    || (SELECT COALESCE(jsonb_agg(item ORDER BY ord), '[]'::jsonb) FROM new_items),
+            updated_at = :now
+        WHERE id = :reminder_id
+        RETURNING (SELECT COUNT(*) FROM new_items)
+    """), {
+        'items': json.dumps(items),
+        'reminder_id': shopping_list_id,
+        'now': datetime.utcnow()
+    }).scalar()
+    
+    if commit:
+        db.session.commit()
+    
+    logger.info(f"Added {added} of {len(items)} items to shopping list {shopping_list_id}")
+    return added
+
 def add_to_shopping_list(obj):
     """
     Add an item to the shopping list reminder.
@@ -202,52 +639,10 @@ def add_to_shopping_list(obj):
         bool: Success status
     """
     try:
-        # Get the current shopping list or create a new one
-        shopping_list = Reminder.query.filter_by(
-            reminder_type='shopping_list',
-            status='open'
-        ).first()
-        
-        if not shopping_list:
-            # Create a new shopping list
-            shopping_list = Reminder(
-                title="Shopping List - Inventory Restock",
-                description="Items that need to be reordered based on inventory thresholds",
-                reminder_type='shopping_list',
-                status='open',
-                due_date=datetime.utcnow() + timedelta(days=7),
-                items=[]
-            )
-            db.session.add(shopping_list)
-            db.session.flush()  # Get the ID without committing
-            
-        # Get current items
-        items = shopping_list.items or []
-        
-        # Check if the item is already in the list
-        for item in items:
-            if item.get('object_id') == obj.id:
-                logger.info(f"Item {obj.id} ({obj.data.get('name')}) already in shopping list")
-                return True
-        
-        # Add the item
-        suggested_quantity = max(1, obj.data.get('reorder_threshold', 1))
-        
-        items.append({
-            'object_id': obj.id,
-            'name': obj.data.get('name', 'Unknown Item'),
-            'object_type': obj.object_type,
-            'current_quantity': obj.data.get('quantity', 0),
-            'suggested_quantity': suggested_quantity,
-            'purchased': False,
-            'added_at': datetime.utcnow().isoformat()
-        })
-        
-        # Update the shopping list
-        shopping_list.items = items
-        db.session.commit()
-        
-        logger.info(f"Added {obj.data.get('name')} to shopping list")
+        add_items_to_shopping_list([
+            shopping_list_item(obj.id, obj.object_type, obj.data.get('name'),
+                               obj.data.get('quantity', 0), obj.data.get('reorder_threshold', 1))
+        ])
         return True
         
     except Exception as e:
@@ -255,21 +650,163 @@ def add_to_shopping_list(obj):
         db.session.rollback()
         return False
 
+def run_worker(index=0, stop_event=None, batch_size=DEFAULT_BATCH_SIZE,
+               lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+               listener=None):
+    """
+    Worker loop: keep claiming batches while work is available, otherwise sleep
+    until a task is queued (LISTEN/NOTIFY), the next scheduled task is due, or
+    poll_interval seconds pass.
+    
+    Args:
+        index: Worker index within this process
+        stop_event: Optional threading/multiprocessing Event that ends the loop
+        listener: QueueListener shared by this process's workers; one is started if omitted
+    """
+    worker_id = default_worker_id(index)
+    stop_event = stop_event or threading.Event()
+    own_listener = listener is None
+    if own_listener:
+        listener = QueueListener().start()
+    logger.info(f"Worker {worker_id} started")
+    
+    try:
+        while not stop_event.is_set():
+            generation = listener.generation
+            try:
+                claimed = process_tasks(worker_id, batch_size=batch_size, lease_seconds=lease_seconds)
+            except Exception as e:
+                logger.error(f"Error in worker {worker_id}: {str(e)}")
+                claimed = 0
+            
+            # A full batch means there is probably more work waiting
+            if claimed >= batch_size:
+                continue
+            
+            try:
+                with app.app_context():
+                    timeout = seconds_until_next_task(poll_interval)
+            except Exception as e:
+                logger.error(f"Error finding next task time: {str(e)}")
+                timeout = poll_interval
+            
+            listener.wait(timeout, stop_event, generation)
+    finally:
+        if own_listener:
+            listener.stop()
+    
+    logger.info(f"Worker {worker_id} stopped")
+
+def _run_process_worker(index, stop_event, batch_size, lease_seconds, poll_interval):
+    """Entry point for process workers: drop connections inherited from the parent first"""
+    # The parent handles Ctrl+C and stops workers through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with app.app_context():
+        db.engine.dispose(close=False)
+    run_worker(index, stop_event, batch_size, lease_seconds, poll_interval)
+
+def run_worker_pool(workers=DEFAULT_WORKERS, mode='thread', batch_size=DEFAULT_BATCH_SIZE,
+                    lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL,
+                    scheduler=DEFAULT_SCHEDULER):
+    """
+    Run a pool of queue workers on this node until interrupted.
+    
+    Args:
+        workers: Number of concurrent workers
+        mode: 'thread' or 'process'
+        batch_size: Tasks claimed per batch by each worker
+        lease_seconds: Claim lease before a crashed worker's tasks are reclaimed
+        poll_interval: Fallback poll interval when no notification arrives
+        scheduler: Also run the periodic job scheduler (only the elected leader runs jobs)
+    """
+    if mode == 'process':
+        stop_event = multiprocessing.Event()
+        pool = [
+            multiprocessing.Process(
+                target=_run_process_worker,
+                args=(i, stop_event, batch_size, lease_seconds, poll_interval),
+                name=f"queue-worker-{i}"
+            )
+            for i in range(workers)
+        ]
+    else:
+        stop_event = threading.Event()
+        # Threads share one LISTEN connection
+        listener = QueueListener().start()
+        pool = [
+            threading.Thread(
+                target=run_worker,
+                args=(i, stop_event, batch_size, lease_seconds, poll_interval, listener),
+                name=f"queue-worker-{i}",
+                daemon=True
+            )
+            for i in range(workers)
+        ]
+    
+    # Container stop sends SIGTERM; finish the current tasks and exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    
+    logger.info(f"Starting {workers} queue workers ({mode} mode)")
+    for worker in pool:
+        worker.start()
+    
+    job_scheduler = JobScheduler().start() if scheduler else None
+    
+    try:
+        while not stop_event.is_set() and any(worker.is_alive() for worker in pool):
+            stop_event.wait(1)
+    except KeyboardInterrupt:
+        pass
+    
+    logger.info("Stopping queue workers")
+    stop_event.set()
+    if job_scheduler is not None:
+        job_scheduler.stop()
+    if mode != 'process':
+        listener.stop()
+    for worker in pool:
+        worker.join()
+
 def run_queue_processor_loop():
     """
     Run the queue processor in a continuous loop.
-    Processes tasks every minute.
+    Kept for backwards compatibility; runs a single worker.
     """
-    while True:
-        try:
-            process_tasks()
-        except Exception as e:
-            logger.error(f"Error in queue processor loop: {str(e)}")
-        
-        # Sleep for a minute
-        time.sleep(60)
+    run_worker()
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Process background tasks from the task queue")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Concurrent workers on this node (env QUEUE_WORKERS)")
+    parser.add_argument('--mode', choices=['thread', 'process'], default=DEFAULT_WORKER_MODE,
+                        help="Run workers as threads or processes (env QUEUE_WORKER_MODE)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Tasks claimed per batch (env QUEUE_BATCH_SIZE)")
+    parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="Claim lease before stuck tasks are reclaimed (env QUEUE_LEASE_SECONDS)")
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Fallback poll interval in seconds when no notification arrives "
+                             "(env QUEUE_POLL_INTERVAL)")
+    parser.add_argument('--no-scheduler', dest='scheduler', action='store_false', default=DEFAULT_SCHEDULER,
+                        help="Do not take part in running periodic jobs (env QUEUE_SCHEDULER=false)")
+    parser.add_argument('--once', action='store_true',
+                        help="Process a single batch and exit")
+    args = parser.parse_args()
+    
+    if args.once:
+        process_tasks(batch_size=args.batch_size, lease_seconds=args.lease_seconds)
+        return
+    
+    run_worker_pool(
+        workers=args.workers,
+        mode=args.mode,
+        batch_size=args.batch_size,
+        lease_seconds=args.lease_seconds,
+        poll_interval=args.poll_interval,
+        scheduler=args.scheduler
+    )
 
 if __name__ == "__main__":
-    # If run as a script, start the continuous processor loop
     logger.info("Starting queue processor in continuous loop mode")
-    run_queue_processor_loop()
\ No newline at end of file
+    main()
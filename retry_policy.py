@@ -0,0 +1,60 @@
+"""Retry policies for task queue failures: exponential backoff with jitter."""
+import random
+from datetime import datetime, timedelta
+
+
+class RetryPolicy:
+    """
+    How often and how quickly a failed task type is retried.
+
+    The delay before retry n (n = 1 after the first failure) is
+    base_delay * backoff_factor ** (n - 1), capped at max_delay. It is then
+    spread by +/- jitter (a fraction of the delay) so failures that happen
+    together are not retried together.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=30, backoff_factor=2.0, max_delay=3600, jitter=0.2):
+        self.max_attempts = max_attempts      # Total attempts, including the first
+        self.base_delay = base_delay          # Seconds before the first retry
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay            # Upper bound in seconds
+        self.jitter = jitter                  # 0.2 = +/- 20%
+
+    def __repr__(self):
+        return (f"<RetryPolicy max_attempts={self.max_attempts} base_delay={self.base_delay} "
+                f"backoff_factor={self.backoff_factor} jitter={self.jitter}>")
+
+    def exhausted(self, attempts):
+        """True when a task that has made this many attempts must not be retried"""
+        return (attempts or 0) >= self.max_attempts
+
+    def delay(self, attempts):
+        """
+        Seconds to wait before the next attempt.
+
+        Args:
+            attempts: Attempts made so far (1 after the first failure)
+
+        Returns:
+            float: Delay in seconds
+        """
+        delay = min(self.base_delay * self.backoff_factor ** max((attempts or 1) - 1, 0), self.max_delay)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(delay, 0)
+
+    def next_execute_at(self, attempts, now=None):
+        """Time of the next attempt after a failure"""
+        return (now or datetime.utcnow()) + timedelta(seconds=self.delay(attempts))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+# Per task type policies, filled in by @task_handler(retry_policy=...);
+# types not listed use DEFAULT_RETRY_POLICY
+RETRY_POLICIES = {}
+
+
+def get_retry_policy(task_type):
+    """Retry policy for a task type"""
+    return RETRY_POLICIES.get(task_type, DEFAULT_RETRY_POLICY)
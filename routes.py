@@ -1,11 +1,13 @@
 import os
 import json
 import base64
+import hashlib
 import logging
 from datetime import datetime, timedelta
 from openai import OpenAI
 from flask import render_template, request, redirect, url_for, flash, jsonify, session, Response
 from werkzeug.utils import secure_filename
+from sqlalchemy.orm import joinedload
 
 # Initialize OpenAI client
 openai = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
@@ -13,13 +15,14 @@ from app import app, db
 from models import (
     Invoice, InvoiceLineItem, Attachment, Object, Vendor, 
     PersonPetAssociation, AIEvaluationQueue, ObjectAttachment, Category,
-    AISettings, Reminder, TaskQueue,
+    AISettings, Reminder, TaskQueue, ScheduledJob,
     Organization, User, OrganizationContact, UserPersonMapping, UserAlias,
     Note, CalendarEvent, Collection, OrganizationRelationship,
     ReceiptCreationTracking
 )
 # Import our new log utilities
 from log_utils import get_logger, log_function_call
+import ai_context
 
 # Get a logger for this module
 logger = get_logger(__name__)
@@ -98,6 +101,235 @@ def index():
     logger.debug("Rendering index page")
     return render_template('index.html')
 
+def read_receipt_upload():
+    """
+    Receipt image posted by the upload form: a file (PDFs are converted to an
+    image) or a camera capture.
+    
+    Returns:
+        dict: file_data, filename, original_filename, file_type, capture_method,
+              upload_token (the form's idempotency key, or None) and warning (a
+              message when a PDF could not be converted, else None)
+        
+    Raises:
+        ValueError: Nothing was uploaded or the file format is not allowed
+    """
+    import base64
+    
+    # Check for camera-captured image data
+    camera_image_data = request.form.get('camera_image_data')
+    file = request.files.get('receipt_image')
+    
+    if not camera_image_data and (not file or file.filename == ''):
+        raise ValueError('No file uploaded or photo taken')
+    
+    if camera_image_data:
+        # Handle camera-captured image
+        logger.info("Processing camera-captured image")
+        
+        # Extract base64 image data (remove data:image/jpeg;base64, prefix)
+        if ',' in camera_image_data:
+            file_data = base64.b64decode(camera_image_data.split(',')[1])
+        else:
+            file_data = base64.b64decode(camera_image_data)
+        
+        filename = f"camera_receipt_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg"
+        original_filename = filename
+        
+    elif file and allowed_file(file.filename):
+        # Handle uploaded file
+        logger.info(f"Processing receipt file: {file.filename}")
+        file_data = file.read()
+        filename = secure_filename(file.filename)
+        original_filename = file.filename
+    else:
+        raise ValueError('Invalid file format')
+    
+    # Handle PDF conversion
+    warning = None
+    if filename.lower().endswith('.pdf'):
+        try:
+            logger.info(f"Processing PDF file: {filename}")
+            file_data = convert_pdf_to_image(file_data)
+            logger.info(f"Successfully converted PDF to image for processing")
+            filename = filename.rsplit('.', 1)[0] + '.jpg'
+        except Exception as pdf_error:
+            logger.error(f"Error converting PDF to image: {str(pdf_error)}")
+            warning = f"Error processing PDF: {str(pdf_error)}"
+    
+    return {
+        'file_data': file_data,
+        'filename': filename,
+        'original_filename': original_filename,
+        'file_type': 'image/jpeg' if camera_image_data else (file.content_type or 'image/jpeg'),
+        'capture_method': 'camera' if camera_image_data else 'upload',
+        'upload_token': request.form.get('upload_token') or None,
+        'warning': warning
+    }
+
+def find_queued_upload(upload_token):
+    """
+    Receipt task already queued for an upload token, or None.
+    
+    The upload page sends the same token with its streamed request and with the
+    plain form post it falls back to, so a receipt is never queued twice.
+    """
+    if not upload_token:
+        return None
+    return TaskQueue.query.filter(
+        TaskQueue.task_type == 'receipt_processing',
+        TaskQueue.data['upload_token'].astext == upload_token
+    ).order_by(TaskQueue.id).first()
+
+def find_duplicate_receipt(receipt_data):
+    """
+    Existing receipt with the same vendor, date and total (within a cent).
+    
+    Args:
+        receipt_data: Extracted receipt fields (vendor_name, date, total_amount)
+        
+    Returns:
+        Invoice or None
+    """
+    vendor_name = receipt_data.get('vendor_name', '')
+    receipt_date = receipt_data.get('date', '')
+    total_amount = receipt_data.get('total_amount', 0)
+    
+    if not (vendor_name and receipt_date and total_amount):
+        return None
+    
+    # Look for existing receipts with same vendor, date, and amount
+    similar_receipts = Invoice.query.filter(
+        db.or_(
+            Invoice.vendor.has(Vendor.name.ilike(f'%{vendor_name}%')),
+            Invoice.data.op('->>')('vendor').ilike(f'%{vendor_name}%'),
+            Invoice.data.op('->>')('vendor_name').ilike(f'%{vendor_name}%')
+        )
+    ).filter(
+        Invoice.data.op('->>')('date') == receipt_date
+    ).all()
+    
+    for existing_receipt in similar_receipts:
+        existing_total = existing_receipt.data.get('total_amount', 0) if existing_receipt.data else 0
+        try:
+            if abs(float(existing_total) - float(total_amount)) < 0.01:  # Within 1 cent
+                logger.warning(f"Potential duplicate receipt detected: {vendor_name} on {receipt_date} for ${total_amount}")
+                return existing_receipt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def queue_receipt_for_review(file_data, filename, original_filename, file_type, capture_method,
+                             mcp_result=None, ai_error=None, auto_approve=False, upload_token=None):
+    """
+    Queue an analyzed receipt for review in the AI Queue and commit.
+    
+    The receipt_processing task holds the AI analysis; a temporary invoice holds
+    the uploaded file until the review is approved or rejected. Without an
+    analysis (ai_error) the task waits for manual entry. When a receipt was
+    already queued with the same upload_token, that task is returned instead.
+    
+    Args:
+        file_data: Receipt image bytes
+        filename: Processed filename
+        original_filename: Filename as uploaded
+        file_type: MIME type of file_data
+        capture_method: 'upload' or 'camera'
+        mcp_result: AI analysis from the MCP server
+        ai_error: Why the AI analysis failed, when it did
+        auto_approve: User asked to skip review for high-confidence results
+        upload_token: Idempotency key sent by the upload form
+        
+    Returns:
+        tuple: (TaskQueue task, Invoice the receipt may duplicate or None)
+    """
+    if upload_token:
+        # Serialize requests carrying the same token until the task is committed
+        db.session.execute(db.text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                           {'key': f"receipt_upload:{upload_token}"})
+        existing = find_queued_upload(upload_token)
+        if existing is not None:
+            db.session.commit()
+            logger.info(f"Receipt upload {upload_token} was already queued as task {existing.id}")
+            return existing, None
+    
+    duplicate = None
+    if mcp_result is not None:
+        receipt_data = extract_receipt_data_from_mcp_response(mcp_result)
+        duplicate = find_duplicate_receipt(receipt_data)
+        receipt_queue_data = {
+            'ai_provider': 'openai',
+            'ai_analysis': mcp_result,
+            'original_filename': original_filename,
+            'processed_filename': filename,
+            'upload_timestamp': datetime.utcnow().isoformat(),
+            'user_preferences': {
+                'auto_approve': auto_approve
+            },
+            'duplicate_check_performed': True,
+            'potential_duplicate': duplicate is not None,
+            'capture_method': capture_method
+        }
+        if duplicate:
+            receipt_queue_data['duplicate_of'] = duplicate.invoice_number
+        status = 'pending_review'
+    else:
+        receipt_queue_data = {
+            'ai_provider': 'openai',
+            'ai_analysis': None,
+            'ai_error': ai_error,
+            'original_filename': original_filename,
+            'processed_filename': filename,
+            'upload_timestamp': datetime.utcnow().isoformat(),
+            'requires_manual_entry': True,
+            'capture_method': capture_method
+        }
+        status = 'ai_analysis_failed'
+    if upload_token:
+        receipt_queue_data['upload_token'] = upload_token
+    
+    # Create a "receipt processing" task in the AI queue
+    receipt_task = TaskQueue.queue_task({
+        'task_type': 'receipt_processing',
+        'execute_at': datetime.utcnow(),
+        'priority': 5,  # High priority for user uploads
+        'status': status,  # Set status at top level
+        'data': receipt_queue_data
+    })
+    
+    # Create a temporary invoice record to hold the attachment
+    temp_invoice = Invoice(
+        invoice_number=f"TEMP-{receipt_task.id}",
+        vendor_id=None,
+        data={'status': 'temporary', 'created_from_task': receipt_task.id},
+        is_paid=False
+    )
+    db.session.add(temp_invoice)
+    db.session.flush()  # Get the ID without committing
+    
+    # Create attachment immediately
+    attachment = Attachment(
+        invoice_id=temp_invoice.id,
+        filename=filename,
+        file_data=file_data,
+        file_type=file_type,
+        upload_date=datetime.utcnow()
+    )
+    db.session.add(attachment)
+    db.session.flush()
+    
+    # Store temp invoice ID in task data for later processing (reassigned, so the
+    # JSONB change is persisted)
+    receipt_task.data = {
+        **receipt_task.data,
+        'temp_invoice_id': temp_invoice.id,
+        'attachment_id': attachment.id
+    }
+    db.session.commit()
+    
+    logger.info(f"Receipt queued for review: Task ID {receipt_task.id}")
+    return receipt_task, duplicate
+
 @app.route('/receipt-upload', methods=['GET', 'POST'])
 def receipt_upload():
     """
@@ -110,52 +342,27 @@ def receipt_upload():
     5. Approve -> Creates invoice/objects automatically
     """
     if request.method == 'POST':
-        # Import TaskQueue at the beginning so it's available in both try and except blocks
-        from models import TaskQueue
-        import base64
-        
-        # Check for camera-captured image data
-        camera_image_data = request.form.get('camera_image_data')
-        file = request.files.get('receipt_image')
-        
-        if not camera_image_data and (not file or file.filename == ''):
-            flash('No file uploaded or photo taken', 'warning')
+        try:
+            upload = read_receipt_upload()
+        except ValueError as e:
+            flash(str(e), 'warning')
             return redirect(request.url)
         
         try:
-            if camera_image_data:
-                # Handle camera-captured image
-                logger.info("Processing camera-captured image")
-                
-                # Extract base64 image data (remove data:image/jpeg;base64, prefix)
-                if ',' in camera_image_data:
-                    file_data = base64.b64decode(camera_image_data.split(',')[1])
-                else:
-                    file_data = base64.b64decode(camera_image_data)
-                
-                filename = f"camera_receipt_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg"
-                original_filename = filename
-                
-            elif file and allowed_file(file.filename):
-                # Handle uploaded file
-                logger.info(f"Processing receipt file: {file.filename}")
-                file_data = file.read()
-                filename = secure_filename(file.filename)
-                original_filename = file.filename
-            else:
-                flash('Invalid file format', 'warning')
-                return redirect(request.url)
+            file_data = upload['file_data']
+            filename = upload['filename']
+            original_filename = upload['original_filename']
+            file_type = upload['file_type']
+            capture_method = upload['capture_method']
+            upload_token = upload['upload_token']
             
-            # Handle PDF conversion
-            if filename.lower().endswith('.pdf'):
-                try:
-                    logger.info(f"Processing PDF file: {filename}")
-                    file_data = convert_pdf_to_image(file_data)
-                    logger.info(f"Successfully converted PDF to image for processing")
-                    filename = filename.rsplit('.', 1)[0] + '.jpg'
-                except Exception as pdf_error:
-                    logger.error(f"Error converting PDF to image: {str(pdf_error)}")
-                    flash(f"Error processing PDF: {str(pdf_error)}", 'warning')
+            # A resubmission of a receipt the streamed upload already queued
+            if find_queued_upload(upload_token) is not None:
+                flash('This receipt was already uploaded. <a href="/ai-queue">Review it in the AI Queue</a>', 'info')
+                return redirect(url_for('ai_queue'))
+            
+            if upload['warning']:
+                flash(upload['warning'], 'warning')
             
             # Step 1: Send to MCP Server for AI Analysis with OpenAI
             logger.info(f"Sending receipt to MCP server for analysis with OpenAI")
@@ -173,103 +380,17 @@ def receipt_upload():
                 
                 logger.info(f"MCP analysis successful: {mcp_result}")
                 
-                # Extract receipt data for duplicate checking
-                receipt_data = extract_receipt_data_from_mcp_response(mcp_result)
-                
-                # Step 1.5: Check for duplicates before queuing
-                vendor_name = receipt_data.get('vendor_name', '')
-                receipt_date = receipt_data.get('date', '')
-                total_amount = receipt_data.get('total_amount', 0)
-                
-                if vendor_name and receipt_date and total_amount:
-                    # Check for duplicates
-                    duplicate_check = {
-                        'vendor_name': vendor_name,
-                        'date': receipt_date,
-                        'total_amount': total_amount
-                    }
-                    
-                    # Look for existing receipts with same vendor, date, and amount
-                    similar_receipts = Invoice.query.filter(
-                        db.or_(
-                            Invoice.vendor.has(Vendor.name.ilike(f'%{vendor_name}%')),
-                            Invoice.data.op('->>')('vendor').ilike(f'%{vendor_name}%'),
-                            Invoice.data.op('->>')('vendor_name').ilike(f'%{vendor_name}%')
-                        )
-                    ).filter(
-                        Invoice.data.op('->>')('date') == receipt_date
-                    ).all()
-                    
-                    # Check for exact matches
-                    exact_matches = []
-                    for existing_receipt in similar_receipts:
-                        existing_total = existing_receipt.data.get('total_amount', 0) if existing_receipt.data else 0
-                        try:
-                            if abs(float(existing_total) - float(total_amount)) < 0.01:  # Within 1 cent
-                                exact_matches.append(existing_receipt)
-                        except (ValueError, TypeError):
-                            continue
-                    
-                    if exact_matches:
-                        match = exact_matches[0]
-                        logger.warning(f"Potential duplicate receipt detected: {vendor_name} on {receipt_date} for ${total_amount}")
-                        flash(f'⚠️ Potential duplicate detected! This receipt appears similar to #{match.invoice_number} from {vendor_name} on {receipt_date}. <a href="/receipts">Review existing receipts</a> to avoid duplicates.', 'warning')
-                        # Continue processing but flag as potential duplicate
-                        receipt_data['potential_duplicate'] = True
-                        receipt_data['duplicate_of'] = match.invoice_number
-                
-                # Step 2: Create a Receipt Processing Queue Entry (not invoice yet!)
-                receipt_queue_data = {
-                    'ai_provider': 'openai',
-                    'ai_analysis': mcp_result,
-                    'original_filename': original_filename,
-                    'processed_filename': filename,
-                    'upload_timestamp': datetime.utcnow().isoformat(),
-                    'user_preferences': {
-                        'auto_approve': request.form.get('auto_approve', 'false') == 'true'
-                    },
-                    'duplicate_check_performed': True,
-                    'potential_duplicate': receipt_data.get('potential_duplicate', False),
-                    'capture_method': 'camera' if camera_image_data else 'upload'
-                }
-                
-                # Create a temporary "receipt processing" task in the AI queue
-                receipt_task = TaskQueue.queue_task({
-                    'task_type': 'receipt_processing',
-                    'execute_at': datetime.utcnow(),
-                    'priority': 5,  # High priority for user uploads
-                    'status': 'pending_review',  # Set status at top level
-                    'data': receipt_queue_data
-                })
-                
-                # Create a temporary invoice record to hold the attachment
-                temp_invoice = Invoice(
-                    invoice_number=f"TEMP-{receipt_task.id}",
-                    vendor_id=None,
-                    data={'status': 'temporary', 'created_from_task': receipt_task.id},
-                    is_paid=False
-                )
-                db.session.add(temp_invoice)
-                db.session.flush()  # Get the ID without committing
-                
-                # Create attachment immediately
-                attachment = Attachment(
-                    invoice_id=temp_invoice.id,
-                    filename=filename,
-                    file_data=file_data,
-                    file_type='image/jpeg' if camera_image_data else (file.content_type or 'image/jpeg'),
-                    upload_date=datetime.utcnow()
+                # Step 2: Queue for review (not invoice yet!), flagging likely duplicates
+                receipt_task, duplicate = queue_receipt_for_review(
+                    file_data, filename, original_filename, file_type, capture_method,
+                    mcp_result=mcp_result,
+                    auto_approve=request.form.get('auto_approve', 'false') == 'true',
+                    upload_token=upload_token
                 )
-                db.session.add(attachment)
-                
-                # Store temp invoice ID in task data for later processing
-                receipt_task.data.update({
-                    'temp_invoice_id': temp_invoice.id,
-                    'attachment_id': attachment.id
-                })
-                db.session.commit()
                 
-                logger.info(f"Receipt queued for review: Task ID {receipt_task.id}")
+                if duplicate:
+                    receipt_data = extract_receipt_data_from_mcp_response(mcp_result)
+                    flash(f'⚠️ Potential duplicate detected! This receipt appears similar to #{duplicate.invoice_number} from {receipt_data.get("vendor_name")} on {receipt_data.get("date")}. <a href="/receipts">Review existing receipts</a> to avoid duplicates.', 'warning')
                 
                 # Success! Receipt is now in AI queue for review
                 flash(f'Receipt uploaded and analyzed by AI! <a href="/ai-queue">Review AI suggestions in the AI Queue</a>', 'success')
@@ -277,54 +398,13 @@ def receipt_upload():
                 
             except Exception as mcp_error:
                 logger.error(f"MCP server analysis failed: {str(mcp_error)}")
+                db.session.rollback()
                 
                 # Fallback: Still queue for manual review but mark as AI analysis failed
-                receipt_queue_data = {
-                    'ai_provider': 'openai',
-                    'ai_analysis': None,
-                    'ai_error': str(mcp_error),
-                    'original_filename': original_filename,
-                    'processed_filename': filename,
-                    'upload_timestamp': datetime.utcnow().isoformat(),
-                    'requires_manual_entry': True,
-                    'capture_method': 'camera' if camera_image_data else 'upload'
-                }
-                
-                # Create task for manual processing
-                receipt_task = TaskQueue.queue_task({
-                    'task_type': 'receipt_processing',
-                    'execute_at': datetime.utcnow(),
-                    'priority': 5,
-                    'status': 'ai_analysis_failed',  # Set status at top level
-                    'data': receipt_queue_data
-                })
-                
-                # Create temporary invoice and attachment even for failed AI analysis
-                temp_invoice = Invoice(
-                    invoice_number=f"TEMP-{receipt_task.id}",
-                    vendor_id=None,
-                    data={'status': 'temporary', 'created_from_task': receipt_task.id},
-                    is_paid=False
-                )
-                db.session.add(temp_invoice)
-                db.session.flush()  # Get the ID without committing
-                
-                # Create attachment immediately
-                attachment = Attachment(
-                    invoice_id=temp_invoice.id,
-                    filename=filename,
-                    file_data=file_data,
-                    file_type='image/jpeg' if camera_image_data else (file.content_type or 'image/jpeg'),
-                    upload_date=datetime.utcnow()
+                queue_receipt_for_review(
+                    file_data, filename, original_filename, file_type, capture_method,
+                    ai_error=str(mcp_error), upload_token=upload_token
                 )
-                db.session.add(attachment)
-                
-                # Store temp invoice ID in task data for later processing
-                receipt_task.data.update({
-                    'temp_invoice_id': temp_invoice.id,
-                    'attachment_id': attachment.id
-                })
-                db.session.commit()
             
                 flash(f'Receipt uploaded but AI analysis failed. Please review manually in the <a href="/ai-queue">AI Queue</a>. Error: {str(mcp_error)[:100]}...', 'warning')
                 return redirect(url_for('ai_queue'))
@@ -338,6 +418,101 @@ def receipt_upload():
     logger.debug("Rendering receipt upload form")
     return render_template('receipt_form.html')
 
+@app.route('/api/receipts/analyze/stream', methods=['POST'])
+def stream_receipt_analysis():
+    """
+    Analyze a receipt like /receipt-upload, streaming partial results as
+    server-sent events so the page can render them while the AI is still working.
+    
+    Takes the upload form's fields. Events: 'started', 'field' ({'name', 'value'})
+    for each completed header field, 'item' ({'field', 'index', 'value'}) for
+    each completed line item, then 'queued' once the receipt has been queued for
+    review (with 'ai_error' when the analysis failed and the receipt waits for
+    manual entry), or 'error'. A receipt whose client disconnects mid-stream is
+    still queued, for manual review when the analysis had not finished.
+    """
+    from flask import stream_with_context
+    from mcp_client import stream_receipt_sync
+    
+    try:
+        upload = read_receipt_upload()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    auto_approve = request.form.get('auto_approve', 'false') == 'true'
+    
+    # Loaded up front: the stream outlives this view function
+    try:
+        classification_context = ai_context.get_ai_context()
+    except Exception as e:
+        logger.warning(f"Could not load AI context, using defaults: {e}")
+        classification_context = None
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    def queue_upload(mcp_result, ai_error):
+        return queue_receipt_for_review(
+            upload['file_data'], upload['filename'], upload['original_filename'],
+            upload['file_type'], upload['capture_method'],
+            mcp_result=mcp_result, ai_error=ai_error, auto_approve=auto_approve,
+            upload_token=upload['upload_token']
+        )
+    
+    def events():
+        mcp_result = None
+        ai_error = None
+        try:
+            if upload['warning']:
+                yield sse('warning', {'message': upload['warning']})
+            
+            try:
+                for event, data in stream_receipt_sync(upload['file_data'], upload['filename'], 'openai',
+                                                       classification_context):
+                    if event == 'complete':
+                        mcp_result = data
+                    elif event == 'error':
+                        ai_error = (data or {}).get('error') or 'AI analysis failed'
+                    else:
+                        yield sse(event, data)
+            except Exception as e:
+                logger.error(f"MCP server analysis failed: {str(e)}")
+                ai_error = str(e)
+        except GeneratorExit:
+            # The client went away mid-analysis: still queue the upload (nothing can
+            # be yielded any more) so it waits in the AI Queue instead of being lost
+            try:
+                queue_upload(mcp_result, ai_error or 'client disconnected')
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error queuing receipt after client disconnect: {str(e)}", exc_info=True)
+            raise
+        
+        if mcp_result is None and ai_error is None:
+            ai_error = 'AI analysis ended without a result'
+        
+        try:
+            receipt_task, duplicate = queue_upload(mcp_result, ai_error)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error queuing streamed receipt: {str(e)}", exc_info=True)
+            yield sse('error', {'error': str(e)})
+            return
+        
+        yield sse('queued', {
+            'task_id': receipt_task.id,
+            'status': receipt_task.status,
+            'ai_error': ai_error,
+            'duplicate_of': duplicate.invoice_number if duplicate else None,
+            'review_url': url_for('ai_queue')
+        })
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/add_object', methods=['GET', 'POST'])
 @app.route('/edit_object/<object_id>', methods=['GET', 'POST'])
 def add_object(object_id=None):
@@ -678,71 +853,78 @@ def paid_receipts():
     logger.debug("Redirecting from /paid-receipts to /receipts")
     return redirect(url_for('receipts_page'))
 
+# Bill buckets in display order
+BILL_BUCKETS = ('overdue', 'due_soon', 'regular')
+BILLS_PER_PAGE = 50
+
 @app.route('/bills')
 def bills_page():
     """Display bills (unpaid invoices) page with enhanced management features"""
+    today = datetime.utcnow().date()
     try:
         logger.debug("Rendering bills page")
         
-        # Get all unpaid invoices (bills) or invoices with due dates
-        bills_query = db.session.query(Invoice).filter(
-            db.or_(
-                Invoice.is_paid == False,
-                Invoice.data.op('->>')('due_date').isnot(None)
-            )
-        ).order_by(Invoice.created_at.desc())
-        
-        all_bills = bills_query.all()
-        
-        # Categorize bills
-        overdue_bills = []
-        due_soon_bills = []
-        regular_bills = []
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', BILLS_PER_PAGE, type=int), 1), 500)
         
-        today = datetime.utcnow().date()
-        
-        for bill in all_bills:
-            due_date_str = bill.data.get('due_date') if bill.data else None
-            if due_date_str:
-                try:
-                    due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
-                    days_until_due = (due_date - today).days
-                    
-                    if not bill.is_paid and days_until_due < 0:
-                        overdue_bills.append(bill)
-                    elif not bill.is_paid and days_until_due <= 7:
-                        due_soon_bills.append(bill)
-                    else:
-                        regular_bills.append(bill)
-                except ValueError:
-                    regular_bills.append(bill)
-            else:
-                if not bill.is_paid:
-                    regular_bills.append(bill)
-        
-        # Calculate totals
-        total_outstanding = sum(
-            float(bill.data.get('total_amount', 0)) 
-            for bill in all_bills 
-            if not bill.is_paid and bill.data and bill.data.get('total_amount')
+        # Unpaid invoices (bills) or invoices with due dates
+        unpaid = Invoice.is_paid == False
+        bills_filter = db.or_(unpaid, Invoice.due_date.isnot(None))
+        bucket = db.case(
+            (db.and_(unpaid, Invoice.due_date < today), 'overdue'),
+            (db.and_(unpaid, Invoice.due_date <= today + timedelta(days=7)), 'due_soon'),
+            else_='regular'
         )
         
-        overdue_amount = sum(
-            float(bill.data.get('total_amount', 0)) 
-            for bill in overdue_bills 
-            if bill.data and bill.data.get('total_amount')
+        # Counts and totals for every bucket in one grouped query
+        bucketed = db.session.query(
+            bucket.label('bucket'),
+            Invoice.total_amount.label('amount'),
+            db.case((unpaid, Invoice.total_amount), else_=0).label('unpaid_amount')
+        ).filter(bills_filter).subquery()
+        
+        summary = {name: {'count': 0, 'amount': 0.0} for name in BILL_BUCKETS}
+        total_outstanding = 0.0
+        for name, count, amount, unpaid_amount in db.session.query(
+            bucketed.c.bucket,
+            db.func.count(),
+            db.func.coalesce(db.func.sum(bucketed.c.amount), 0),
+            db.func.coalesce(db.func.sum(bucketed.c.unpaid_amount), 0)
+        ).group_by(bucketed.c.bucket):
+            summary[name] = {'count': count, 'amount': float(amount)}
+            total_outstanding += float(unpaid_amount)
+        
+        total_bills = sum(s['count'] for s in summary.values())
+        total_pages = max((total_bills + per_page - 1) // per_page, 1)
+        
+        # One page of bills, ordered bucket by bucket
+        bucket_rank = db.case(
+            *[(bucket == name, rank) for rank, name in enumerate(BILL_BUCKETS)]
         )
-        
-        # Get vendors for dropdowns
-        vendors = Vendor.query.all()
+        page_rows = db.session.query(Invoice, bucket).options(
+            joinedload(Invoice.vendor)
+        ).filter(bills_filter).order_by(
+            bucket_rank,
+            Invoice.due_date.asc().nullslast(),
+            Invoice.created_at.desc()
+        ).limit(per_page).offset((page - 1) * per_page).all()
+        
+        bills_by_bucket = {name: [] for name in BILL_BUCKETS}
+        for bill, name in page_rows:
+            bills_by_bucket[name].append(bill)
         
         return render_template('bills_page.html', 
-                             overdue_bills=overdue_bills,
-                             due_soon_bills=due_soon_bills,
-                             regular_bills=regular_bills,
+                             overdue_bills=bills_by_bucket['overdue'],
+                             due_soon_bills=bills_by_bucket['due_soon'],
+                             regular_bills=bills_by_bucket['regular'],
+                             summary=summary,
+                             total_bills=total_bills,
                              total_outstanding=total_outstanding,
-                             overdue_amount=overdue_amount,
-                             vendors=vendors,
+                             overdue_amount=summary['overdue']['amount'],
+                             page=page,
+                             per_page=per_page,
+                             total_pages=total_pages,
+                             vendors=Vendor.get_options(),
                              today=today)
         
     except Exception as e:
@@ -752,10 +934,15 @@ def bills_page():
                              overdue_bills=[], 
                              due_soon_bills=[], 
                              regular_bills=[],
+                             summary={name: {'count': 0, 'amount': 0.0} for name in BILL_BUCKETS},
+                             total_bills=0,
                              total_outstanding=0,
                              overdue_amount=0,
+                             page=1,
+                             per_page=BILLS_PER_PAGE,
+                             total_pages=1,
                              vendors=[],
-                             today=datetime.utcnow().date())
+                             today=today)
 
 @app.route('/mark-bill-paid/<int:bill_id>', methods=['POST'])
 def mark_bill_paid(bill_id):
@@ -818,8 +1005,9 @@ def update_due_date(bill_id):
             bill.data = {}
         
         old_due_date = bill.data.get('due_date', 'None')
-        bill.data['due_date'] = new_due_date
-        bill.data['due_date_updated_at'] = datetime.utcnow().isoformat()
+        # Reassign so the JSON change is persisted and the typed due_date is re-synced
+        bill.data = dict(bill.data, due_date=new_due_date,
+                         due_date_updated_at=datetime.utcnow().isoformat())
         
         db.session.commit()
         
@@ -2668,37 +2856,14 @@ def get_organization_network(org_id):
     """Get the network of relationships for an organization"""
     try:
         max_depth = int(request.args.get('max_depth', 2))
-        network = OrganizationRelationship.get_organization_network(org_id, max_depth)
-        
-        # Enrich with organization details
-        def enrich_network(network_data):
-            if not network_data:
-                return network_data
-                
-            org_id = network_data.get('organization_id')
-            if org_id:
-                org = Organization.query.get(org_id)
-                if org:
-                    network_data['organization'] = {
-                        'id': org.id,
-                        'name': org.name,
-                        'organization_type': org.organization_type
-                    }
-            
-            # Recursively enrich connected networks
-            for rel in network_data.get('outgoing_relationships', []):
-                enrich_network(rel.get('connected_network', {}))
-            
-            for rel in network_data.get('incoming_relationships', []):
-                enrich_network(rel.get('connected_network', {}))
-            
-            return network_data
-        
-        enriched_network = enrich_network(network)
-        
+        use_cache = request.args.get('cache', 'false').lower() in ('1', 'true', 'yes')
+
+        # Nodes already carry their organization details, fetched by the same query
+        network = OrganizationRelationship.get_organization_network(org_id, max_depth, use_cache=use_cache)
+
         return jsonify({
             'success': True,
-            'network': enriched_network
+            'network': network
         })
         
     except Exception as e:
@@ -2905,6 +3070,14 @@ def reports():
                 except (ValueError, TypeError):
                     pass
         
+        # Depreciated book value for the current month
+        assets_book_value = 0
+        try:
+            from valuation import portfolio_value
+            assets_book_value = portfolio_value()['book_value']
+        except Exception as e:
+            logger.warning(f"Could not compute asset book value: {str(e)}")
+        
         # Calculate asset value change percentage
         assets_value_change = 0
         if assets_purchase_value > 0:
@@ -2980,6 +3153,7 @@ def reports():
                              assets_purchase_value=assets_purchase_value,
                              assets_estimated_value=assets_estimated_value,
                              assets_value_change=assets_value_change,
+                             assets_book_value=assets_book_value,
                              
                              # Expense data
                              total_expenses=total_expenses,
@@ -3019,6 +3193,7 @@ def reports():
                              assets_purchase_value=0,
                              assets_estimated_value=0,
                              assets_value_change=0,
+                             assets_book_value=0,
                              total_expenses=0,
                              average_expense=0,
                              expense_categories=[],
@@ -3063,17 +3238,109 @@ def inventory_valuation_report():
                 'object_type': obj.object_type
             })
         
+        # Depreciated book value from the valuation engine
+        from valuation import portfolio_value
+        valuation = portfolio_value()
+        
         return render_template('reports.html',  # Temporary - use reports template
                              total_receipts=Invoice.query.count(),
                              total_objects=len(objects),
                              total_vendors=Vendor.query.count(),
                              total_inventory_value=total_value,
+                             total_book_value=valuation['book_value'],
+                             valuation=valuation,
                              categorized_objects=categorized_objects)
     except Exception as e:
         logger.error(f"Error loading inventory valuation report: {str(e)}")
         flash(f'Error loading valuation report: {str(e)}', 'danger')
         return redirect(url_for('reports'))
 
+@app.route('/api/valuation/portfolio', methods=['GET'])
+def get_portfolio_valuation():
+    """
+    Get the depreciated book value of all assets for the month containing ?date=YYYY-MM-DD.
+    Defaults to the current month.
+    """
+    try:
+        from valuation import portfolio_value
+        
+        date_str = request.args.get('date')
+        as_of = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
+        
+        return jsonify({
+            'success': True,
+            'valuation': portfolio_value(as_of)
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid date: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error computing portfolio valuation: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/valuation/rebuild', methods=['POST'])
+def rebuild_asset_valuations():
+    """Recompute and persist monthly book values for all depreciable objects"""
+    try:
+        from valuation import persist_book_values
+        
+        data = request.get_json(silent=True) or {}
+        start = datetime.strptime(data['start'], '%Y-%m-%d').date() if data.get('start') else None
+        end = datetime.strptime(data['end'], '%Y-%m-%d').date() if data.get('end') else None
+        
+        summary = persist_book_values(start=start, end=end)
+        
+        return jsonify({
+            'success': True,
+            'summary': summary
+        })
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rebuilding asset valuations: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+def export_dataset(dataset):
+    """
+    Stream a bulk export of objects, invoices or line_items.
+    
+    Query parameters:
+        format: csv (default), ndjson or parquet
+        object_type: Filter by object type
+        start_date / end_date: Date range (YYYY-MM-DD)
+        vendor: Vendor ID or name fragment
+    """
+    from flask import stream_with_context
+    from bulk_export import stream_export, export_filename, ExportError, FORMATS
+    
+    export_format = request.args.get('format', 'csv').lower()
+    filters = {
+        'object_type': request.args.get('object_type'),
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date'),
+        'vendor': request.args.get('vendor'),
+    }
+    
+    try:
+        chunks = stream_export(dataset, export_format, filters)
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    logger.info(f"Starting {export_format} export of {dataset} with filters {filters}")
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{export_filename(dataset, export_format)}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/calendar')
 def calendar_page():
     """Calendar page to view events"""
@@ -3231,6 +3498,154 @@ def force_database_init():
         flash(f'Database initialization error: {str(e)}', 'danger')
         return redirect(url_for('settings'))
 
+@app.route('/api/admin/task-queue/dead-letters', methods=['GET'])
+def list_dead_letter_tasks():
+    """List tasks that exhausted their retry policy (admin endpoint)"""
+    try:
+        query = TaskQueue.query.filter(TaskQueue.status == TaskQueue.DEAD_LETTER)
+        if request.args.get('task_type'):
+            query = query.filter(TaskQueue.task_type == request.args['task_type'])
+        
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        tasks = query.order_by(TaskQueue.last_attempt.desc()).limit(limit).all()
+        
+        counts = dict(db.session.query(TaskQueue.task_type, db.func.count(TaskQueue.id)).filter(
+            TaskQueue.status == TaskQueue.DEAD_LETTER
+        ).group_by(TaskQueue.task_type).all())
+        
+        return jsonify({
+            'success': True,
+            'counts': counts,
+            'tasks': [
+                {
+                    'id': task.id,
+                    'task_type': task.task_type,
+                    'object_id': task.object_id,
+                    'attempts': task.attempts,
+                    'last_attempt': task.last_attempt.isoformat() if task.last_attempt else None,
+                    'error_message': task.error_message,
+                    'data': task.data
+                }
+                for task in tasks
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error listing dead letter tasks: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/task-queue/dead-letters/<action>', methods=['POST'])
+def manage_dead_letter_tasks(action):
+    """
+    Bulk requeue or purge dead-lettered tasks (admin endpoint).
+    
+    JSON body (all optional, omit both to act on every dead letter):
+        task_ids: List of task IDs
+        task_type: Restrict to one task type
+    """
+    if action not in ('requeue', 'purge'):
+        return jsonify({'success': False, 'error': f"Unknown action '{action}'"}), 404
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        task_ids = data.get('task_ids')
+        task_type = data.get('task_type')
+        
+        if action == 'requeue':
+            count = TaskQueue.requeue_dead_letters(task_ids=task_ids, task_type=task_type)
+        else:
+            count = TaskQueue.purge_dead_letters(task_ids=task_ids, task_type=task_type)
+        
+        logger.info(f"Dead letter {action}: {count} tasks (ids={task_ids}, type={task_type})")
+        return jsonify({'success': True, 'action': action, 'count': count})
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error during dead letter {action}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/queue-metrics', methods=['GET'])
+def queue_metrics_api():
+    """Depth, lag, throughput and latency of the task and AI evaluation queues (admin endpoint)"""
+    from queue_metrics import queue_metrics, DEFAULT_WINDOW_SECONDS
+    
+    try:
+        window = request.args.get('window', DEFAULT_WINDOW_SECONDS, type=int)
+        return jsonify({'success': True, **queue_metrics(window_seconds=max(window, 1))})
+    except Exception as e:
+        logger.error(f"Error computing queue metrics: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Queue metrics in the Prometheus text exposition format"""
+    from queue_metrics import prometheus_text, DEFAULT_WINDOW_SECONDS
+    
+    try:
+        window = request.args.get('window', DEFAULT_WINDOW_SECONDS, type=int)
+        return Response(prometheus_text(window_seconds=max(window, 1)),
+                        mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        logger.error(f"Error rendering Prometheus metrics: {str(e)}")
+        return Response(f"# Error: {str(e)}\n", status=500, mimetype='text/plain')
+
+@app.route('/api/admin/scheduled-jobs', methods=['GET'])
+def list_scheduled_jobs():
+    """Schedule and last-run status of the periodic jobs (admin endpoint)"""
+    from job_scheduler import PERIODIC_JOBS
+    import maintenance_jobs  # noqa: F401 - declares the periodic jobs in this process
+    
+    try:
+        jobs = ScheduledJob.query.order_by(ScheduledJob.name).all()
+        return jsonify({
+            'success': True,
+            'jobs': [
+                {
+                    'name': job.name,
+                    'declared': job.name in PERIODIC_JOBS,
+                    'enabled': job.enabled,
+                    'interval_seconds': job.interval_seconds,
+                    'next_run_at': job.next_run_at.isoformat() if job.next_run_at else None,
+                    'last_started_at': job.last_started_at.isoformat() if job.last_started_at else None,
+                    'last_finished_at': job.last_finished_at.isoformat() if job.last_finished_at else None,
+                    'last_status': job.last_status,
+                    'last_error': job.last_error,
+                    'last_duration': job.last_duration,
+                    'last_result': job.last_result,
+                    'run_count': job.run_count,
+                    'failure_count': job.failure_count
+                }
+                for job in jobs
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error listing scheduled jobs: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/scheduled-jobs/<name>/<action>', methods=['POST'])
+def manage_scheduled_job(name, action):
+    """Run a periodic job on the next scheduler tick, or enable/disable it (admin endpoint)"""
+    if action not in ('run', 'enable', 'disable'):
+        return jsonify({'success': False, 'error': f"Unknown action '{action}'"}), 404
+    
+    try:
+        job = db.session.get(ScheduledJob, name)
+        if not job:
+            return jsonify({'success': False, 'error': f"Scheduled job '{name}' not found"}), 404
+        
+        if action == 'run':
+            job.next_run_at = datetime.utcnow()
+        else:
+            job.enabled = action == 'enable'
+        db.session.commit()
+        
+        logger.info(f"Scheduled job {name}: {action}")
+        return jsonify({'success': True, 'name': name, 'action': action})
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error during scheduled job {action}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/re-evaluate-receipt/<int:receipt_id>', methods=['POST'])
 def re_evaluate_receipt(receipt_id):
     """
@@ -4698,48 +5113,9 @@ def process_ai_suggested_categories(line_items):
 def get_object_types():
     """Get all available object types with descriptions for AI context"""
     try:
-        # Define all supported object types with descriptions
-        object_types = {
-            'asset': {
-                'name': 'asset', 
-                'description': 'Durable goods that retain value over time (computers, furniture, equipment)',
-                'examples': ['laptop', 'desk', 'printer', 'car', 'machinery']
-            },
-            'consumable': {
-                'name': 'consumable', 
-                'description': 'Items that are used up or consumed (food, supplies, tickets)',
-                'examples': ['office supplies', 'food', 'event tickets', 'fuel', 'medication']
-            },
-            'component': {
-                'name': 'component', 
-                'description': 'Parts that belong to a larger asset (RAM, tires, replacement parts)',
-                'examples': ['computer RAM', 'car tires', 'printer cartridge', 'phone battery']
-            },
-            'service': {
-                'name': 'service', 
-                'description': 'Intangible services or subscriptions (software licenses, maintenance)',
-                'examples': ['software subscription', 'maintenance contract', 'consulting', 'utilities']
-            },
-            'software': {
-                'name': 'software', 
-                'description': 'Software applications and digital products',
-                'examples': ['Microsoft Office', 'Adobe Creative Suite', 'operating system', 'mobile app']
-            },
-            'person': {
-                'name': 'person', 
-                'description': 'People identified in receipts or transactions (customers, staff, contacts)',
-                'examples': ['customer', 'staff member', 'vendor contact', 'service technician']
-            },
-            'pet': {
-                'name': 'pet', 
-                'description': 'Pet animals and their information',
-                'examples': ['dog', 'cat', 'bird', 'fish']
-            }
-        }
-        
         return jsonify({
             'success': True,
-            'object_types': object_types
+            'object_types': ai_context.OBJECT_TYPES
         })
         
     except Exception as e:
@@ -4777,21 +5153,7 @@ def get_all_categories():
             all_categories.append(category_info)
         
         # Also include any categories from object metadata (for backward compatibility)
-        objects = Object.query.all()
-        metadata_categories = set()
-        
-        for obj in objects:
-            if obj.data:
-                # Handle both 'category' and 'categories' fields
-                if 'category' in obj.data and obj.data['category']:
-                    metadata_categories.add((obj.data['category'], obj.object_type))
-                if 'categories' in obj.data:
-                    if isinstance(obj.data['categories'], list):
-                        for cat in obj.data['categories']:
-                            if cat:
-                                metadata_categories.add((cat, obj.object_type))
-                    elif isinstance(obj.data['categories'], str) and obj.data['categories']:
-                        metadata_categories.add((obj.data['categories'], obj.object_type))
+        metadata_categories = ai_context.metadata_categories()
         
         # Add metadata categories that aren't in the Category table
         existing_category_keys = {(cat['name'], cat['object_type']) for cat in all_categories}
@@ -4958,6 +5320,106 @@ def suggest_new_categories():
             'error': str(e)
         }), 500
 
+# Most items accepted by one batch category suggestion request
+MAX_CATEGORY_BATCH_ITEMS = 500
+
+@app.route('/api/categories/suggest/batch', methods=['POST'])
+def suggest_categories_batch():
+    """
+    AI category suggestions for many line items or objects in one request.
+    The MCP server packs the items into as few provider calls as possible.
+    
+    Body: {'items': [{'id', 'description', 'object_type', 'amount', ...}], 'vendor', 'max_suggestions'}
+    """
+    try:
+        data = request.json or {}
+        items = data.get('items') or []
+        
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'items are required'
+            }), 400
+        if len(items) > MAX_CATEGORY_BATCH_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_CATEGORY_BATCH_ITEMS} items per request'
+            }), 400
+        
+        try:
+            max_suggestions = int(data.get('max_suggestions', 3))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'max_suggestions must be a number'
+            }), 400
+        
+        batch_items = []
+        seen_ids = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not str(item.get('description', '')).strip():
+                return jsonify({
+                    'success': False,
+                    'error': f'Item {index} has no description'
+                }), 400
+            # Items without an id are numbered by position, which may clash with a given id
+            item_id = str(item.get('id', index))
+            if item_id in seen_ids:
+                return jsonify({
+                    'success': False,
+                    'error': f"Item {index} repeats the id '{item_id}'; item ids must be unique"
+                }), 400
+            seen_ids.add(item_id)
+            item_data = {key: value for key, value in item.items() if key != 'id' and value not in (None, '')}
+            batch_items.append({'id': item_id, 'data': item_data})
+        
+        from mcp_client import categorize_batch_sync
+        
+        result = categorize_batch_sync(
+            batch_items,
+            context={'vendor': data.get('vendor')} if data.get('vendor') else None,
+            max_suggestions=max(1, min(max_suggestions, 10))
+        )
+        
+        # Mark suggestions that match an existing category of the item's object type
+        existing = {(name, object_type) for name, object_type in
+                    db.session.query(Category.name, Category.object_type)}
+        object_types = {item['id']: item['data'].get('object_type') for item in batch_items}
+        
+        results = []
+        for item_result in result.get('results', []):
+            object_type = object_types.get(item_result['id'])
+            results.append({
+                'id': item_result['id'],
+                'success': item_result['success'],
+                'error': item_result.get('error'),
+                'suggested_categories': [
+                    {
+                        'name': suggestion['category'],
+                        'description': suggestion.get('reason', ''),
+                        'icon': suggestion.get('icon_suggestion') or '',
+                        'color': suggestion.get('color_suggestion') or '',
+                        'confidence': suggestion.get('confidence', 0.8),
+                        'is_new': (suggestion['category'], object_type) not in existing
+                    }
+                    for suggestion in item_result.get('suggestions', [])
+                ]
+            })
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'provider_calls': result.get('provider_calls'),
+            'failed': sum(1 for item_result in results if not item_result['success'])
+        })
+        
+    except Exception as e:
+        logger.error(f"Error suggesting categories in batch: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ==========================================
 # AI API CONNECTION ENDPOINTS
 # ==========================================
@@ -4981,23 +5443,64 @@ def check_api_connection():
 # CALENDAR API ENDPOINTS
 # ==========================================
 
+def _parse_calendar_bound(value):
+    """
+    Parse a FullCalendar range bound into a naive datetime.
+    
+    FullCalendar sends ISO dates or datetimes, optionally with a UTC offset
+    (e.g. 2024-05-26T00:00:00-04:00). Event times are stored as naive wall-clock
+    times, so the offset is dropped rather than converted.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value.strip()).replace(tzinfo=None)
+
 @app.route('/api/calendar/events', methods=['GET'])
 def get_calendar_events():
-    """Get all calendar events for the calendar display"""
+    """
+    Get calendar events for the calendar display.
+    
+    Accepts the optional start/end window FullCalendar sends and returns only the
+    events overlapping it. The response carries an ETag built from the window's event
+    count and latest update, so unchanged views are answered with 304 Not Modified.
+    """
     try:
-        logger.info("Calendar events API called")
+        logger.debug("Calendar events API called")
         
-        # Get all calendar events
-        events = CalendarEvent.query.order_by(CalendarEvent.start_time).all()
-        logger.info(f"Found {len(events)} calendar events in database")
+        try:
+            start = _parse_calendar_bound(request.args.get('start'))
+            end = _parse_calendar_bound(request.args.get('end'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'start and end must be ISO 8601 dates'}), 400
+        
+        # Events overlapping [start, end); events without an end_time are instants
+        window_filters = []
+        if end:
+            window_filters.append(CalendarEvent.start_time < end)
+        if start:
+            window_filters.append(db.or_(
+                CalendarEvent.end_time >= start,
+                db.and_(CalendarEvent.end_time.is_(None), CalendarEvent.start_time >= start)
+            ))
+        
+        count, last_updated = db.session.query(
+            db.func.count(CalendarEvent.id), db.func.max(CalendarEvent.updated_at)
+        ).filter(*window_filters).one()
+        
+        etag = hashlib.md5(
+            f"{start}|{end}|{count}|{last_updated.isoformat() if last_updated else ''}".encode()
+        ).hexdigest()
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        events = CalendarEvent.query.filter(*window_filters).order_by(CalendarEvent.start_time).all()
         
         calendar_events = []
         for event in events:
             try:
-                # Simplified related objects check
-                related_objects = []
-                has_tickets = False
-                
                 # Basic event object
                 event_data = {
                     'id': event.id,
@@ -5014,6 +5517,8 @@ def get_calendar_events():
                         'location': event.data.get('location', '') if event.data else ''
                     }
                 }
+                if event.end_time:
+                    event_data['end'] = event.end_time.isoformat()
                 
                 calendar_events.append(event_data)
                 
@@ -5022,8 +5527,12 @@ def get_calendar_events():
                 # Continue processing other events
                 continue
         
-        logger.info(f"Returning {len(calendar_events)} calendar events")
-        return jsonify(calendar_events)
+        logger.debug(f"Returning {len(calendar_events)} calendar events")
+        response = jsonify(calendar_events)
+        response.set_etag(etag)
+        # Let the browser cache the response but revalidate it every time
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         logger.error(f"Error getting calendar events: {str(e)}")
@@ -0,0 +1,302 @@
+"""
+Registry of task queue handlers.
+
+Handlers register themselves with the @task_handler decorator and declare how they
+may be run:
+
+    @task_handler('stock_check', max_concurrency=1, timeout=600, priority_class='low')
+    def process_stock_check(task):
+        ...
+        return {'items_checked': 42}
+
+The queue processor claims work type by type, high priority classes first. Each
+type is capped at batch_size tasks per claim and at max_concurrency running tasks
+across all workers. Every handler runs with a timeout, so adding a task type
+never requires editing the processing loop.
+
+Batch handlers (batch=True) receive every claimed task of their type at once and
+return a {task_id: result} dict; a result that is an Exception marks only that task
+as failed. The handler must not commit: its changes and the completion of the batch
+are committed together.
+
+Every commit made while a handler runs first checks, with the task rows locked,
+that the worker still holds the claim. A handler that timed out and was retried
+elsewhere therefore fails with ClaimLost instead of applying its changes twice.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import app, db
+from models import TaskQueue
+from retry_policy import RETRY_POLICIES
+
+logger = logging.getLogger('queue_processor')
+
+# Claim order: every 'high' type is offered work before 'normal', then 'low'
+PRIORITY_CLASSES = ('high', 'normal', 'low')
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_BATCH_SIZE = 10
+
+# Seconds between lease renewals while a handler runs
+HEARTBEAT_INTERVAL = 60
+
+# Registered handlers by task type
+HANDLERS = {}
+
+
+class TaskTimeout(Exception):
+    """Raised when a handler does not finish within its timeout"""
+
+
+class ClaimLost(Exception):
+    """Raised when a worker no longer holds the claim on a task it is running"""
+
+
+class TaskHandler:
+    """A registered handler and its execution limits."""
+
+    def __init__(self, task_type, func, max_concurrency=None, timeout=DEFAULT_TIMEOUT,
+                 priority_class='normal', batch_size=DEFAULT_BATCH_SIZE, batch=False):
+        if priority_class not in PRIORITY_CLASSES:
+            raise ValueError(f"priority_class must be one of {PRIORITY_CLASSES}")
+        self.task_type = task_type
+        self.func = func
+        self.max_concurrency = max_concurrency  # Running tasks across all workers, None = unlimited
+        self.timeout = timeout                  # Seconds
+        self.priority_class = priority_class
+        self.batch_size = batch_size            # Tasks claimed at once
+        self.batch = batch                      # func takes the list of claimed tasks
+
+    def __repr__(self):
+        return (f"<TaskHandler {self.task_type} ({self.priority_class}, "
+                f"concurrency={self.max_concurrency}, timeout={self.timeout}s)>")
+
+
+def task_handler(task_type, max_concurrency=None, timeout=DEFAULT_TIMEOUT,
+                 priority_class='normal', batch_size=DEFAULT_BATCH_SIZE, batch=False,
+                 retry_policy=None):
+    """
+    Decorator registering a function as the handler for a task type.
+
+    Args:
+        task_type: TaskQueue.task_type handled
+        max_concurrency: Maximum tasks of this type processing at once, cluster-wide
+        timeout: Seconds before a running task is abandoned and retried
+        priority_class: 'high', 'normal' or 'low'
+        batch_size: Maximum tasks of this type claimed per batch
+        batch: Call the handler once with all claimed tasks instead of once per task
+        retry_policy: Optional RetryPolicy overriding the default for this type
+    """
+    def decorator(func):
+        if task_type in HANDLERS:
+            logger.warning(f"Replacing handler for task type '{task_type}'")
+        HANDLERS[task_type] = TaskHandler(
+            task_type, func,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            priority_class=priority_class,
+            batch_size=batch_size,
+            batch=batch
+        )
+        if retry_policy is not None:
+            RETRY_POLICIES[task_type] = retry_policy
+        return func
+    return decorator
+
+
+def get_handler(task_type):
+    """Registered handler for a task type, or None"""
+    return HANDLERS.get(task_type)
+
+
+def handlers_by_priority():
+    """Registered handlers, highest priority class first"""
+    return sorted(HANDLERS.values(), key=lambda h: PRIORITY_CLASSES.index(h.priority_class))
+
+
+def held_claims(claims, worker_id):
+    """
+    Lock claimed tasks FOR UPDATE and return the ones this worker still holds.
+
+    A claim is identified by the attempt it was made for, so a task that was
+    reclaimed and claimed again, even by the same worker, is no longer held.
+    The row locks last until the current transaction ends.
+
+    Args:
+        claims: {task_id: attempts when claimed}
+        worker_id: Worker that made the claims
+
+    Returns:
+        set: IDs of the tasks still held
+    """
+    rows = db.session.execute(
+        db.select(TaskQueue.id, TaskQueue.attempts).where(
+            TaskQueue.id.in_(list(claims)),
+            TaskQueue.status == 'processing',
+            TaskQueue.locked_by == worker_id
+        ).order_by(TaskQueue.id).with_for_update()
+    ).all()
+    return {task_id for task_id, attempts in rows if claims[task_id] == attempts}
+
+
+def ensure_claims_held(claims, worker_id):
+    """
+    Like held_claims, but raise ClaimLost unless every claim is still held.
+
+    Raises:
+        ClaimLost: The caller must roll back instead of committing
+    """
+    lost = set(claims) - held_claims(claims, worker_id)
+    if lost:
+        raise ClaimLost(f"Lost the claim on tasks {sorted(lost)}")
+
+
+@contextmanager
+def _guard_commits(claims, worker_id):
+    """Run ensure_claims_held before every commit of the current session"""
+    session = db.session()
+
+    def check_claims(_session):
+        # Check the rows as committed so far, before the pending completion is flushed
+        with session.no_autoflush:
+            ensure_claims_held(claims, worker_id)
+
+    event.listen(session, 'before_commit', check_claims)
+    try:
+        yield
+    finally:
+        event.remove(session, 'before_commit', check_claims)
+
+
+def _run_in_thread(name, timeout, target, heartbeat=None):
+    """
+    Run target() in a daemon thread, returning its result or raising its error or TaskTimeout.
+
+    While the thread runs, heartbeat() is called every HEARTBEAT_INTERVAL seconds to
+    extend the claim's lease. Once it returns False the claim is gone: the thread is
+    abandoned (its commits fail the claim check) and ClaimLost is raised.
+    """
+    outcome = {}
+
+    def wrapper():
+        with app.app_context():
+            try:
+                outcome['result'] = target()
+            except BaseException as e:
+                db.session.rollback()
+                outcome['error'] = e
+
+    thread = threading.Thread(target=wrapper, name=name, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + timeout
+    while thread.is_alive():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        thread.join(min(HEARTBEAT_INTERVAL, remaining))
+        if heartbeat is not None and thread.is_alive() and not heartbeat():
+            logger.error(f"{name} lost its claim while running; abandoning handler thread")
+            raise ClaimLost("Lost the claim while running")
+
+    if thread.is_alive():
+        logger.error(f"{name} exceeded its {timeout}s timeout; abandoning handler thread")
+        raise TaskTimeout(f"Timed out after {timeout}s")
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
+
+
+def run_handler(handler, task_id, worker_id, attempts, heartbeat=None):
+    """
+    Run a handler in its own thread and wait at most handler.timeout seconds.
+
+    The handler gets its own application context and session and loads the task
+    itself, so an abandoned (hung) handler cannot interfere with the worker's session.
+    The task is completed in the handler's session, in the same transaction as the
+    handler's last changes. Commits only go through while this worker still holds
+    the claim.
+
+    Args:
+        handler: TaskHandler to run
+        task_id: ID of the claimed task
+        worker_id: Worker holding the claim
+        attempts: The task's attempts when it was claimed
+        heartbeat: Optional callable renewing the task's lease, see _run_in_thread
+
+    Returns:
+        The handler's result
+
+    Raises:
+        TaskTimeout: The handler did not finish in time; its thread is left running
+        ClaimLost: The task was reclaimed; nothing was committed after that
+        Exception: Whatever the handler raised
+    """
+    def target():
+        with _guard_commits({task_id: attempts}, worker_id):
+            task = db.session.get(TaskQueue, task_id)
+            result = handler.func(task)
+
+            task.status = 'completed'
+            task.completed_at = datetime.utcnow()
+            task.result = result
+            task.locked_by = None
+            task.lease_expires_at = None
+            db.session.commit()
+            return result
+
+    return _run_in_thread(f"task-{handler.task_type}-{task_id}", handler.timeout, target, heartbeat)
+
+
+def run_batch_handler(handler, claims, worker_id, heartbeat=None):
+    """
+    Run a batch handler over claimed tasks in its own thread, with handler.timeout.
+
+    The handler's changes and the completion of every task it succeeded on are
+    committed in one transaction, and only if this worker still holds all of the
+    tasks. A batch that timed out and was retried elsewhere can never commit late.
+
+    Args:
+        handler: TaskHandler with batch=True
+        claims: {task_id: attempts when claimed} of the claimed tasks
+        worker_id: Worker holding the claims
+        heartbeat: Optional callable renewing the tasks' leases, see _run_in_thread
+
+    Returns:
+        dict: {task_id: error message} for the tasks that failed; the rest are completed
+
+    Raises:
+        TaskTimeout: The handler did not finish in time
+        ClaimLost: Some task was reclaimed; no task was completed
+        Exception: Whatever the handler raised; no task was completed
+    """
+    def target():
+        with _guard_commits(claims, worker_id):
+            tasks = TaskQueue.query.filter(TaskQueue.id.in_(list(claims))).order_by(TaskQueue.id).all()
+            results = handler.func(tasks) or {}
+
+            failures = {}
+            now = datetime.utcnow()
+            for task in tasks:
+                result = results.get(task.id)
+                if isinstance(result, Exception):
+                    failures[task.id] = str(result)
+                    continue
+                task.status = 'completed'
+                task.completed_at = now
+                task.result = result
+                task.locked_by = None
+                task.lease_expires_at = None
+
+            db.session.commit()
+            return failures
+
+    return _run_in_thread(f"task-{handler.task_type}-batch-{len(claims)}", handler.timeout, target,
+                          heartbeat)
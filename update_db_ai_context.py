@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the AI context version sequence.
+ai_context.py caches the object type and category context sent with receipt
+analyses under this sequence's value, which is bumped whenever categories change.
+"""
+
+import sys
+from app import app, db
+from models import AI_CONTEXT_VERSION_SEQUENCE
+
+def create_ai_context_sequence():
+    """Create the AI context version sequence"""
+    with app.app_context():
+        try:
+            db.session.execute(db.text(f"CREATE SEQUENCE IF NOT EXISTS {AI_CONTEXT_VERSION_SEQUENCE.name}"))
+            db.session.commit()
+
+            exists = db.session.execute(
+                db.text("SELECT to_regclass(:name) IS NOT NULL"),
+                {'name': AI_CONTEXT_VERSION_SEQUENCE.name}
+            ).scalar()
+            if not exists:
+                print(f"❌ Sequence '{AI_CONTEXT_VERSION_SEQUENCE.name}' not found in database")
+                return False
+
+            print(f"✅ Sequence '{AI_CONTEXT_VERSION_SEQUENCE.name}' verified in database")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error creating AI context sequence: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Creating AI context version sequence...")
+
+    if create_ai_context_sequence():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Database migration script for the AI evaluation executor.
+Adds the tokens_used column that the daily token budget is computed from, and
+queues the first 'ai_evaluation' task without waiting for the periodic job.
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import text
+from app import app, db
+from models import TaskQueue
+
+def prepare_ai_evaluation():
+    """Add the token usage column and queue the first evaluation run"""
+    with app.app_context():
+        try:
+            db.session.execute(text(
+                "ALTER TABLE ai_evaluation_queue ADD COLUMN IF NOT EXISTS tokens_used INTEGER"
+            ))
+            db.session.commit()
+            print("✅ Column 'tokens_used' verified on ai_evaluation_queue")
+
+            # Queue the first evaluation run if none is pending
+            pending = TaskQueue.query.filter_by(task_type='ai_evaluation', status='pending').first()
+            if not pending:
+                TaskQueue.queue_task({
+                    'task_type': 'ai_evaluation',
+                    'execute_at': datetime.utcnow(),
+                    'priority': 1,
+                    'data': {}
+                })
+                print("✅ Queued initial AI evaluation task")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Error preparing AI evaluation: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Preparing the AI evaluation executor...")
+
+    if prepare_ai_evaluation():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the asset book value table.
+This table stores monthly depreciation snapshots computed by the valuation engine.
+"""
+
+import sys
+from datetime import datetime
+from app import app, db
+from models import AssetBookValue, TaskQueue
+
+def create_asset_book_values_table():
+    """Create the asset book values table and queue the first valuation run"""
+    with app.app_context():
+        try:
+            # Create the table
+            db.create_all()
+
+            inspector = db.inspect(db.engine)
+            if 'asset_book_values' not in inspector.get_table_names():
+                print("❌ Table 'asset_book_values' not found in database")
+                return False
+
+            print("✅ Table 'asset_book_values' verified in database")
+
+            # Show indexes
+            indexes = inspector.get_indexes('asset_book_values')
+            if indexes:
+                print("\n📊 Indexes:")
+                for idx in indexes:
+                    print(f"   {idx['name']}: {idx['column_names']}")
+
+            # Queue the first valuation run if none is pending
+            pending = TaskQueue.query.filter_by(task_type='asset_valuation', status='pending').first()
+            if not pending:
+                TaskQueue.queue_task({
+                    'task_type': 'asset_valuation',
+                    'execute_at': datetime.utcnow(),
+                    'priority': 1,
+                    'data': {}
+                })
+                print("✅ Queued initial asset valuation task")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Error creating asset book values table: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Creating asset book values table...")
+
+    if create_asset_book_values_table():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add typed due date and amount columns to invoices.
+The values are backfilled from each invoice's JSON data; afterwards the model keeps
+them in sync whenever an invoice is saved.
+"""
+
+import sys
+from sqlalchemy import text
+from app import app, db
+from models import Invoice
+
+BATCH_SIZE = 1000
+
+def add_bill_fields():
+    """Add invoices.due_date / invoices.total_amount, their index, and backfill them"""
+    with app.app_context():
+        try:
+            db.session.execute(text("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS due_date DATE"))
+            db.session.execute(text("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS total_amount NUMERIC(12, 2)"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_invoices_paid_due_date ON invoices (is_paid, due_date)"
+            ))
+            db.session.commit()
+            print("✅ Columns 'due_date' and 'total_amount' verified on invoices")
+
+            # Backfill from the JSON data in batches
+            rows = db.session.execute(text(
+                "SELECT id, data->>'due_date', data->>'total_amount' FROM invoices"
+            )).all()
+
+            updates = [
+                {
+                    'invoice_id': invoice_id,
+                    'due_date': Invoice.parse_due_date(due_date),
+                    'total_amount': Invoice.parse_amount(total_amount)
+                }
+                for invoice_id, due_date, total_amount in rows
+            ]
+
+            for offset in range(0, len(updates), BATCH_SIZE):
+                db.session.execute(
+                    text("UPDATE invoices SET due_date = :due_date, total_amount = :total_amount "
+                         "WHERE id = :invoice_id"),
+                    updates[offset:offset + BATCH_SIZE]
+                )
+            db.session.commit()
+
+            with_due_date = sum(1 for u in updates if u['due_date'])
+            print(f"✅ Backfilled {len(updates)} invoices ({with_due_date} with a due date)")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error adding bill fields: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Adding typed bill fields to invoices...")
+
+    if add_bill_fields():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
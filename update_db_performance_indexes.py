@@ -0,0 +1,68 @@
+"""
+Migration script to add indexes used by the optimized queries.
+Fresh databases get these from the model definitions; this script brings existing
+databases up to date. Every statement is idempotent, so it is safe to re-run.
+"""
+import sys
+import logging
+from sqlalchemy import create_engine, text
+import os
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connect to the database
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    logger.error("DATABASE_URL environment variable is not set")
+    sys.exit(1)
+
+engine = create_engine(DATABASE_URL)
+
+# (index name, CREATE statement)
+INDEXES = [
+    # Organization network traversal walks relationships in both directions
+    ('idx_org_relationships_to_org',
+     "CREATE INDEX IF NOT EXISTS idx_org_relationships_to_org "
+     "ON organization_relationships (to_organization_id, is_active)"),
+    # Calendar views fetch the events overlapping a start/end window
+    ('idx_calendar_events_window',
+     "CREATE INDEX IF NOT EXISTS idx_calendar_events_window "
+     "ON calendar_events (start_time, end_time)"),
+    # Queue metrics aggregate depth per type and throughput over a recent window
+    ('idx_task_queue_type_status',
+     "CREATE INDEX IF NOT EXISTS idx_task_queue_type_status "
+     "ON task_queue (task_type, status, execute_at)"),
+    ('idx_task_queue_completed_at',
+     "CREATE INDEX IF NOT EXISTS idx_task_queue_completed_at ON task_queue (completed_at)"),
+    ('idx_ai_evaluation_queue_status',
+     "CREATE INDEX IF NOT EXISTS idx_ai_evaluation_queue_status "
+     "ON ai_evaluation_queue (status, scheduled_date)"),
+    ('idx_ai_evaluation_queue_completed_at',
+     "CREATE INDEX IF NOT EXISTS idx_ai_evaluation_queue_completed_at ON ai_evaluation_queue (completed_at)"),
+]
+
+
+def update_schema():
+    """Create any missing performance indexes"""
+    logger.info("Starting performance index update...")
+
+    try:
+        with engine.connect() as conn:
+            with conn.begin():
+                for name, statement in INDEXES:
+                    conn.execute(text(statement))
+                    logger.info(f"Ensured index {name}")
+
+        logger.info("Performance index update completed successfully!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Performance index update failed: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    if not update_schema():
+        sys.exit(1)
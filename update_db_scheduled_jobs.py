@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the scheduled jobs table.
+The periodic job scheduler (job_scheduler.py) keeps one row per declared job with
+its next run time and last-run status; rows are created by the scheduler itself.
+"""
+
+import sys
+from app import app, db
+from models import ScheduledJob
+
+def create_scheduled_jobs_table():
+    """Create the scheduled jobs table"""
+    with app.app_context():
+        try:
+            # Create the table
+            db.create_all()
+
+            inspector = db.inspect(db.engine)
+            if 'scheduled_jobs' not in inspector.get_table_names():
+                print("❌ Table 'scheduled_jobs' not found in database")
+                return False
+
+            print("✅ Table 'scheduled_jobs' verified in database")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error creating scheduled jobs table: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Creating scheduled jobs table...")
+
+    if create_scheduled_jobs_table():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add typed stock tracking columns to objects.
+track_stock, stock_quantity and reorder_threshold are backfilled from each object's
+JSON data; afterwards the model keeps them in sync whenever an object is saved.
+"""
+
+import sys
+from sqlalchemy import text
+from app import app, db
+from models import Object
+
+BATCH_SIZE = 1000
+
+def add_stock_fields():
+    """Add the stock columns and their partial index to objects, and backfill them"""
+    with app.app_context():
+        try:
+            db.session.execute(text(
+                "ALTER TABLE objects ADD COLUMN IF NOT EXISTS track_stock BOOLEAN NOT NULL DEFAULT FALSE"
+            ))
+            db.session.execute(text("ALTER TABLE objects ADD COLUMN IF NOT EXISTS stock_quantity DOUBLE PRECISION"))
+            db.session.execute(text("ALTER TABLE objects ADD COLUMN IF NOT EXISTS reorder_threshold DOUBLE PRECISION"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_objects_stock_tracked "
+                "ON objects (object_type, stock_quantity, reorder_threshold) WHERE track_stock"
+            ))
+            db.session.commit()
+            print("✅ Stock columns verified on objects")
+
+            # Backfill from the JSON data in batches
+            rows = db.session.execute(text(
+                "SELECT id, data->'track_stock', data->'quantity', data->'reorder_threshold' FROM objects"
+            )).all()
+
+            updates = [
+                {
+                    'object_id': object_id,
+                    'track_stock': bool(track_stock),
+                    'stock_quantity': Object.parse_stock_number(quantity),
+                    'reorder_threshold': Object.parse_stock_number(threshold)
+                }
+                for object_id, track_stock, quantity, threshold in rows
+            ]
+
+            for offset in range(0, len(updates), BATCH_SIZE):
+                db.session.execute(
+                    text("UPDATE objects SET track_stock = :track_stock, stock_quantity = :stock_quantity, "
+                         "reorder_threshold = :reorder_threshold WHERE id = :object_id"),
+                    updates[offset:offset + BATCH_SIZE]
+                )
+            db.session.commit()
+
+            tracked = sum(1 for u in updates if u['track_stock'])
+            print(f"✅ Backfilled {len(updates)} objects ({tracked} stock tracked)")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error adding stock fields: {str(e)}")
+            db.session.rollback()
+            return False
+
+def main():
+    """Main migration function"""
+    print("🔄 Adding typed stock fields to objects...")
+
+    if add_stock_fields():
+        print("\n✅ Migration completed successfully!")
+    else:
+        print("\n❌ Migration failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
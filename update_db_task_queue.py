@@ -0,0 +1,54 @@
+"""
+Migration script to prepare the task_queue table for concurrent workers.
+Adds the claim columns (locked_by, lease_expires_at) and the claim index.
+Tasks left in 'processing' by the old single processor get an expired lease,
+so the first worker to start reclaims them. Safe to re-run.
+"""
+import sys
+import logging
+from sqlalchemy import create_engine, text
+import os
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connect to the database
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    logger.error("DATABASE_URL environment variable is not set")
+    sys.exit(1)
+
+engine = create_engine(DATABASE_URL)
+
+STATEMENTS = [
+    "ALTER TABLE task_queue ADD COLUMN IF NOT EXISTS locked_by VARCHAR(100)",
+    "ALTER TABLE task_queue ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_task_queue_claim ON task_queue (status, priority, execute_at)",
+    # Orphaned claims from before leases existed
+    "UPDATE task_queue SET lease_expires_at = NOW() AT TIME ZONE 'utc' "
+    "WHERE status = 'processing' AND lease_expires_at IS NULL",
+]
+
+
+def update_schema():
+    """Apply the task queue worker columns and index"""
+    logger.info("Starting task queue schema update...")
+
+    try:
+        with engine.connect() as conn:
+            with conn.begin():
+                for statement in STATEMENTS:
+                    conn.execute(text(statement))
+
+        logger.info("Task queue schema update completed successfully!")
+        return True
+
+    except Exception as e:
+        logger.error(f"Task queue schema update failed: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    if not update_schema():
+        sys.exit(1)
@@ -0,0 +1,410 @@
+"""Vectorized depreciation and valuation engine for depreciable objects."""
+import logging
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import func
+
+from app import db
+from models import Object, AssetBookValue
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Object types that carry a depreciable acquisition cost
+DEPRECIABLE_TYPES = ('asset', 'component')
+
+# Default useful life (years) per depreciation category, see routes.get_depreciation_category
+CATEGORY_USEFUL_LIFE_YEARS = {
+    'technology': 5,
+    'office_equipment': 7,
+    'vehicles': 5,
+    'general': 7,
+}
+DEFAULT_USEFUL_LIFE_YEARS = 7
+
+STRAIGHT_LINE = 'straight_line'
+DECLINING_BALANCE = 'declining_balance'
+METHODS = (STRAIGHT_LINE, DECLINING_BALANCE)
+
+# Double-declining balance unless the object overrides it
+DEFAULT_DECLINING_FACTOR = 2.0
+
+# Rows per statement when persisting schedules
+PERSIST_BATCH_SIZE = 5000
+
+# Stored values closer than this to a recomputed one are left alone
+VALUE_TOLERANCE = 1e-6
+
+# end_month of an asset that has not been disposed of: valued indefinitely
+OPEN_END_MONTH = np.iinfo(np.int64).max
+
+
+class AssetArrays:
+    """Column-oriented view of every depreciable object, one array entry per object."""
+
+    def __init__(self, object_ids, cost, salvage, start_month, life_months, method, factor, category,
+                 end_month):
+        self.object_ids = object_ids        # int64
+        self.cost = cost                    # float64
+        self.salvage = salvage              # float64
+        self.start_month = start_month      # int64 months since 1970-01
+        self.life_months = life_months      # int64, always >= 1
+        self.end_month = end_month          # int64 disposal month, OPEN_END_MONTH while held
+        self.method = method                # int8 index into METHODS
+        self.factor = factor                # float64 declining-balance factor
+        self.category = category            # object array of category names
+
+    def __len__(self):
+        return len(self.object_ids)
+
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value) if value not in (None, '') else default
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_month_index(value):
+    """Convert a YYYY-MM-DD string (or date) into months since 1970-01, or None."""
+    if not value:
+        return None
+    try:
+        return int(np.datetime64(str(value)[:10], 'M').astype(np.int64))
+    except ValueError:
+        return None
+
+
+def month_index(value):
+    """Months since 1970-01 for a date/datetime."""
+    return (value.year - 1970) * 12 + (value.month - 1)
+
+
+def month_start(index):
+    """First day of the month for a month index."""
+    return date(1970 + index // 12, index % 12 + 1, 1)
+
+
+def _useful_life_months(useful_life_years, depreciation_period, category):
+    years = _to_float(useful_life_years)
+    if years > 0:
+        return int(round(years * 12))
+    months = _to_float(depreciation_period)
+    if months > 0:
+        return int(months)
+    return CATEGORY_USEFUL_LIFE_YEARS.get(category, DEFAULT_USEFUL_LIFE_YEARS) * 12
+
+
+def load_asset_arrays(object_ids=None):
+    """
+    Load cost, acquisition date and useful life of all depreciable objects into NumPy arrays.
+
+    Only the JSON fields needed for depreciation are selected, so full object rows are never
+    materialized. Objects without a positive acquisition cost or a parseable acquisition date
+    are skipped. An object is valued (at salvage once fully depreciated) for as long as it is
+    held: up to the month of its disposal_date, or indefinitely without one.
+
+    Args:
+        object_ids: Optional iterable restricting the load to specific objects
+
+    Returns:
+        AssetArrays: Column arrays for the depreciable objects
+    """
+    query = db.session.query(
+        Object.id,
+        Object.data['acquisition_cost'].astext,
+        Object.data['acquisition_date'].astext,
+        Object.data['useful_life_years'].astext,
+        Object.data['depreciation_period'].astext,
+        Object.data['depreciation_category'].astext,
+        Object.data['depreciation_method'].astext,
+        Object.data['declining_balance_factor'].astext,
+        Object.data['salvage_value'].astext,
+        Object.data['disposal_date'].astext,
+    ).filter(Object.object_type.in_(DEPRECIABLE_TYPES))
+
+    if object_ids is not None:
+        query = query.filter(Object.id.in_(list(object_ids)))
+
+    ids, cost, salvage, start, life, method, factor, category, end = [], [], [], [], [], [], [], [], []
+    skipped = 0
+
+    for (obj_id, raw_cost, raw_date, life_years, period, dep_category,
+         dep_method, dep_factor, raw_salvage, raw_disposal) in query.yield_per(1000):
+        acquisition_cost = _to_float(raw_cost)
+        start_month = _to_month_index(raw_date)
+        if acquisition_cost <= 0 or start_month is None:
+            skipped += 1
+            continue
+
+        dep_category = dep_category or 'general'
+        ids.append(obj_id)
+        cost.append(acquisition_cost)
+        salvage.append(min(max(_to_float(raw_salvage), 0.0), acquisition_cost))
+        disposal_month = _to_month_index(raw_disposal)
+        start.append(start_month)
+        life.append(max(1, _useful_life_months(life_years, period, dep_category)))
+        end.append(OPEN_END_MONTH if disposal_month is None else disposal_month)
+        method.append(METHODS.index(dep_method) if dep_method in METHODS else 0)
+        factor.append(_to_float(dep_factor, DEFAULT_DECLINING_FACTOR) or DEFAULT_DECLINING_FACTOR)
+        category.append(dep_category)
+
+    if skipped:
+        logger.debug(f"Skipped {skipped} objects without acquisition cost or date")
+
+    return AssetArrays(
+        object_ids=np.array(ids, dtype=np.int64),
+        cost=np.array(cost, dtype=np.float64),
+        salvage=np.array(salvage, dtype=np.float64),
+        start_month=np.array(start, dtype=np.int64),
+        life_months=np.array(life, dtype=np.int64),
+        method=np.array(method, dtype=np.int8),
+        factor=np.array(factor, dtype=np.float64),
+        category=np.array(category, dtype=object),
+        end_month=np.array(end, dtype=np.int64),
+    )
+
+
+def book_values(arrays, months):
+    """
+    Compute book values for every asset at one or more month indices.
+
+    Straight-line assets lose (cost - salvage) / life each month. Declining-balance assets
+    lose factor / life of their remaining value each month, never dropping below salvage,
+    and reach salvage at the end of their useful life.
+
+    Args:
+        arrays: AssetArrays from load_asset_arrays()
+        months: Scalar month index or 1-D array of month indices
+
+    Returns:
+        numpy.ndarray: Shape (len(arrays),) for a scalar month, otherwise (len(months), len(arrays)).
+            Entries are NaN where the asset was not yet acquired or was already disposed of.
+    """
+    months = np.asarray(months, dtype=np.int64)
+    as_of = months[..., np.newaxis] if months.ndim else months
+
+    elapsed = np.clip(as_of - arrays.start_month, 0, arrays.life_months).astype(np.float64)
+    life = arrays.life_months.astype(np.float64)
+
+    straight = arrays.cost - (arrays.cost - arrays.salvage) * (elapsed / life)
+
+    rate = np.minimum(arrays.factor / life, 1.0)
+    declining = np.maximum(arrays.cost * np.power(1.0 - rate, elapsed), arrays.salvage)
+    declining = np.where(elapsed >= life, arrays.salvage, declining)
+
+    values = np.where(arrays.method == METHODS.index(DECLINING_BALANCE), declining, straight)
+    return np.where((as_of < arrays.start_month) | (as_of > arrays.end_month), np.nan, values)
+
+
+def _row_changed(existing, cost, value, method, category):
+    """Whether a stored book value row differs from a freshly computed one"""
+    old_cost, old_value, old_method, old_category = existing
+    return (abs(old_cost - cost) > VALUE_TOLERANCE or abs(old_value - value) > VALUE_TOLERANCE
+            or old_method != method or old_category != category)
+
+
+def persist_book_values(start=None, end=None, months_ahead=12, commit=True):
+    """
+    Compute the monthly schedule of every depreciable object and store it in asset_book_values.
+
+    The whole (months x assets) matrix is computed in a single NumPy pass and compared with
+    the rows already stored for the window. Only new and changed periods are written, and rows
+    that no longer apply (after an object's disposal, or for objects that are no longer
+    depreciable) are deleted, so a monthly refresh mostly adds the new month.
+
+    Args:
+        start: First month to persist (date). Defaults to the earliest acquisition month.
+        end: Last month to persist (date). Defaults to the current month plus months_ahead.
+        months_ahead: Future months to project when end is not given
+        commit: Commit the transaction (False lets a caller batch more work into it)
+
+    Returns:
+        dict: Summary with asset count, month range and rows inserted, updated, unchanged
+              and deleted
+    """
+    # Taken before the objects are read, so edits made during the run count as newer
+    now = datetime.utcnow()
+    arrays = load_asset_arrays()
+    if len(arrays):
+        start_index = month_index(start) if start else int(arrays.start_month.min())
+        end_index = month_index(end) if end else month_index(datetime.utcnow()) + months_ahead
+    elif start and end:
+        start_index, end_index = month_index(start), month_index(end)
+    else:
+        # Nothing to value; clear whatever is stored
+        start_index = end_index = None
+    if start_index is not None and end_index < start_index:
+        raise ValueError("end must not be before start")
+
+    table = AssetBookValue.__table__
+    stored = db.session.query(
+        table.c.id, table.c.object_id, table.c.period, table.c.acquisition_cost,
+        table.c.book_value, table.c.depreciation_method, table.c.depreciation_category
+    )
+    if start_index is not None:
+        stored = stored.filter(table.c.period.between(month_start(start_index), month_start(end_index)))
+    existing = {
+        (obj_id, period): (row_id, (cost, value, method, category))
+        for row_id, obj_id, period, cost, value, method, category in stored.yield_per(PERSIST_BATCH_SIZE)
+    }
+
+    inserts, updates = [], []
+    unchanged = 0
+    if len(arrays):
+        month_indices = np.arange(start_index, end_index + 1, dtype=np.int64)
+        matrix = book_values(arrays, month_indices)
+        month_pos, asset_pos = np.nonzero(~np.isnan(matrix))
+
+        periods = [month_start(int(m)) for m in month_indices]
+        values = matrix[month_pos, asset_pos]
+        costs = arrays.cost[asset_pos]
+
+        for obj_id, m, c, v, k, cat in zip(
+            arrays.object_ids[asset_pos].tolist(), month_pos.tolist(), costs.tolist(),
+            values.tolist(), arrays.method[asset_pos].tolist(), arrays.category[asset_pos].tolist()
+        ):
+            row = {
+                'object_id': obj_id,
+                'period': periods[m],
+                'acquisition_cost': c,
+                'book_value': v,
+                'accumulated_depreciation': c - v,
+                'depreciation_method': METHODS[k],
+                'depreciation_category': cat,
+                'computed_at': now,
+            }
+            current = existing.pop((obj_id, periods[m]), None)
+            if current is None:
+                inserts.append(row)
+            elif _row_changed(current[1], c, v, METHODS[k], cat):
+                updates.append({'id': current[0], **row})
+            else:
+                unchanged += 1
+
+    # Whatever is left in the window is no longer valued
+    stale_ids = [row_id for row_id, _ in existing.values()]
+
+    for offset in range(0, len(stale_ids), PERSIST_BATCH_SIZE):
+        db.session.execute(table.delete().where(table.c.id.in_(stale_ids[offset:offset + PERSIST_BATCH_SIZE])))
+    for offset in range(0, len(updates), PERSIST_BATCH_SIZE):
+        db.session.execute(db.update(AssetBookValue), updates[offset:offset + PERSIST_BATCH_SIZE])
+    for offset in range(0, len(inserts), PERSIST_BATCH_SIZE):
+        db.session.execute(table.insert(), inserts[offset:offset + PERSIST_BATCH_SIZE])
+
+    # Rows of objects edited since they were computed are current again, changed or not
+    refreshed = db.session.execute(
+        table.update().where(
+            table.c.object_id == Object.id,
+            Object.updated_at > table.c.computed_at,
+            *([table.c.period.between(month_start(start_index), month_start(end_index))]
+              if start_index is not None else [])
+        ).values(computed_at=now)
+    ).rowcount
+
+    if commit:
+        db.session.commit()
+
+    window = (f"{month_start(start_index)} to {month_start(end_index)}"
+              if start_index is not None else "all periods")
+    logger.info(f"Book values for {len(arrays)} assets ({window}): {len(inserts)} inserted, "
+                f"{len(updates)} updated, {unchanged} unchanged ({refreshed} re-stamped), "
+                f"{len(stale_ids)} deleted")
+
+    return {
+        'assets': len(arrays),
+        'rows_written': len(inserts) + len(updates),
+        'rows_inserted': len(inserts),
+        'rows_updated': len(updates),
+        'rows_unchanged': unchanged,
+        'rows_deleted': len(stale_ids),
+        'start': month_start(start_index).isoformat() if start_index is not None else None,
+        'end': month_start(end_index).isoformat() if start_index is not None else None,
+    }
+
+
+def _snapshots_fresh(period):
+    """
+    Whether the persisted rows for a period still reflect the objects.
+
+    Snapshots are only rebuilt by the asset_valuation job, so they are trusted only when no
+    depreciable object (and no object valued in the period) was added or edited after the
+    period's rows were last computed. Deleted objects take their rows with them, and
+    persist_book_values re-stamps the rows of edited objects whose values did not change.
+    """
+    computed_at = db.session.query(func.max(AssetBookValue.computed_at)).filter(
+        AssetBookValue.period == period
+    ).scalar()
+    valued_ids = db.session.query(AssetBookValue.object_id).filter(AssetBookValue.period == period)
+    changed_at = db.session.query(func.max(Object.updated_at)).filter(
+        db.or_(Object.object_type.in_(DEPRECIABLE_TYPES), Object.id.in_(valued_ids))
+    ).scalar()
+    return computed_at is not None and (changed_at is None or changed_at <= computed_at)
+
+
+def portfolio_value(as_of=None):
+    """
+    Portfolio book value for the month containing as_of.
+
+    The current and future months are always computed in memory with one vectorized pass, so
+    they reflect objects added or edited since the last asset_valuation run. Past months use
+    the persisted monthly snapshots when they have been materialized and are still fresh (see
+    _snapshots_fresh), and are computed the same way otherwise.
+
+    Args:
+        as_of: date or datetime, defaults to today
+
+    Returns:
+        dict: Totals and per-category breakdown for the month
+    """
+    as_of = as_of or datetime.utcnow().date()
+    period = month_start(month_index(as_of))
+
+    rows = []
+    if month_index(period) < month_index(datetime.utcnow()) and _snapshots_fresh(period):
+        rows = db.session.query(
+            AssetBookValue.depreciation_category,
+            func.count(AssetBookValue.id),
+            func.sum(AssetBookValue.acquisition_cost),
+            func.sum(AssetBookValue.book_value),
+        ).filter(
+            AssetBookValue.period == period
+        ).group_by(AssetBookValue.depreciation_category).all()
+
+    if rows:
+        source = 'persisted'
+        by_category = {
+            category or 'general': {
+                'asset_count': count,
+                'acquisition_cost': float(cost or 0),
+                'book_value': float(value or 0),
+            }
+            for category, count, cost, value in rows
+        }
+    else:
+        source = 'computed'
+        arrays = load_asset_arrays()
+        values = book_values(arrays, month_index(period)) if len(arrays) else np.array([])
+        acquired = ~np.isnan(values)
+        by_category = {}
+        for category in np.unique(arrays.category[acquired]) if acquired.any() else []:
+            mask = acquired & (arrays.category == category)
+            by_category[category] = {
+                'asset_count': int(mask.sum()),
+                'acquisition_cost': float(arrays.cost[mask].sum()),
+                'book_value': float(values[mask].sum()),
+            }
+
+    total_cost = sum(c['acquisition_cost'] for c in by_category.values())
+    total_value = sum(c['book_value'] for c in by_category.values())
+
+    return {
+        'period': period.isoformat(),
+        'source': source,
+        'asset_count': sum(c['asset_count'] for c in by_category.values()),
+        'acquisition_cost': round(total_cost, 2),
+        'book_value': round(total_value, 2),
+        'accumulated_depreciation': round(total_cost - total_value, 2),
+        'by_category': by_category,
+    }
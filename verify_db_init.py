@@ -52,7 +52,8 @@ def verify_database_initialization():
                 'calendar_events',
                 'collection_objects',
                 'collections',
-                'receipt_creation_tracking'  # Our new table
+                'receipt_creation_tracking',
+                'asset_book_values'
             }
             
             print(f"\n📋 Database contains {len(tables)} tables:")